@@ -0,0 +1,568 @@
+"""A local, in-memory stand-in for the subset of the Drive v3 HTTP API used by
+GoogleDriveAPI, with injectable latency. It is meant for benchmarks, not as a
+faithful emulation of Drive: only the query syntax and fields used by the
+library are understood.
+
+Usage:
+    server = FakeDrive(latency = 0.02)
+    server.start()
+    api.service = server.build_service()
+    ...
+    print(server.requests)
+    server.stop()
+
+To keep the memory used by the server out of the measures of the client, run it
+in another process with FakeDriveProcess (see run_bench.py).
+"""
+
+import re
+import json
+import uuid
+import time
+import hashlib
+import threading
+import multiprocessing
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FOLDER = 'application/vnd.google-apps.folder'
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + 'Z'
+
+# ---------------------------------------------------------------------------
+# query language:  name='a' and 'id' in parents and (mimeType!='x' or ...)
+# ---------------------------------------------------------------------------
+_TOKEN = re.compile(r"\s*(?:(?P<str>'(?:[^'\\]|\\.)*')|(?P<op>!=|=|<=|>=|<|>|\(|\))|(?P<word>[A-Za-z_][A-Za-z0-9_.]*))")
+
+def _tokenize(q):
+    tokens, pos = [], 0
+    q = q.strip()
+    while pos < len(q):
+        m = _TOKEN.match(q, pos)
+        if not m:
+            raise ValueError(f"Invalid query near: {q[pos:]!r}")
+        pos = m.end()
+        if m.group('str') is not None:
+            tokens.append(('str', re.sub(r"\\(.)", r"\1", m.group('str')[1:-1])))
+        elif m.group('op') is not None:
+            tokens.append(('op', m.group('op')))
+        else:
+            tokens.append(('word', m.group('word')))
+    return tokens
+
+class _Parser(object):
+    def __init__(self, q):
+        self.tokens = _tokenize(q)
+        self.i = 0
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else (None, None)
+
+    def take(self):
+        t = self.peek()
+        self.i += 1
+        return t
+
+    def parse(self):
+        f = self.expr()
+        if self.i != len(self.tokens):
+            raise ValueError("Trailing tokens in query")
+        return f
+
+    def expr(self):
+        terms = [self.term()]
+        while self.peek() == ('word', 'or'):
+            self.take()
+            terms.append(self.term())
+        return lambda f: any(t(f) for t in terms)
+
+    def term(self):
+        factors = [self.factor()]
+        while self.peek() == ('word', 'and'):
+            self.take()
+            factors.append(self.factor())
+        return lambda f: all(x(f) for x in factors)
+
+    def factor(self):
+        kind, val = self.peek()
+        if (kind, val) == ('word', 'not'):
+            self.take()
+            g = self.factor()
+            return lambda f: not g(f)
+        if (kind, val) == ('op', '('):
+            self.take()
+            g = self.expr()
+            self.take()
+            return g
+        if kind == 'str':
+            self.take()
+            if self.take() != ('word', 'in'): raise ValueError("expected 'in'")
+            _, field = self.take()
+            return lambda f: val in f.get(field, [])
+        _, field = self.take()
+        _, op = self.take()
+        _, value = self.take()
+        if value in ('true', 'false'): value = (value == 'true')
+        if op == '=':  return lambda f: f.get(field, False if isinstance(value, bool) else None) == value
+        if op == '!=': return lambda f: f.get(field) != value
+        raise ValueError(f"Unsupported operator {op}")
+
+# ---------------------------------------------------------------------------
+# fields masks:  nextPageToken, files(id, name)
+# ---------------------------------------------------------------------------
+def _parse_fields(fields):
+    out, depth, cur = {}, 0, ''
+    for ch in (fields or '') + ',':
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            cur = cur.strip()
+            if cur:
+                if '(' in cur:
+                    name, sub = cur.split('(', 1)
+                    out[name.strip()] = _parse_fields(sub[:-1])
+                else:
+                    out[cur] = None
+            cur = ''
+        else:
+            cur += ch
+    return out
+
+def _mask(f, mask):
+    if not mask: return f
+    return {k: f[k] for k in mask if k in f}
+
+# "'<id>' in parents" as a conjunct of the query (always the case in GoogleDriveAPI),
+# used to look only at the children of that folder
+_IN_PARENTS = re.compile(r"^\s*'([^'\\]+)' in parents\s+and\s|\sand\s+'([^'\\]+)' in parents\s*$|^\s*'([^'\\]+)' in parents\s*$")
+
+def build_service(url, http = None):
+    """A googleapiclient service pointed to a FakeDrive server (no credentials)."""
+    from googleapiclient import discovery_cache
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import build_http
+    doc = json.loads(discovery_cache.get_static_doc('drive', 'v3'))
+    doc['rootUrl'] = url
+    doc['baseUrl'] = url + doc['servicePath']
+    return build_from_document(doc, http=http or build_http())
+
+class FakeDrive(object):
+    """The server, running in a thread of this process. Files are dicts as returned
+    by the API (all fields), kept in self.files by ID.
+    """
+
+    def __init__(self, latency = 0.0, host = '127.0.0.1', port = 0, store_content = True):
+        """@param latency       Float. Seconds added to each HTTP request.
+        @param store_content Bool. Keep the content of the files (else only their size and MD5).
+        """
+        self.latency  = latency
+        self.store_content = store_content
+        self.files    = {}
+        self.children = {}          # parent ID -> {child ID: None}, in creation order
+        self.content  = {}
+        self.drives   = {}
+        self.sessions = {}
+        self.requests = 0
+        self.lock     = threading.RLock()
+        self._put(self._new('My Drive', FOLDER, [], fid='root'))
+        self.server   = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread   = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def build_service(self, http = None):
+        """A googleapiclient service pointed to this server (no credentials)."""
+        return build_service(self.url, http)
+
+    # --- data helpers -----------------------------------------------------
+    def _new(self, name, mimeType, parents, fid=None, content=None, driveId=None):
+        now = _now()
+        f = {'kind': 'drive#file', 'id': fid or uuid.uuid4().hex[:20], 'name': name,
+             'mimeType': mimeType or 'application/octet-stream', 'parents': list(parents),
+             'createdTime': now, 'modifiedTime': now, 'version': '1', 'trashed': False}
+        if driveId: f['driveId'] = driveId
+        if content is not None and mimeType != FOLDER and not (mimeType or '').startswith('application/vnd.google-apps.'):
+            self._set_content(f, content)
+        return f
+
+    def _set_content(self, f, content):
+        f['size'] = str(len(content))
+        f['md5Checksum'] = hashlib.md5(content).hexdigest()
+        if self.store_content:
+            self.content[f['id']] = content
+
+    def _put(self, f):
+        self.files[f['id']] = f
+        for pid in f['parents']:
+            self.children.setdefault(pid, {})[f['id']] = None
+
+    def add(self, name, parent = 'root', mimeType = None, content = None, driveId = None):
+        """Populate the store directly (no request counted). Returns the new ID."""
+        with self.lock:
+            f = self._new(name, mimeType, [parent], content=content, driveId=driveId)
+            self._put(f)
+            return f['id']
+
+    def add_many(self, names, parent = 'root', mimeType = None, size = 0):
+        """Add many files (of <size> zero bytes) or folders into a folder. Returns their IDs."""
+        content = None if mimeType == FOLDER else b'\0' * size
+        return [self.add(name, parent, mimeType, content) for name in names]
+
+    def set_latency(self, latency = 0.0):
+        self.latency = latency
+
+    def add_drive(self, name):
+        with self.lock:
+            did = uuid.uuid4().hex[:16]
+            self.drives[did] = {'kind': 'drive#drive', 'id': did, 'name': name}
+            self._put(self._new(name, FOLDER, [], fid=did, driveId=did))
+            return did
+
+    # --- HTTP -------------------------------------------------------------
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True      # headers and body are written separately
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self):
+                n = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(n) if n else b''
+
+            def _serve(self, method):
+                with fake.lock:
+                    fake.requests += 1
+                if fake.latency: time.sleep(fake.latency)
+                body = self._body()
+                status, headers, payload = fake.dispatch(method, self.path, self.headers, body)
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):    self._serve('GET')
+            def do_POST(self):   self._serve('POST')
+            def do_PUT(self):    self._serve('PUT')
+            def do_PATCH(self):  self._serve('PATCH')
+            def do_DELETE(self): self._serve('DELETE')
+
+        return Handler
+
+    def _json(self, status, obj):
+        return status, {'Content-Type': 'application/json'}, json.dumps(obj).encode()
+
+    def _error(self, status, message):
+        return self._json(status, {'error': {'code': status, 'message': message,
+            'errors': [{'reason': 'notFound' if status == 404 else 'invalid', 'message': message}]}})
+
+    def dispatch(self, method, path, headers, body):
+        url = urlparse(path)
+        qs = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        p = url.path.rstrip('/')
+        try:
+            with self.lock:
+                if p.endswith('/batch/drive/v3') or p.endswith('/batch'):
+                    return self._batch(headers, body)
+                if p.endswith('/upload/drive/v3/files') or re.search(r'/upload/drive/v3/files/[^/]+$', p):
+                    return self._upload(method, p, qs, headers, body)
+                m = re.search(r'/drive/v3/drives$', p)
+                if m and method == 'GET':
+                    return self._list_drives(qs)
+                m = re.search(r'/drive/v3/files/([^/]+)/copy$', p)
+                if m and method == 'POST':
+                    return self._copy(m.group(1), qs, body)
+                m = re.search(r'/drive/v3/files/([^/]+)/export$', p)
+                if m and method == 'GET':
+                    return self._export(m.group(1), qs)
+                m = re.search(r'/drive/v3/files/([^/]+)$', p)
+                if m:
+                    fid = m.group(1)
+                    if method == 'GET':    return self._get(fid, qs)
+                    if method == 'PATCH':  return self._update(fid, qs, body)
+                    if method == 'DELETE': return self._delete(fid)
+                if p.endswith('/drive/v3/files'):
+                    if method == 'GET':  return self._list(qs)
+                    if method == 'POST': return self._create(qs, json.loads(body or b'{}'))
+        except ValueError as e:
+            return self._error(400, str(e))
+        return self._error(404, f"Unknown endpoint {method} {path}")
+
+    def _file(self, fid):
+        f = self.files.get(fid)
+        if f is None or f.get('trashed'):
+            return None
+        return f
+
+    def _list(self, qs):
+        q = qs.get('q') or 'trashed=false'
+        pred = _Parser(q).parse()
+        corpora, driveId = qs.get('corpora'), qs.get('driveId')
+        m = _IN_PARENTS.search(q)
+        if m:
+            candidates = (self.files[fid] for fid in self.children.get(next(filter(None, m.groups())), ()))
+        else:
+            candidates = self.files.values()
+        rows = [f for f in candidates if f['id'] != 'root' and f['id'] not in self.drives
+                and not f.get('trashed') and pred(f)]
+        if corpora == 'drive':
+            rows = [f for f in rows if f.get('driveId') == driveId]
+        elif qs.get('includeItemsFromAllDrives') != 'true':
+            rows = [f for f in rows if not f.get('driveId')]
+        start = int(qs.get('pageToken') or 0)
+        size = min(int(qs.get('pageSize') or 100), 1000)
+        page = rows[start:start + size]
+        mask = _parse_fields(qs.get('fields') or 'files(id,name,mimeType)')
+        out = {'kind': 'drive#fileList'}
+        if start + size < len(rows):
+            out['nextPageToken'] = str(start + size)
+        files_mask = mask.get('files')
+        out['files'] = [_mask(f, files_mask) for f in page]
+        if 'nextPageToken' not in mask and 'nextPageToken' in out and mask:
+            del out['nextPageToken']
+        return self._json(200, out)
+
+    def _list_drives(self, qs):
+        rows = list(self.drives.values())
+        q = qs.get('q')
+        if q:
+            pred = _Parser(q).parse()
+            rows = [d for d in rows if pred(d)]
+        return self._json(200, {'drives': rows})
+
+    def _get(self, fid, qs):
+        f = self._file(fid)
+        if f is None:
+            return self._error(404, f"File not found: {fid}.")
+        if qs.get('alt') == 'media':
+            return 200, {'Content-Type': 'application/octet-stream'}, self.content.get(fid, b'')
+        return self._json(200, _mask(f, _parse_fields(qs.get('fields') or 'id,name,mimeType,kind')))
+
+    def _export(self, fid, qs):
+        f = self._file(fid)
+        if f is None:
+            return self._error(404, f"File not found: {fid}.")
+        data = f"{f['name']} v{f['version']} as {qs.get('mimeType')}\n".encode() * 64
+        return 200, {'Content-Type': qs.get('mimeType', 'application/octet-stream')}, data
+
+    def _touch(self, f):
+        f['modifiedTime'] = _now()
+        f['version'] = str(int(f['version']) + 1)
+
+    def _create(self, qs, meta, content=None):
+        parents = meta.get('parents') or ['root']
+        for pid in parents:
+            if self._file(pid) is None:
+                return self._error(404, f"File not found: {pid}.")
+        driveId = self.files[parents[0]].get('driveId')
+        f = self._new(meta.get('name', 'Untitled'), meta.get('mimeType'), parents,
+            content=content if content is not None else (None if meta.get('mimeType') == FOLDER else b''),
+            driveId=driveId)
+        self._put(f)
+        return self._json(200, _mask(f, _parse_fields(qs.get('fields') or 'id,name,mimeType,kind')))
+
+    def _update(self, fid, qs, body, content=None):
+        f = self._file(fid)
+        if f is None:
+            return self._error(404, f"File not found: {fid}.")
+        meta = json.loads(body or b'{}') if content is None else body
+        if 'name' in meta: f['name'] = meta['name']
+        if 'trashed' in meta: f['trashed'] = bool(meta['trashed'])
+        for pid in filter(None, (qs.get('addParents') or '').split(',')):
+            if self._file(pid) is None:
+                return self._error(404, f"File not found: {pid}.")
+        for pid in filter(None, (qs.get('removeParents') or '').split(',')):
+            if pid in f['parents']:
+                f['parents'].remove(pid)
+                self.children.get(pid, {}).pop(fid, None)
+        for pid in filter(None, (qs.get('addParents') or '').split(',')):
+            if pid not in f['parents']:
+                f['parents'].append(pid)
+                self.children.setdefault(pid, {})[fid] = None
+        if content is not None:
+            self._set_content(f, content)
+        self._touch(f)
+        return self._json(200, _mask(f, _parse_fields(qs.get('fields') or 'id,name,mimeType,kind')))
+
+    def _delete(self, fid):
+        if self._file(fid) is None:
+            return self._error(404, f"File not found: {fid}.")
+        todo = [fid]
+        while todo:
+            cur = todo.pop()
+            f = self.files.pop(cur, None)
+            self.content.pop(cur, None)
+            for pid in (f['parents'] if f else []):
+                self.children.get(pid, {}).pop(cur, None)
+            todo.extend(self.children.pop(cur, {}))
+        return 204, {}, b''
+
+    def _copy(self, fid, qs, body):
+        f = self._file(fid)
+        if f is None:
+            return self._error(404, f"File not found: {fid}.")
+        meta = json.loads(body or b'{}')
+        new = dict(meta)
+        new.setdefault('name', 'Copy of ' + f['name'])
+        new.setdefault('mimeType', f['mimeType'])
+        new.setdefault('parents', list(f['parents']))
+        return self._create(qs, new, content=self.content.get(fid, b''))
+
+    # --- uploads ------------------------------------------------------------
+    def _upload(self, method, p, qs, headers, body):
+        m = re.search(r'/upload/drive/v3/files/([^/]+)$', p)
+        fid = m.group(1) if m else None
+        kind = qs.get('uploadType')
+        if kind == 'resumable' and 'upload_id' in qs:
+            return self._resumable_put(qs['upload_id'], headers, body)
+        if kind == 'resumable':
+            sid = uuid.uuid4().hex
+            self.sessions[sid] = {'meta': json.loads(body or b'{}'), 'qs': qs, 'fid': fid, 'data': b''}
+            loc = f"{self.url}upload/drive/v3/files?uploadType=resumable&upload_id={sid}"
+            return 200, {'Location': loc}, b''
+        if kind == 'multipart':
+            ctype = headers.get('Content-Type', '')
+            boundary = ctype.split('boundary=', 1)[1].strip('"')
+            parts = body.split(b'--' + boundary.encode())
+            meta, content = {}, b''
+            for i, part in enumerate(x for x in parts if x.strip() not in (b'', b'--')):
+                head, _, data = part.partition(b'\r\n\r\n')
+                if data.endswith(b'\r\n'): data = data[:-2]
+                if i == 0: meta = json.loads(data or b'{}')
+                else: content = data
+            return self._finish_upload(fid, meta, qs, content)
+        # simple / media
+        return self._finish_upload(fid, {}, qs, body)
+
+    def _resumable_put(self, sid, headers, body):
+        s = self.sessions.get(sid)
+        if s is None:
+            return self._error(404, "upload session not found")
+        s['data'] += body
+        rng = headers.get('Content-Range', '')
+        m = re.match(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)', rng)
+        total = m.group(3) if m else None
+        if not rng or (total and total != '*' and len(s['data']) >= int(total)):
+            # no Content-Range: the whole (possibly empty) content in a single request
+            del self.sessions[sid]
+            return self._finish_upload(s['fid'], s['meta'], s['qs'], s['data'])
+        hdr = {'Range': f"bytes=0-{len(s['data']) - 1}"} if s['data'] else {}
+        return 308, hdr, b''
+
+    def _finish_upload(self, fid, meta, qs, content):
+        if fid:
+            return self._update(fid, qs, meta, content=content)
+        return self._create(qs, meta, content=content)
+
+    # --- batch --------------------------------------------------------------
+    def _batch(self, headers, body):
+        ctype = headers.get('Content-Type', '')
+        boundary = ctype.split('boundary=', 1)[1].strip('"')
+        out_boundary = 'batch_' + uuid.uuid4().hex
+        out = []
+        for part in body.split(b'--' + boundary.encode()):
+            if part.strip() in (b'', b'--'): continue
+            # the client library separates the lines with '\n', not '\r\n'
+            part = part.replace(b'\r\n', b'\n').lstrip(b'\n')
+            head, _, inner = part.partition(b'\n\n')
+            cid = ''
+            for line in head.decode().split('\n'):
+                if line.lower().startswith('content-id:'):
+                    cid = line.split(':', 1)[1].strip()
+            req_head, _, req_body = inner.partition(b'\n\n')
+            lines = req_head.decode().split('\n')
+            method, path = lines[0].split(' ')[:2]
+            sub_headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    k, v = line.split(':', 1)
+                    sub_headers[k.strip()] = v.strip()
+            req_body = req_body.rstrip(b'\n')
+            # a batch counts as a single HTTP request
+            status, h, payload = self.dispatch(method, path, sub_headers, req_body)
+            resp = f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+            rid = cid.replace('<', '<response-', 1) if cid else ''
+            out.append(b'Content-Type: application/http\r\nContent-ID: ' + rid.encode() + b'\r\n\r\n' + resp)
+        payload = b''.join(b'--' + out_boundary.encode() + b'\r\n' + o + b'\r\n' for o in out) + b'--' + out_boundary.encode() + b'--'
+        return 200, {'Content-Type': f'multipart/mixed; boundary={out_boundary}'}, payload
+
+# ---------------------------------------------------------------------------
+# the server in another process
+# ---------------------------------------------------------------------------
+def _serve(conn, kwargs):
+    server = FakeDrive(**kwargs).start()
+    conn.send(server.url)
+    while True:
+        method, args = conn.recv()
+        if method == 'stop':
+            server.stop()
+            conn.send(None)
+            return
+        try:
+            if method == 'requests':
+                result = server.requests
+            else:
+                result = getattr(server, method)(*args)
+            conn.send((True, result))
+        except Exception as e:
+            conn.send((False, repr(e)))
+
+class FakeDriveProcess(object):
+    """A FakeDrive running in a child process, driven through a pipe. Example:
+        server = FakeDriveProcess(latency = 0.01)
+        folder = server.call('add', 'folder', 'root', FOLDER)
+        api.service = server.build_service()
+        ...
+        print(server.requests)
+        server.stop()
+    """
+
+    def __init__(self, **kwargs):
+        ctx = multiprocessing.get_context('spawn')
+        self._conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_serve, args=(child, kwargs), daemon=True)
+        self.process.start()
+        self.url = self._conn.recv()
+
+    def call(self, method, *args):
+        """Call a method of the FakeDrive (e.g. 'add', 'add_many', 'add_drive')"""
+        self._conn.send((method, args))
+        ok, result = self._conn.recv()
+        if not ok:
+            raise Exception(f"FakeDriveProcess.call: {method}: {result}")
+        return result
+
+    @property
+    def requests(self):
+        return self.call('requests')
+
+    def build_service(self, http = None):
+        return build_service(self.url, http)
+
+    def stop(self):
+        if self.process.is_alive():
+            self._conn.send(('stop', ()))
+            self._conn.recv()
+            self.process.join()
@@ -0,0 +1,281 @@
+"""Benchmarks of GoogleDriveAPI against FakeDrive (fake_drive.py), a local stand-in
+for the Drive v3 HTTP API with injectable latency.
+
+Each scenario is measured in wall time, number of HTTP requests received by the
+server, and peak memory allocated by Python in the client. As tracemalloc slows
+down the client, the memory is measured in a second run of the scenario (skip it
+with --no-memory). The server runs in another process, so it is not part of the
+measures.
+
+Usage:
+    python bench/run_bench.py                                   # all the scenarios, full size
+    python bench/run_bench.py --scale 0.1 --latency 0.002 -o bench_output.json
+    python bench/run_bench.py --scale 0.1 --baseline bench/baseline.json
+    python bench/run_bench.py --only deep_path,list_folder
+
+With --baseline, the results are compared to a previous output (made with the same
+--scale and --latency), and the exit status is 1 if some scenario regressed: more
+requests than the baseline. The request counts are deterministic, the timings are
+not (they depend on the machine and its load), so the wall time and peak memory are
+only checked with --check-time: a regression is then more than --threshold (default
+25%) over the baseline. For that, use a fixed --latency (so the time is dominated by
+the round trips, not by the noise) and --repeat (the best of N runs is kept), e.g.:
+
+    python bench/run_bench.py --scale 0.1 --latency 0.005 --repeat 3 -o base.json
+    python bench/run_bench.py --scale 0.1 --latency 0.005 --repeat 3 --baseline base.json --check-time
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'py'))
+from fake_drive import FakeDriveProcess, FOLDER
+
+# metrics compared with the baseline, and how
+METRICS = {
+    'requests':    'exact',         # deterministic: any increase is a regression
+    'wall_time':   'threshold',     # only with --check-time
+    'peak_memory': 'threshold',     # only with --check-time
+}
+
+class Scenario(object):
+    """A benchmark. setup() prepares the server and the local files (not measured),
+    then run(api) is measured.
+    """
+    name = ''
+    description = ''
+
+    def __init__(self, scale = 1.0, workdir = ''):
+        self.scale = scale
+        self.workdir = workdir
+
+    def n(self, count):
+        """A count scaled by --scale (at least 1)"""
+        return max(1, int(count * self.scale))
+
+    def setup(self, server):
+        pass
+
+    def run(self, api):
+        raise NotImplementedError
+
+def _make_files(path, count, size, dirs = 1):
+    """<count> local files of <size> bytes (sparse), spread in <dirs> sub-directories"""
+    for d in range(dirs):
+        os.makedirs(f"{path}/d{d:03d}", exist_ok=True)
+    for i in range(count):
+        with open(f"{path}/d{i % dirs:03d}/f{i:06d}.dat", 'wb') as f:
+            f.truncate(size)
+
+class DeepPath(Scenario):
+    name = 'deep_path'
+    description = 'getFileId() of 20 files at depth 30'
+    depth = 30
+
+    def setup(self, server):
+        parent = 'root'
+        names = []
+        for i in range(self.depth - 1):
+            parent = server.call('add', f"level{i:02d}", parent, FOLDER)
+            names.append(f"level{i:02d}")
+        server.call('add_many', [f"f{i}.txt" for i in range(20)], parent, None, 10)
+        self.paths = ['/' + '/'.join(names) + f"/f{i}.txt" for i in range(20)]
+
+    def run(self, api):
+        for path in self.paths:
+            if not api.getFileId(path):
+                raise Exception(f"not found: {path}")
+
+class ListFolder(Scenario):
+    name = 'list_folder'
+    description = 'list_directory() of a folder with 100k children'
+
+    def setup(self, server):
+        self.count = self.n(100000)
+        folder = server.call('add', 'big', 'root', FOLDER)
+        server.call('add_many', [f"f{i:06d}.txt" for i in range(self.count)], folder, None, 10)
+
+    def run(self, api):
+        files = api.list_directory('/big')
+        if len(files) != self.count:
+            raise Exception(f"{len(files)} files listed, expected {self.count}")
+
+class SyncSmall(Scenario):
+    name = 'sync_small'
+    description = 'sync() of 10k small files (100 folders) into an empty folder'
+
+    def setup(self, server):
+        self.local = self.workdir + '/small'
+        _make_files(self.local, self.n(10000), 1024, dirs = 100)
+
+    def run(self, api):
+        api.sync(self.local, '/small')
+
+class SyncLarge(Scenario):
+    name = 'sync_large'
+    description = 'sync() of 10 large files (64 MB) into an empty folder'
+
+    def setup(self, server):
+        self.local = self.workdir + '/large'
+        _make_files(self.local, 10, self.n(64 * 1024 * 1024))
+
+    def run(self, api):
+        api.sync(self.local, '/large')
+
+class Resync(Scenario):
+    name = 'resync_unchanged'
+    description = 'sync() again of the 10k small files, nothing changed'
+
+    def setup(self, server):
+        self.local = self.workdir + '/small'
+        if not os.path.isdir(self.local):
+            _make_files(self.local, self.n(10000), 1024, dirs = 100)
+        # the first sync is not measured
+        api = new_api(server)
+        with _quiet():
+            api.sync(self.local, '/small')
+
+    def run(self, api):
+        api.sync(self.local, '/small')
+
+SCENARIOS = [DeepPath, ListFolder, SyncSmall, SyncLarge, Resync]
+
+class _quiet(object):
+    """Silence the progress messages printed by the API"""
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        return False
+
+def new_api(server):
+    from google_drive_api import GoogleDriveAPI
+    api = GoogleDriveAPI()
+    api.service = server.build_service()
+    return api
+
+def run_scenario(cls, scale = 1.0, latency = 0.0, memory = False):
+    """Run a scenario against a new server.
+    @param memory Bool. Trace the memory allocations (slower).
+    @return Dict. {'wall_time': seconds, 'requests': n}, plus 'peak_memory' (bytes) if memory.
+    """
+    workdir = tempfile.mkdtemp(prefix='gdrive_bench_')
+    server = FakeDriveProcess(store_content = False)
+    try:
+        scenario = cls(scale = scale, workdir = workdir)
+        scenario.setup(server)
+        api = new_api(server)
+        server.call('set_latency', latency)
+        requests = server.requests
+
+        if memory: tracemalloc.start()
+        t0 = time.perf_counter()
+        with _quiet():
+            scenario.run(api)
+        wall_time = time.perf_counter() - t0
+        result = {'wall_time': round(wall_time, 4), 'requests': server.requests - requests}
+        if memory:
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return result
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def compare(results, baseline, threshold = 0.25, check_time = False):
+    """Compare the results with a baseline, made with the same scale and latency.
+    @param check_time Bool. Compare also the wall time and peak memory (see --check-time).
+    @return List of strings, describing each regression.
+    """
+    regressions = []
+    for option in ('scale', 'latency'):
+        if baseline.get('meta', {}).get(option) != results['meta'][option]:
+            regressions.append(f"the baseline was made with --{option} {baseline.get('meta', {}).get(option)}")
+    if regressions:
+        return regressions
+    for name, result in results['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if not old: continue
+        for metric, how in METRICS.items():
+            if metric not in old or metric not in result: continue
+            if how == 'threshold' and not check_time: continue
+            new, ref = result[metric], old[metric]
+            if how == 'exact' and new > ref:
+                regressions.append(f"{name}: {metric} {ref} -> {new}")
+            elif how == 'threshold' and new > ref * (1 + threshold):
+                regressions.append(f"{name}: {metric} {ref} -> {new} (+{100 * (new / ref - 1):.0f}%)")
+    return regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Benchmarks of GoogleDriveAPI against a fake Drive server')
+    parser.add_argument('--scale', type=float, default=1.0, help='scale of the scenarios (number of files, sizes)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to each request by the server')
+    parser.add_argument('--only', default='', help='comma separated names of the scenarios to run')
+    parser.add_argument('-o', '--output', default='', help='write the results (JSON) into this file')
+    parser.add_argument('--baseline', default='', help='compare with the results (JSON) in this file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed increase of time and memory')
+    parser.add_argument('--check-time', action='store_true', help='compare also the wall time and peak memory')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of each scenario, the best time is kept')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    args = parser.parse_args(argv)
+
+    only = [name for name in args.only.split(',') if name]
+    scenarios = [cls for cls in SCENARIOS if not only or cls.name in only]
+    if only and len(scenarios) != len(only):
+        parser.error(f"unknown scenario, expected some of: {', '.join(cls.name for cls in SCENARIOS)}")
+
+    results = {
+        'meta': {
+            'date':     datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python':   platform.python_version(),
+            'platform': platform.platform(),
+            'scale':    args.scale,
+            'latency':  args.latency,
+            'repeat':   args.repeat,
+        },
+        'results': {},
+    }
+    for cls in scenarios:
+        print(f"{cls.name}: {cls.description} (scale {args.scale}) ...", flush=True)
+        result = run_scenario(cls, scale = args.scale, latency = args.latency)
+        for _ in range(args.repeat - 1):
+            again = run_scenario(cls, scale = args.scale, latency = args.latency)
+            result['wall_time'] = min(result['wall_time'], again['wall_time'])
+        message = f"   {result['wall_time']:.3f} s, {result['requests']} requests"
+        if not args.no_memory:
+            result['peak_memory'] = run_scenario(cls, scale = args.scale, latency = args.latency, 
+                memory = True)['peak_memory']
+            message += f", {result['peak_memory'] / 1024**2:.1f} MB peak"
+        results['results'][cls.name] = result
+        print(message, flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, threshold = args.threshold, check_time = args.check_time)
+        for regression in regressions:
+            print(f"!! regression: {regression}")
+        if regressions:
+            return 1
+        print("no regressions")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Bandwidth shaping for the transfers of GoogleDriveAPI.
+
+A single BandwidthLimiter is shared by all the transfers (uploads and downloads,
+in any thread). Before sending (or after receiving) each chunk, the transfer
+draws its bytes from the limiter, which enforces:
+
+  - a global rate (bytes/sec), that can be changed at runtime, or follow a
+    time-of-day schedule;
+  - a per-transfer cap (bytes/sec);
+  - weighted fair sharing between the transfers waiting for bandwidth: chunks
+    are served in order of their virtual finish time (as in Weighted Fair
+    Queueing), so a transfer gets a share of the rate proportional to its
+    weight, and a huge file cannot starve many small ones.
+"""
+
+import time
+import heapq
+import itertools
+import threading
+from datetime import datetime
+
+class Transfer(object):
+    """A transfer drawing bandwidth from a BandwidthLimiter. Use it as a context manager:
+        with limiter.transfer() as t:
+            for chunk in chunks:
+                t.consume(len(chunk))
+                send(chunk)
+    """
+
+    def __init__(self, limiter, weight = 1.0, cap = 0):
+        self.limiter = limiter
+        self.weight  = float(weight) if weight > 0 else 1.0
+        self.cap     = cap          # bytes/sec, 0 = only the per-transfer cap of the limiter
+        self.finish  = 0.0          # virtual finish time of the last chunk
+        self._ready  = 0.0          # monotonic time when the next chunk is allowed by the cap
+
+    def consume(self, nbytes):
+        """Block until nbytes can be transferred"""
+        if nbytes <= 0: return
+        cap = self.cap or self.limiter.per_transfer
+        if cap:
+            delay = self._ready - time.monotonic()
+            if delay > 0: time.sleep(delay)
+        self.limiter._acquire(self, nbytes)
+        if cap:
+            self._ready = max(time.monotonic(), self._ready) + nbytes / cap
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+class BandwidthLimiter(object):
+    """Example:
+        limiter = BandwidthLimiter(rate = 2 * 1024**2,                # 2 MB/s
+            per_transfer = 512 * 1024,                                # 512 KB/s per file
+            schedule = [('09:00', '18:00', 1024**2)])                 # 1 MB/s in business hours
+        api.bandwidth = limiter
+        ...
+        limiter.set_rate(0)                                           # no limit from now on
+    """
+
+    def __init__(self, rate = 0, per_transfer = 0, schedule = None, burst = 1.0):
+        """@param rate         Int. Global limit in bytes/sec. 0 = unlimited.
+        @param per_transfer Int. Limit of each transfer in bytes/sec. 0 = unlimited.
+        @param schedule     (optional) List of tuples (start, end, rate), with start and end
+                            as 'HH:MM' (local time). Within that window, rate replaces the
+                            global rate. Windows can cross midnight, e.g. ('22:00', '06:00', 0).
+        @param burst        Float. Seconds of the global rate that can be accumulated while idle.
+        """
+        self.name         = "BandwidthLimiter"
+        self._cond        = threading.Condition()
+        self._waiting     = []          # heap of (virtual finish time, sequence)
+        self._seq         = itertools.count()
+        self._vtime       = 0.0         # virtual time: finish time of the last chunk served
+        self._tokens      = 0.0
+        self._last        = time.monotonic()
+        self.burst        = burst
+        self.rate         = rate
+        self.per_transfer = per_transfer
+        self.schedule     = []
+        self.set_schedule(schedule or [])
+
+    def set_rate(self, rate = 0):
+        """Change the global rate (bytes/sec, 0 = unlimited) at runtime"""
+        with self._cond:
+            self.rate = rate
+            self._cond.notify_all()
+
+    def set_per_transfer(self, rate = 0):
+        """Change the per-transfer cap (bytes/sec, 0 = unlimited) at runtime"""
+        with self._cond:
+            self.per_transfer = rate
+            self._cond.notify_all()
+
+    def set_schedule(self, schedule = []):
+        """Change the time-of-day schedule, see __init__()"""
+        parsed = []
+        for start, end, rate in schedule:
+            parsed.append((self._minutes(start), self._minutes(end), rate))
+        with self._cond:
+            self.schedule = parsed
+            self._cond.notify_all()
+
+    def _minutes(self, hhmm):
+        try:
+            h, m = hhmm.split(':')
+            return int(h) * 60 + int(m)
+        except (ValueError, AttributeError):
+            raise Exception(f"{self.name}: Invalid time '{hhmm}', expected 'HH:MM'")
+
+    def current_rate(self):
+        """The global rate in effect now, considering the schedule"""
+        if self.schedule:
+            now = datetime.now()
+            minute = now.hour * 60 + now.minute
+            for start, end, rate in self.schedule:
+                if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+                    return rate
+        return self.rate
+
+    def transfer(self, weight = 1.0, cap = 0):
+        """A new Transfer drawing from this limiter.
+        @param weight Float. Share of the bandwidth relative to the other transfers.
+        @param cap    Int. Limit of this transfer in bytes/sec (0 = the per_transfer of the limiter).
+        """
+        return Transfer(self, weight, cap)
+
+    def _acquire(self, transfer, nbytes):
+        with self._cond:
+            tag = max(self._vtime, transfer.finish) + nbytes / transfer.weight
+            transfer.finish = tag
+            ticket = (tag, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            served = False
+            try:
+                while True:
+                    rate = self.current_rate()
+                    if self._waiting[0] != ticket:
+                        # another chunk goes first, it will wake us up
+                        self._cond.wait(1.0)
+                        continue
+                    if rate <= 0:
+                        break
+                    now = time.monotonic()
+                    self._tokens = min(self._tokens + (now - self._last) * rate, rate * self.burst)
+                    self._last = now
+                    # chunks larger than the burst may borrow (tokens go negative)
+                    need = min(nbytes, rate * self.burst)
+                    if self._tokens >= need:
+                        self._tokens -= nbytes
+                        break
+                    self._cond.wait((need - self._tokens) / rate)
+                served = True
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                if served:
+                    # the virtual time advances to the finish time of the chunk in service
+                    self._vtime = max(self._vtime, tag)
+                self._cond.notify_all()
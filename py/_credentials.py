@@ -0,0 +1,216 @@
+"""OAuth credentials of GoogleDriveAPI kept valid for long running jobs.
+
+The access token of the user credentials lasts about one hour. CredentialsManager:
+
+  - refreshes it in a background thread a few minutes before it expires (REFRESH_MARGIN),
+    so the transfers in progress do not hit a 401 in the middle;
+  - serializes the refreshes behind a lock: when many threads need a new token at the
+    same time (e.g. after a 401), only one refresh is made and the other ones use it;
+  - writes the token file atomically (a temporary file renamed over it), under an
+    exclusive lock of the file <token_file>.lock, so several processes sharing the same
+    token file do not corrupt it. A process about to refresh first reads the file: if
+    another process already refreshed the token, it takes that one instead.
+
+The inter-process locking uses fcntl.flock(), so it is only available on Unix.
+"""
+
+import os
+import time
+import json
+import tempfile
+import threading
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None        # not Unix: no locking between processes
+
+# seconds before the expiry, when the token is refreshed
+REFRESH_MARGIN = 300
+
+# a token refreshed this recently (seconds) is not refreshed again after a 401: the 401s
+# of the requests sent with the previous token, by several threads, take a single refresh
+REFRESH_COALESCE = 10
+
+def _utcnow():
+    # google-auth keeps the expiry as a naive UTC datetime
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class TokenFile(object):
+    """The token file (JSON) of the user credentials, shared by several processes"""
+
+    def __init__(self, path = ''):
+        self.name = "TokenFile"
+        self.path = path
+
+    @contextmanager
+    def lock(self):
+        """Exclusive lock between processes (a no-op without fcntl, or without a path)"""
+        if not self.path or fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def read(self):
+        """@return Dict. The content of the file, or None if it does not exist (or is not valid)."""
+        if not self.path: return None
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, content = ''):
+        """Replace the content of the file atomically (readable only by the user)"""
+        if not self.path: return
+        folder = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix='.token_', dir=folder)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+class ManagedCredentials(Credentials):
+    """User credentials whose refreshes (also the ones made by the HTTP transport, before
+    a request or after a 401) go through a CredentialsManager.
+    Load them as the base class, e.g. ManagedCredentials.from_authorized_user_file(path, scopes).
+    """
+    _manager = None
+
+    def refresh(self, request):
+        if self._manager is None:
+            return super().refresh(request)
+        self._manager.refresh(force = True, request = request)
+
+    def _refresh_now(self, request):
+        super().refresh(request)
+
+class CredentialsManager(object):
+    """Example:
+        creds = ManagedCredentials.from_authorized_user_file('token.json', SCOPES)
+        manager = CredentialsManager(creds, 'token.json')
+        manager.refresh()           # only if it expires within REFRESH_MARGIN
+        manager.start()             # from now on, refreshed in the background
+        ...
+        manager.stop()
+    """
+
+    def __init__(self, creds, token_file = '', margin = REFRESH_MARGIN):
+        """@param creds ManagedCredentials. The credentials (with a refresh token).
+        @param token_file (optional) String. The file where the token is persisted.
+        @param margin Int. Seconds before the expiry, when the token is refreshed.
+        """
+        self.name       = "CredentialsManager"
+        self.creds      = creds
+        self.token_file = TokenFile(token_file)
+        self.margin     = margin
+        self.refreshes  = 0         # refreshes made by this process
+        self._lock      = threading.Lock()
+        self._wakeup    = threading.Condition(self._lock)
+        self._stopped   = True
+        self._thread    = None
+        self._refreshed = 0.0       # monotonic time of the last refresh (or token taken from the file)
+        creds._manager  = self
+
+    def _expires_in(self):
+        """Seconds until the expiry of the token (None if unknown)"""
+        if not self.creds.expiry: return None
+        return (self.creds.expiry - _utcnow()).total_seconds()
+
+    def _fresh(self):
+        expires_in = self._expires_in()
+        return bool(self.creds.token) and (expires_in is None or expires_in > self.margin)
+
+    def refresh(self, force = False, request = None):
+        """Refresh the token if it expires within the margin (or always, with force: e.g. it
+        was rejected). Thread-safe: concurrent calls make a single refresh.
+        @return Bool. Whether the token changed.
+        """
+        with self._lock:
+            if not force and self._fresh():
+                return False
+            if force and time.monotonic() - self._refreshed < REFRESH_COALESCE and self.creds.valid:
+                # just refreshed by another thread
+                return False
+            with self.token_file.lock():
+                # another process sharing the token file may have refreshed it already
+                if not self._take_from_file():
+                    self.creds._refresh_now(request or Request())
+                    self.refreshes += 1
+                    self.token_file.write(self.creds.to_json())
+            self._refreshed = time.monotonic()
+            self._wakeup.notify_all()
+            return True
+
+    def _take_from_file(self):
+        """Use the token in the file, if it is newer (and fresh enough) than ours.
+        @return Bool. Whether it was taken.
+        """
+        info = self.token_file.read()
+        if not info or not info.get('token') or info.get('token') == self.creds.token:
+            return False
+        try:
+            expiry = datetime.strptime(info['expiry'].rstrip('Z').split('.')[0], '%Y-%m-%dT%H:%M:%S')
+        except (KeyError, AttributeError, ValueError):
+            return False
+        if (expiry - _utcnow()).total_seconds() <= self.margin:
+            return False
+        self.creds.token = info['token']
+        self.creds.expiry = expiry
+        if info.get('refresh_token'):
+            self.creds._refresh_token = info['refresh_token']
+        return True
+
+    def start(self):
+        """Refresh the token in a background (daemon) thread, before it expires"""
+        with self._lock:
+            if not self._stopped: return
+            self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='token-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        retry = 0
+        while True:
+            with self._lock:
+                if self._stopped: return
+                if retry:
+                    timeout = retry
+                else:
+                    expires_in = self._expires_in()
+                    timeout = 60 if expires_in is None else max(1, expires_in - self.margin)
+                self._wakeup.wait(timeout)
+                if self._stopped: return
+            try:
+                self.refresh()
+                retry = 0
+            except Exception as e:
+                # e.g. no network: try again soon, the transport also refreshes when needed
+                print(f"!! {self.name}: cannot refresh the token: {str(e)}")
+                retry = min(2 * retry or 5, 60)
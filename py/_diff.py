@@ -0,0 +1,137 @@
+"""Bounded-memory diff of two listings (local and remote), used by GoogleDriveAPI.sync()
+
+Both sides are sorted by name with an external merge sort: the entries are kept
+in memory up to a budget, and beyond that they are sorted and spilled in runs to
+temporary files, which are merged back lazily (heapq.merge). Then the two sorted
+streams are merged in a single pass into actions:
+
+  - 'create': only in the local side
+  - 'update': in both sides, and changed (as decided by the caller)
+  - 'delete': only in the remote side
+
+So the memory used does not depend on the size of the folders.
+"""
+
+import os
+import heapq
+import pickle
+import tempfile
+
+# entries kept in memory by each side, before spilling them to disk
+DIFF_BUDGET = 100000
+
+class ExternalSorter(object):
+    """Sort more items than fit in memory.
+
+    Example:
+        with ExternalSorter(budget = 100000) as sorter:
+            for item in items:
+                sorter.add(item)
+            for item in sorter:
+                ...
+    """
+
+    def __init__(self, budget = DIFF_BUDGET, tmpdir = None):
+        """@param budget Int. Items kept in memory, before spilling a sorted run.
+        @param tmpdir (optional) String. The directory of the runs (default: the system one).
+        """
+        self.name   = "ExternalSorter"
+        self.budget = max(1, budget)
+        self.tmpdir = tmpdir
+        self.buffer = []
+        self.runs   = []        # paths of the spilled runs
+        self.count  = 0
+
+    def add(self, item):
+        """Add an item (any picklable object that can be compared to the other ones)"""
+        self.buffer.append(item)
+        self.count += 1
+        if len(self.buffer) >= self.budget:
+            self._spill()
+
+    def _spill(self):
+        self.buffer.sort()
+        fd, path = tempfile.mkstemp(prefix='gdrive_sort_', dir=self.tmpdir)
+        self.runs.append(path)
+        with os.fdopen(fd, 'wb') as f:
+            pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+            for item in self.buffer:
+                pickler.dump(item)
+                # no memo: the items are independent, and the memo would keep them all
+                pickler.clear_memo()
+        self.buffer = []
+
+    def _read_run(self, path):
+        with open(path, 'rb') as f:
+            unpickler = pickle.Unpickler(f)
+            while True:
+                try:
+                    yield unpickler.load()
+                except EOFError:
+                    return
+
+    def __iter__(self):
+        """The items, sorted. Can be iterated only once."""
+        self.buffer.sort()
+        if not self.runs:
+            yield from self.buffer
+            return
+        yield from heapq.merge(self.buffer, *[self._read_run(path) for path in self.runs])
+
+    def close(self):
+        """Remove the spilled runs"""
+        for path in self.runs:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.runs = []
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+def sorted_stream(items, budget = DIFF_BUDGET, tmpdir = None):
+    """Sort an iterable of items with an ExternalSorter, yielding them in order.
+    The spilled runs are removed when the generator ends (or is closed).
+    """
+    with ExternalSorter(budget, tmpdir) as sorter:
+        for item in items:
+            sorter.add(item)
+        yield from sorter
+
+def diff(local, remote, changed):
+    """Merge two listings sorted by name into actions.
+
+    @param local   Iterable of tuples (name, ...), sorted, without repeated names.
+    @param remote  Iterable of tuples (name, ...), sorted. If a name is repeated
+                   (Drive allows it), only the first entry is considered.
+    @param changed Callable (local, remote) -> Bool. Whether the remote entry must be updated.
+    @return A generator of tuples (action, local, remote), with action in 'create',
+            'update', 'delete' (local or remote is None if the entry is missing).
+    """
+    local, remote = iter(local), iter(remote)
+    end = object()
+    l = next(local, end)
+    r = next(remote, end)
+    while l is not end or r is not end:
+        if r is end or (l is not end and l[0] < r[0]):
+            yield ('create', l, None)
+            l = next(local, end)
+            continue
+        # skip the repeated remote names
+        name = r[0]
+        nr = next(remote, end)
+        while nr is not end and nr[0] == name:
+            nr = next(remote, end)
+        if l is end or name < l[0]:
+            yield ('delete', None, r)
+        else:
+            if changed(l, r):
+                yield ('update', l, r)
+            l = next(local, end)
+        r = nr
@@ -18,6 +18,28 @@ class MIME_TYPES:
 	UNKNOWN = {'mime': 'application/vnd.google-apps.unknown', 'description': ''}
 	VIDEO = {'mime': 'application/vnd.google-apps.video', 'description': ''}
 
+class EXPORT_MIME_TYPES:
+	"""Formats to export the Google-native documents to, by file extension
+	https://developers.google.com/drive/api/v3/ref-export-formats
+	"""
+	docx = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+	odt  = 'application/vnd.oasis.opendocument.text'
+	rtf  = 'application/rtf'
+	txt  = 'text/plain'
+	html = 'text/html'
+	epub = 'application/epub+zip'
+	pdf  = 'application/pdf'
+	xlsx = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+	ods  = 'application/x-vnd.oasis.opendocument.spreadsheet'
+	csv  = 'text/csv'
+	tsv  = 'text/tab-separated-values'
+	pptx = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+	odp  = 'application/vnd.oasis.opendocument.presentation'
+	jpeg = 'image/jpeg'
+	png  = 'image/png'
+	svg  = 'image/svg+xml'
+	json = 'application/vnd.google-apps.script+json'
+
 """
 FILE METADATA
 https://developers.google.com/drive/api/v3/reference/files
@@ -0,0 +1,146 @@
+"""Minimal wrapper around the Linux inotify API (through ctypes), used by
+GoogleDriveAPI.watch(). Only Linux is supported.
+
+References:
+https://man7.org/linux/man-pages/man7/inotify.7.html
+"""
+
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# events (see <sys/inotify.h>)
+IN_MODIFY      = 0x00000002
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF   = 0x00000800
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ONLYDIR     = 0x01000000
+IN_ISDIR       = 0x40000000
+
+IN_CLOEXEC     = 0o2000000
+IN_NONBLOCK    = 0o0004000
+
+# events needed to follow a tree being synced
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT = struct.Struct('iIII')      # wd, mask, cookie, len
+
+class InotifyEvent(object):
+    __slots__ = ('path', 'mask', 'cookie')
+
+    def __init__(self, path, mask, cookie):
+        self.path   = path      # full path of the entry (directory + '/' + name)
+        self.mask   = mask
+        self.cookie = cookie
+
+    @property
+    def is_dir(self):
+        return bool(self.mask & IN_ISDIR)
+
+class Inotify(object):
+    """An inotify instance. Each watched directory is identified by its path.
+
+    Example:
+        ino = Inotify()
+        ino.add_watch('my/folder')
+        for event in ino.read_events(timeout=5):
+            print(event.path, event.mask)
+        ino.close()
+    """
+
+    def __init__(self):
+        self.name  = "Inotify"
+        libname    = ctypes.util.find_library('c')
+        try:
+            self._libc = ctypes.CDLL(libname, use_errno=True)
+            self._libc.inotify_init1
+        except (OSError, AttributeError):
+            raise Exception(f"{self.name}: inotify is not available (Linux only)")
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._libc.inotify_rm_watch.argtypes  = [ctypes.c_int, ctypes.c_int]
+
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise Exception(f"{self.name}: inotify_init1 failed: {os.strerror(err)}")
+        self.paths = {}          # wd -> path
+        self.wds   = {}          # path -> wd
+
+    def add_watch(self, path, mask = WATCH_MASK):
+        """Watch a directory (not recursive).
+        @return Int. The watch descriptor.
+        @raise Exception, if the directory cannot be watched (e.g. the limit
+               fs.inotify.max_user_watches was reached).
+        """
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise Exception(f"{self.name}.add_watch: too many watches, increase fs.inotify.max_user_watches")
+            raise Exception(f"{self.name}.add_watch: cannot watch '{path}': {os.strerror(err)}")
+        self.paths[wd] = path
+        self.wds[path] = wd
+        return wd
+
+    def remove_watch(self, path):
+        wd = self.wds.pop(path, None)
+        if wd is None: return
+        self.paths.pop(wd, None)
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout = None):
+        """Wait up to timeout seconds (None = forever) for events.
+        @return A list of InotifyEvent (possibly empty, on timeout).
+        """
+        r, _, _ = select.select([self.fd], [], [], timeout)
+        if not r: return []
+
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            i = 0
+            while i + _EVENT.size <= len(buf):
+                wd, mask, cookie, length = _EVENT.unpack_from(buf, i)
+                name = buf[i + _EVENT.size:i + _EVENT.size + length].rstrip(b'\0')
+                i += _EVENT.size + length
+
+                if mask & IN_IGNORED:
+                    # the watch was removed (directory deleted, or unmounted)
+                    path = self.paths.pop(wd, None)
+                    if path is not None and self.wds.get(path) == wd:
+                        del self.wds[path]
+                    continue
+                parent = self.paths.get(wd, '')
+                if mask & IN_Q_OVERFLOW:
+                    events.append(InotifyEvent('', mask, cookie))
+                elif parent:
+                    path = parent + '/' + os.fsdecode(name) if name else parent
+                    events.append(InotifyEvent(path, mask, cookie))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self.paths = {}
+        self.wds   = {}
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
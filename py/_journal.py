@@ -0,0 +1,127 @@
+"""Persistent journal of the transfers planned by GoogleDriveAPI.sync(), so that an
+interrupted sync can be continued by GoogleDriveAPI.resume() without scanning
+and comparing everything again.
+
+The journal is a SQLite database with one row per file to be synced, and its
+state: 'pending', 'running', 'done', 'failed' or 'skipped'. A 'running' transfer
+found by resume() was interrupted, and it is done again.
+
+Each row also keeps what was learned while planning: the ID of the remote folder,
+the action ('create' or 'update') and the ID of the remote file to be replaced, so
+the transfer itself needs no lookups.
+"""
+
+import json
+import sqlite3
+import threading
+
+# columns added after the first version of the journal, with their types
+EXTRA_COLUMNS = {
+    'folder_id': 'TEXT',
+    'action':    'TEXT',
+    'remote_id': 'TEXT',
+}
+
+# order of the transfers
+ORDERS = {
+    'largest':  'size DESC, id',     # largest first: minimizes the total time with several jobs
+    'smallest': 'size ASC, id',      # smallest first: fast feedback
+    'fifo':     'id',                # in the order they were planned
+}
+
+class TransferJournal(object):
+    """Example:
+        journal = TransferJournal('sync.journal')
+        journal.add('local/foo.txt', '/remote/folder', 1024, folder_id = '1AbC', action = 'create')
+        for row in journal.pending(order='largest'):
+            journal.mark(row['id'], 'running')
+            ...
+            journal.mark(row['id'], 'done')
+    """
+
+    def __init__(self, path = ''):
+        self.name = "TransferJournal"
+        if not path:
+            raise Exception(f"{self.name}: No journal file given")
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS meta (
+                key   TEXT PRIMARY KEY,
+                value TEXT)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS transfers (
+                id     INTEGER PRIMARY KEY,
+                local  TEXT NOT NULL,
+                remote TEXT NOT NULL,
+                size   INTEGER NOT NULL DEFAULT 0,
+                mtime  REAL,
+                state  TEXT NOT NULL DEFAULT 'pending',
+                error  TEXT,
+                folder_id TEXT,
+                action    TEXT,
+                remote_id TEXT,
+                UNIQUE (local, remote))""")
+            # journals written by older versions
+            columns = [row['name'] for row in self._db.execute("PRAGMA table_info(transfers)")]
+            for name, type_ in EXTRA_COLUMNS.items():
+                if name not in columns:
+                    self._db.execute(f"ALTER TABLE transfers ADD COLUMN {name} {type_}")
+            self._db.execute("CREATE INDEX IF NOT EXISTS transfers_state ON transfers (state)")
+
+    def get_meta(self, key, default = None):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row['value']) if row else default
+
+    def set_meta(self, key, value):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (key, json.dumps(value)))
+
+    def reset(self):
+        """Forget all the transfers and the metadata, to plan a new sync"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM transfers")
+            self._db.execute("DELETE FROM meta")
+
+    def add(self, local, remote, size = 0, mtime = None, folder_id = None, action = None, remote_id = None):
+        """Plan a transfer of the local file <local> into the remote folder <remote>.
+        A transfer already in the journal keeps its state.
+        @param folder_id (optional) String. The ID of the remote folder, if known.
+        @param action    (optional) String. 'create' or 'update', if known.
+        @param remote_id (optional) String. With 'update', the ID of the remote file to be replaced.
+        """
+        with self._lock, self._db:
+            self._db.execute("""INSERT OR IGNORE INTO transfers (local, remote, size, mtime, folder_id, action, remote_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""", (local, remote, size, mtime, folder_id, action, remote_id))
+
+    def pending(self, order = 'largest', retry_failed = False):
+        """The transfers still to be done, in the given order (see ORDERS).
+        @return List of sqlite3.Row, with the keys id, local, remote, size, mtime, state, error,
+                folder_id, action, remote_id.
+        """
+        if order not in ORDERS:
+            raise Exception(f"{self.name}.pending: Unknown order '{order}'")
+        states = ('pending', 'running', 'failed') if retry_failed else ('pending', 'running')
+        with self._lock:
+            return self._db.execute(
+                f"SELECT * FROM transfers WHERE state IN ({','.join('?' * len(states))}) ORDER BY {ORDERS[order]}",
+                states).fetchall()
+
+    def mark(self, id, state, error = None):
+        with self._lock, self._db:
+            self._db.execute("UPDATE transfers SET state = ?, error = ? WHERE id = ?", (state, error, id))
+
+    def counts(self):
+        """@return Dict {state: number of transfers}"""
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) AS n FROM transfers GROUP BY state").fetchall()
+        return {row['state']: row['n'] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,201 @@
+"""Local tree scanner used by GoogleDriveAPI.sync()
+
+The scanner walks the local tree with os.scandir(), so the type of each entry
+comes from the cached DirEntry data instead of separate isdir()/isfile() calls,
+and the stat() result of the entry is reused by the sync (no second os.stat()).
+Directories are scanned in parallel threads.
+
+Optionally, a snapshot of the directories (mtime, number of entries and
+sub-directories) can be persisted between runs. A directory whose mtime and
+number of entries did not change since the previous run is not listed again,
+and a whole sub-tree made only of unchanged directories is skipped by sync().
+
+The files of a directory with more than max_files entries are not kept in memory:
+they are listed again with iter_files() when needed.
+
+CAUTION: the mtime of a directory changes when entries are added, removed or
+renamed into it, but NOT when an existing file is rewritten in place. Use the
+snapshot only if the files are written by replacing them (e.g. write a temp file,
+then rename), or run from time to time a full sync without snapshot.
+"""
+
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class LocalFile(object):
+    """A regular file found by the scanner"""
+    __slots__ = ('name', 'size', 'mtime')
+
+    def __init__(self, name, size, mtime):
+        self.name  = name
+        self.size  = size
+        self.mtime = mtime
+
+def iter_files(path):
+    """The regular files into a directory, as LocalFile, in constant memory"""
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_file():
+                    _stat = entry.stat()
+                    yield LocalFile(entry.name, _stat.st_size, _stat.st_mtime)
+            except OSError:
+                # broken link, or removed while scanning
+                continue
+
+class LocalDir(object):
+    """A directory found by the scanner.
+    If the directory was not listed (unchanged since the snapshot), then
+    files is None and subdirs comes from the snapshot. If it has too many
+    files (see max_files), files is None as well, but changed is True.
+    """
+    __slots__ = ('path', 'depth', 'mtime_ns', 'count', 'files', 'subdirs', 'changed')
+
+    def __init__(self, path, depth, mtime_ns, count=0, files=None, subdirs=None, changed=True):
+        self.path     = path
+        self.depth    = depth
+        self.mtime_ns = mtime_ns
+        self.count    = count
+        self.files    = files
+        self.subdirs  = subdirs if subdirs is not None else []
+        self.changed  = changed     # after scan(), True if anything changed in the sub-tree
+
+class LocalScanner(object):
+    """Scans a local directory tree.
+
+    Example:
+        scanner = LocalScanner('my/local/folder', snapshot_file='.snapshot.json')
+        tree = scanner.scan()            # dict: path -> LocalDir
+        ...
+        scanner.save_snapshot()          # only after the sync succeeded
+    """
+
+    def __init__(self, root = '', max_depth = 10, workers = 4, snapshot_file = '', max_files = 0):
+        """@param root          String. The local directory to be scanned.
+        @param max_depth     Int. Max depth to look into (the root has depth 1).
+        @param workers       Int. Number of threads scanning directories.
+        @param snapshot_file (optional) String. File to load/save the directories snapshot.
+        @param max_files     (optional) Int. Keep the files of a directory only up to this
+                             number (0 = no limit).
+        """
+        if root and root != '/' and root[-1] == '/': root = root[:-1]
+        self.name          = "LocalScanner"
+        self.root          = root
+        self.max_depth     = max_depth
+        self.workers       = max(1, workers)
+        self.snapshot_file = snapshot_file
+        self.max_files     = max_files
+        self.snapshot      = self._load_snapshot()
+        self.dirs          = {}
+
+    def _load_snapshot(self):
+        if not self.snapshot_file or not os.path.isfile(self.snapshot_file):
+            return {}
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # a corrupt snapshot only means a full scan
+            return {}
+        if data.get('root') != self.root:
+            return {}
+        return data.get('dirs', {})
+
+    def save_snapshot(self):
+        """Persist the directories seen by the last scan(). Write it only after
+        the remote side was successfully synced, otherwise the next run would
+        skip directories that were never uploaded.
+        """
+        if not self.snapshot_file: return
+        dirs = {}
+        for path, d in self.dirs.items():
+            dirs[path] = [d.mtime_ns, d.count, d.subdirs]
+        tmp = self.snapshot_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'root': self.root, 'dirs': dirs}, f)
+        os.replace(tmp, self.snapshot_file)
+
+    def scan(self):
+        """Scan the tree.
+        @return A dict mapping each directory path (built as parent + '/' + name,
+                like sync() does) to its LocalDir.
+        @raise Exception, if the root is not a directory.
+        """
+        if not os.path.isdir(self.root):
+            raise Exception(f"{self.name}.scan: Not a directory: '{self.root}'")
+
+        self.dirs = {}
+        st = os.stat(self.root)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {pool.submit(self._scan_dir, self.root, 1, st.st_mtime_ns)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for path, depth, mtime_ns in future.result():
+                        pending.add(pool.submit(self._scan_dir, path, depth, mtime_ns))
+
+        # propagate the changes from the leaves up to the root, so that
+        # a directory is unchanged only if all its sub-tree is unchanged
+        for d in sorted(self.dirs.values(), key=lambda d: d.depth, reverse=True):
+            if not d.changed: continue
+            parent = self.dirs.get(os.path.dirname(d.path))
+            if parent is not None and d.path != self.root:
+                parent.changed = True
+        return self.dirs
+
+    def _scan_dir(self, path, depth, mtime_ns):
+        """Scan a single directory (runs in a worker thread).
+        @return List of tuples (path, depth, mtime_ns) of the sub-directories to scan next.
+        """
+        children = []
+        old = self.snapshot.get(path)
+        if old is not None and old[0] == mtime_ns:
+            # same mtime: check the entries count (coarse mtime resolution on some
+            # network filesystems), and reuse the sub-directories from the snapshot
+            d = LocalDir(path, depth, mtime_ns, count=old[1], subdirs=list(old[2]), changed=False)
+            if depth < self.max_depth:
+                for name in d.subdirs:
+                    child = path + '/' + name
+                    try:
+                        children.append((child, depth + 1, os.stat(child).st_mtime_ns))
+                    except OSError:
+                        # removed since then, the mtime should have changed ... re-scan
+                        d = None
+                        break
+            if d is not None and self._count(path) == d.count:
+                self.dirs[path] = d
+                return children
+            children = []
+
+        files   = []
+        subdirs = []
+        count   = 0
+        with os.scandir(path) as it:
+            for entry in it:
+                count += 1
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                        if depth < self.max_depth:
+                            children.append((path + '/' + entry.name, depth + 1, entry.stat().st_mtime_ns))
+                    elif entry.is_file() and files is not None:
+                        if self.max_files and len(files) >= self.max_files:
+                            # too many, they will be listed again by iter_files()
+                            files = None
+                            continue
+                        _stat = entry.stat()
+                        files.append(LocalFile(entry.name, _stat.st_size, _stat.st_mtime))
+                except OSError:
+                    # broken link, or removed while scanning
+                    continue
+        self.dirs[path] = LocalDir(path, depth, mtime_ns, count=count, files=files, subdirs=subdirs)
+        return children
+
+    def _count(self, path):
+        """Number of entries into a directory, without stat'ing them"""
+        try:
+            with os.scandir(path) as it:
+                return sum(1 for _ in it)
+        except OSError:
+            return -1
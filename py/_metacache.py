@@ -0,0 +1,104 @@
+"""Short-lived cache of file metadata (per ID and per field), used by GoogleDriveAPI.
+
+The single-ID helpers (getMimeTypeById(), getFileNameById(), moveToFolderById(), ...)
+read from it, and get_many() fills it with batch requests, so asking several times for
+the same file, or for many files at once, does not cost one files().get() each time.
+Each field expires on its own (ttl), and the changes made through the API update or
+invalidate the entries, but the changes made by someone else are seen only after the
+ttl: keep it short.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+# seconds a field is trusted
+METADATA_TTL = 30
+
+# entries kept, the least recently used ones are dropped beyond that
+METADATA_MAX_ENTRIES = 100000
+
+class MetadataCache(object):
+    """Example:
+        cache = MetadataCache(ttl = 30)
+        cache.put('1AbC', {'name': 'foo.txt', 'mimeType': 'text/plain'})
+        cache.get('1AbC', ['name'])             # {'name': 'foo.txt'}
+        cache.get('1AbC', ['name', 'size'])     # None: 'size' is missing
+        cache.missing('1AbC', ['name', 'size']) # ['size']
+    """
+
+    def __init__(self, ttl = METADATA_TTL, max_entries = METADATA_MAX_ENTRIES):
+        """@param ttl Float. Seconds each field is trusted. 0 disables the cache.
+        @param max_entries Int. Files kept.
+        """
+        self.name        = "MetadataCache"
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self._lock       = threading.Lock()
+        self._entries    = OrderedDict()        # fileId -> {field: (value, expires)}
+        self.hits        = 0            # calls to missing() with all the fields cached
+        self.misses      = 0
+
+    def _fresh(self, fileId, now):
+        """The fresh fields of a file (the lock must be held)"""
+        entry = self._entries.get(fileId)
+        if not entry: return {}
+        fresh = {k: v for k, (v, expires) in entry.items() if expires > now}
+        if len(fresh) < len(entry):
+            entry = {k: v for k, v in entry.items() if v[1] > now}
+            if entry:
+                self._entries[fileId] = entry
+            else:
+                del self._entries[fileId]
+        return fresh
+
+    def get(self, fileId, fields):
+        """@return Dict with the fields of the file, or None if some of them are not cached."""
+        with self._lock:
+            fresh = self._fresh(fileId, time.monotonic())
+            if all(f in fresh for f in fields):
+                self._entries.move_to_end(fileId)
+                return {f: fresh[f] for f in fields}
+            return None
+
+    def missing(self, fileId, fields):
+        """@return List. The fields of the file that are not cached."""
+        with self._lock:
+            fresh = self._fresh(fileId, time.monotonic())
+            missing = [f for f in fields if f not in fresh]
+            if missing:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return missing
+
+    def put(self, fileId, metadata):
+        """Add (or replace) some fields of a file"""
+        if not self.ttl or not fileId: return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            entry = self._entries.setdefault(fileId, {})
+            for k, v in metadata.items():
+                if k != 'id': entry[k] = (v, expires)
+            self._entries.move_to_end(fileId)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, fileId, fields = None):
+        """Forget the fields of a file (all of them by default)"""
+        with self._lock:
+            entry = self._entries.get(fileId)
+            if entry is None: return
+            if fields is None:
+                del self._entries[fileId]
+                return
+            for f in fields:
+                entry.pop(f, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,116 @@
+"""Compact records for the file metadata retrieved from Drive, and the field
+masks requested by each operation of GoogleDriveAPI.
+
+Listings of millions of entries are kept as DriveFile objects instead of raw
+dicts (__slots__, no per-entry dict). DriveFile still behaves as a read-only
+dict (file['id'], file.get('size'), 'size' in file), so the code written for
+the dicts returned by the API keeps working.
+"""
+
+from datetime import datetime, timezone
+
+# Field masks: request exactly the fields each operation needs.
+# https://developers.google.com/drive/api/v3/fields-parameter
+FIELDS = {
+    'lookup':  ['id', 'mimeType', 'createdTime'],         # path resolution (getFileId), see _pick()
+    'type':    ['id', 'mimeType'],                        # is it a folder?
+    'default': ['id', 'name', 'mimeType', 'parents'],     # list_all_files() without attr
+    'listing': ['id', 'name', 'mimeType', 'size', 'modifiedTime', 'parents', 'md5Checksum'],
+    'md5':     ['id', 'mimeType', 'md5Checksum'],         # build_md5_index()
+    'export':  ['id', 'name', 'mimeType', 'modifiedTime', 'version'],
+}
+
+def list_fields(attr):
+    """The 'fields' parameter of files().list() for a list of attributes"""
+    return 'nextPageToken, files(' + ','.join(attr) + ')'
+
+def parse_time(value):
+    """Convert a RFC 3339 time as returned by Drive ('2021-08-01T12:00:00.000Z')
+    into a POSIX timestamp.
+    """
+    if not value: return None
+    try:
+        t = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ")
+    except ValueError:
+        t = datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+    return t.replace(tzinfo=timezone.utc).timestamp()
+
+class DriveFile(object):
+    """Metadata of a Drive file, as retrieved by files().list() or files().get().
+    Only the fields present in the response are set, the other ones are None.
+    The less common fields are kept in an auxiliary dict.
+    """
+    __slots__ = ('id', 'name', 'mimeType', 'size', 'modifiedTime', 'parents',
+                 'md5Checksum', 'version', 'createdTime', '_extra', '_mtime')
+
+    _FIELDS = ('id', 'name', 'mimeType', 'size', 'modifiedTime', 'parents',
+               'md5Checksum', 'version', 'createdTime')
+
+    def __init__(self, data = None):
+        self.id = self.name = self.mimeType = self.size = self.modifiedTime = None
+        self.parents = self.md5Checksum = self.version = self.createdTime = None
+        self._extra = None
+        self._mtime = None
+        for key, value in (data or {}).items():
+            self[key] = value
+
+    @property
+    def mtime(self):
+        """modifiedTime as a POSIX timestamp, parsed only when needed"""
+        if self._mtime is None and self.modifiedTime:
+            self._mtime = parse_time(self.modifiedTime)
+        return self._mtime
+
+    @property
+    def bytes(self):
+        """size as an integer, or None (folders and Google-native documents)"""
+        return int(self.size) if self.size is not None else None
+
+    @property
+    def is_folder(self):
+        return self.mimeType == 'application/vnd.google-apps.folder'
+
+    # --- dict-like interface ---
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._FIELDS:
+            setattr(self, key, value)
+            if key == 'modifiedTime': self._mtime = None
+        else:
+            if self._extra is None: self._extra = {}
+            self._extra[key] = value
+
+    def get(self, key, default = None):
+        if key in self._FIELDS:
+            value = getattr(self, key)
+        elif self._extra is not None:
+            value = self._extra.get(key)
+        else:
+            value = None
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        keys = [k for k in self._FIELDS if getattr(self, k) is not None]
+        if self._extra: keys.extend(self._extra)
+        return keys
+
+    def items(self):
+        return [(k, self.get(k)) for k in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, DriveFile): other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f"DriveFile({self.to_dict()!r})"
@@ -0,0 +1,69 @@
+"""In-flight deduplication of identical requests ("single flight").
+
+When several threads ask for the same thing at the same time (e.g. many workers
+resolving the same parent folder), only the first one (the leader) makes the
+network call; the other ones wait for it and share its result (or exception).
+Nothing is cached: once the call finished, the next request goes to the network.
+"""
+
+import threading
+
+class _Call(object):
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event  = threading.Event()
+        self.result = None
+        self.error  = None
+
+class SingleFlight(object):
+    """Example:
+        flight = SingleFlight()
+        files = flight.do(('list', query, fields), lambda: list_files(query, fields))
+        print(flight.calls, flight.coalesced)
+    """
+
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self._inflight = {}
+        self.calls     = 0      # calls actually made
+        self.coalesced = 0      # calls that waited for (and shared) another identical call
+
+    def do(self, key, fn):
+        """Call fn(), unless an identical call (same key) is already running, in which
+        case wait for it and return its result.
+        @param key Hashable. Identifies the request, e.g. ('get', fileId, fields).
+        @param fn  Callable without arguments, making the request.
+        @return The value returned by fn().
+        @raise  The exception raised by fn().
+        """
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._inflight[key] = call
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced}
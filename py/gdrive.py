@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""Command line interface over GoogleDriveAPI.
+
+    gdrive [options] ls [-R] [path]          list a folder (JSON lines, streamed)
+    gdrive [options] find [path] [--name PATTERN] [--type f|d] [--query Q]
+    gdrive [options] stat path...            metadata of some files
+    gdrive [options] put local... remote     upload files into a remote folder
+    gdrive [options] get [-R] remote local   download a file (or a folder, with -R)
+    gdrive [options] sync local remote       see GoogleDriveAPI.sync()
+    gdrive [options] rm [-f] path...         remove files or folders
+    gdrive [options] mkdir path...           create folders (and their parents)
+
+Options: --token FILE, --client-secret FILE (or the env GDRIVE_TOKEN, GDRIVE_CLIENT_SECRET),
+--service-account FILE (repeatable), --jobs N, --dry-run. See gdrive --help.
+
+The results are written to stdout as JSON lines (one object per line), as soon as
+they are known, e.g. 'gdrive ls -R /' starts printing right away and does not keep
+the tree in memory. Progress messages and errors go to stderr.
+"""
+
+import os
+import sys
+import json
+import fnmatch
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# this is to include another sources in this module
+sys.path.append(os.path.dirname(__file__))
+from google_drive_api import GoogleDriveAPI, FIELDS, MIME_TYPE_FOLDER
+
+# the messages printed by GoogleDriveAPI go to stderr (see main()), the results to OUTPUT
+OUTPUT = None
+_output_lock = threading.Lock()
+
+def emit(obj):
+    """Write an object as a JSON line into stdout (from any thread)"""
+    out = OUTPUT or sys.stdout
+    line = json.dumps(obj) + '\n'
+    with _output_lock:
+        out.write(line)
+        out.flush()
+
+def record(path, file):
+    """The JSON object of a file"""
+    obj = {'path': path}
+    obj.update(file.to_dict() if hasattr(file, 'to_dict') else file)
+    return obj
+
+def error(message):
+    print(f"gdrive: {message}", file=sys.stderr)
+
+def _join(folder, name):
+    return folder.rstrip('/') + '/' + name if folder else name
+
+# --- commands -------------------------------------------------------------------
+def cmd_ls(api, args):
+    if args.recursive:
+        for path, file in api.walk(args.path, max_recursion_level = args.max_depth, jobs = args.jobs):
+            emit(record(_join(args.path, path), file))
+        return 0
+    for file in api.iter_directory(args.path):
+        emit(record(_join(args.path, file.get('name', '').replace('/', '\\/')), file))
+    return 0
+
+def cmd_find(api, args):
+    if args.query:
+        # a raw Drive query, e.g. "modifiedTime > '2021-08-01T00:00:00'"
+        for file in api.iter_all_files(query = args.query, attr = FIELDS['listing']):
+            emit(record(None, file))
+        return 0
+    for path, file in api.walk(args.path, max_recursion_level = args.max_depth, jobs = args.jobs):
+        is_folder = file.get('mimeType') == MIME_TYPE_FOLDER
+        if args.type == 'f' and is_folder or args.type == 'd' and not is_folder:
+            continue
+        if args.name and not fnmatch.fnmatch(file.get('name', ''), args.name):
+            continue
+        emit(record(_join(args.path, path), file))
+    return 0
+
+def cmd_stat(api, args):
+    found = api.resolve_many(args.paths, attr = FIELDS['listing'] + ['createdTime'], jobs = args.jobs)
+    status = 0
+    for path in args.paths:
+        if found[path]:
+            emit(record(path, found[path]))
+        else:
+            error(f"not found: '{path}'")
+            status = 1
+    return status
+
+def cmd_put(api, args):
+    for local in args.local:
+        if not os.path.isfile(local):
+            error(f"not a file: '{local}' (use sync for folders)")
+            return 1
+    folderId = ''
+    if not args.dry_run:
+        # resolved once, not by each upload
+        folder = api.getFileId(args.remote, attr = FIELDS['type'], prefer_folder = True)
+        if not folder:
+            error(f"remote folder not found: '{args.remote}'")
+            return 1
+        if folder.get('mimeType') != MIME_TYPE_FOLDER:
+            error(f"not a folder: '{args.remote}'")
+            return 1
+        folderId = folder['id']
+
+    def put(local):
+        return api.upload_file(origin = local, filename = os.path.basename(local),
+            folderId = folderId, dedup = args.dedup)
+
+    return _run_jobs(api, args, args.local, put,
+        lambda local, fileId: {'action': 'upload', 'local': local,
+            'path': _join(args.remote, os.path.basename(local)), 'id': fileId})
+
+def cmd_get(api, args):
+    r = api.searchFile(args.remote)
+    if not r:
+        error(f"not found: '{args.remote}'")
+        return 1
+    if r.get('mimeType') != MIME_TYPE_FOLDER:
+        local = args.local
+        if os.path.isdir(local):
+            local = os.path.join(local, r.get('name', '').replace('/', '_'))
+        return _run_jobs(api, args, [(r, local)], lambda job: api.download_file(job[0]['id'], job[1]),
+            lambda job, size: {'action': 'download', 'path': args.remote, 'local': job[1], 'size': size})
+    if not args.recursive:
+        error(f"'{args.remote}' is a folder (use -R)")
+        return 1
+
+    def todo():
+        # the folders are created as they are found, the files are downloaded by the jobs
+        for path, file in api.walk(args.remote, max_recursion_level = args.max_depth, jobs = args.jobs):
+            local = os.path.join(args.local, *[name.replace('/', '_') for name in api._split_path(path)])
+            if file.get('mimeType') == MIME_TYPE_FOLDER:
+                if not args.dry_run: os.makedirs(local, exist_ok=True)
+            elif 'size' in file:
+                yield (file, local, _join(args.remote, path))
+            else:
+                error(f"skipping the Google document '{path}' (see export_tree())")
+
+    if not args.dry_run: os.makedirs(args.local, exist_ok=True)
+    return _run_jobs(api, args, todo(), lambda job: api.download_file(job[0]['id'], job[1]),
+        lambda job, size: {'action': 'download', 'path': job[2], 'local': job[1], 'size': size})
+
+def cmd_sync(api, args):
+    api.sync(args.local, args.remote, regex = args.regex, max_recursion_level = args.max_depth,
+        snapshot_file = args.snapshot, dedup = args.dedup, journal_file = args.journal,
+        jobs = args.jobs, dry_run = args.dry_run, on_action = emit)
+    emit({'action': 'sync', 'local': args.local, 'path': args.remote, 'dry_run': args.dry_run})
+    return 0
+
+def cmd_rm(api, args):
+    # resolve_many() resolves '/' and 'shared:Name' to the root folders: never remove them
+    for path in args.paths:
+        if not api._split_root(path)[1]:
+            error(f"refusing to remove the root folder '{path}'")
+            return 1
+    found = api.resolve_many(args.paths, jobs = args.jobs)
+    missing = [path for path in args.paths if not found[path]]
+    for path in missing:
+        error(f"not found: '{path}'")
+    todo = [path for path in args.paths if found[path]]
+    if todo and not args.force and not args.dry_run:
+        ans = input(f"delete {len(todo)} files or folders (with all their content) [y]es/[n]o? This action cannot be undone: ")
+        if ans.upper() != 'Y':
+            return 1
+
+    def rm(path):
+        api._delete(found[path])
+
+    status = _run_jobs(api, args, todo, rm,
+        lambda path, _: {'action': 'remove', 'path': path, 'id': found[path]})
+    return status or (1 if missing else 0)
+
+def cmd_mkdir(api, args):
+    # one by one: the folders can share parents
+    for path in args.paths:
+        if args.dry_run:
+            emit({'action': 'mkdir', 'path': path, 'dry_run': True})
+            continue
+        folderId = api.createFolder(path)
+        emit({'action': 'mkdir', 'path': path, 'id': folderId})
+    return 0
+
+def _run_jobs(api, args, jobs, fn, describe):
+    """Run fn(job) for each job in <args.jobs> threads, emitting describe(job, result) for
+    each one as they finish. With --dry-run, only emit what would be done.
+    @return Int. The exit status: 1 if some jobs failed.
+    """
+    if args.dry_run:
+        for job in jobs:
+            obj = describe(job, None)
+            obj['dry_run'] = True
+            emit(obj)
+        return 0
+
+    status = 0
+    def finish(done):
+        nonlocal status
+        for future in done:
+            job = pending.pop(future)
+            try:
+                emit(describe(job, future.result()))
+            except Exception as e:
+                error(str(e))
+                status = 1
+
+    # at most a few jobs waiting for a thread, so a generator of jobs is consumed as they finish
+    window = 4 * max(1, args.jobs)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        for job in jobs:
+            pending[pool.submit(fn, job)] = job
+            if len(pending) >= window:
+                finish(wait(pending, return_when=FIRST_COMPLETED).done)
+        while pending:
+            finish(wait(pending).done)
+    return status
+
+# --- main -----------------------------------------------------------------------
+def build_parser():
+    parser = argparse.ArgumentParser(prog='gdrive', description='Command line interface to Google Drive')
+    parser.add_argument('--token', default=os.environ.get('GDRIVE_TOKEN', 'token.json'),
+        help='token file (created on the first run), default $GDRIVE_TOKEN or token.json')
+    parser.add_argument('--client-secret', default=os.environ.get('GDRIVE_CLIENT_SECRET', ''),
+        help='client secret file, needed to create the token, default $GDRIVE_CLIENT_SECRET')
+    parser.add_argument('--service-account', action='append', default=[], metavar='FILE',
+        help='use a service account instead of the token (repeat it to spread the jobs across several)')
+    parser.add_argument('-j', '--jobs', type=int, default=4, help='concurrent requests/transfers, default 4')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='only show what would be done')
+    sub = parser.add_subparsers(dest='command', metavar='command')
+    sub.required = True
+
+    p = sub.add_parser('ls', help='list a folder')
+    p.add_argument('path', nargs='?', default='/')
+    p.add_argument('-R', '--recursive', action='store_true')
+    p.add_argument('--max-depth', type=int, default=10)
+    p.set_defaults(func=cmd_ls)
+
+    p = sub.add_parser('find', help='find files under a folder')
+    p.add_argument('path', nargs='?', default='/')
+    p.add_argument('--name', default='', help="shell pattern, e.g. '*.csv'")
+    p.add_argument('--type', choices=['f', 'd'], default='', help='f: files, d: folders')
+    p.add_argument('--query', default='', help='a Drive query instead (the whole Drive is searched)')
+    p.add_argument('--max-depth', type=int, default=10)
+    p.set_defaults(func=cmd_find)
+
+    p = sub.add_parser('stat', help='metadata of files')
+    p.add_argument('paths', nargs='+')
+    p.set_defaults(func=cmd_stat)
+
+    p = sub.add_parser('put', help='upload files into a remote folder')
+    p.add_argument('local', nargs='+')
+    p.add_argument('remote')
+    p.add_argument('--dedup', action='store_true', help='server-side copy of the files already in Drive')
+    p.set_defaults(func=cmd_put)
+
+    p = sub.add_parser('get', help='download a file, or a folder with -R')
+    p.add_argument('remote')
+    p.add_argument('local', nargs='?', default='.')
+    p.add_argument('-R', '--recursive', action='store_true')
+    p.add_argument('--max-depth', type=int, default=10)
+    p.set_defaults(func=cmd_get)
+
+    p = sub.add_parser('sync', help='synchronize a local folder into a remote folder')
+    p.add_argument('local')
+    p.add_argument('remote')
+    p.add_argument('--regex', default='')
+    p.add_argument('--max-depth', type=int, default=10)
+    p.add_argument('--snapshot', default='', help='snapshot file of the local tree')
+    p.add_argument('--journal', default='', help='journal file of the transfers (see resume())')
+    p.add_argument('--dedup', action='store_true')
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser('rm', help='remove files or folders (with all their content)')
+    p.add_argument('paths', nargs='+')
+    p.add_argument('-f', '--force', action='store_true', help='do not ask for confirmation')
+    p.set_defaults(func=cmd_rm)
+
+    p = sub.add_parser('mkdir', help='create folders (and their parents)')
+    p.add_argument('paths', nargs='+')
+    p.set_defaults(func=cmd_mkdir)
+    return parser
+
+def main(argv = None, api = None):
+    """Run the command line.
+    @param argv List of strings. The arguments (default sys.argv[1:]).
+    @param api (optional) GoogleDriveAPI. An API already started.
+    @return Int. The exit status.
+    """
+    global OUTPUT
+    args = build_parser().parse_args(argv)
+    OUTPUT = sys.stdout
+    try:
+        if api is None:
+            api = GoogleDriveAPI()
+            if args.service_account:
+                api.add_service_accounts(args.service_account)
+            else:
+                api.token_file = args.token
+                api.client_secret = args.client_secret
+                api.init_service()
+        with contextlib.redirect_stdout(sys.stderr):
+            return args.func(api, args)
+    except KeyboardInterrupt:
+        return 130
+    except BrokenPipeError:
+        # e.g. gdrive ls -R / | head. Python flushes stdout at exit: point it to devnull,
+        # so that it does not fail again (see "Note on SIGPIPE" in the docs of signal)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, OUTPUT.fileno())
+        return 1
+    except Exception as e:
+        error(str(e))
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
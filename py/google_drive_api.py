@@ -2,22 +2,40 @@ from __future__ import print_function
 import os.path
 from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from googleapiclient.http import MediaFileUpload
+from google.oauth2 import service_account
+import google_auth_httplib2
+from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload, build_http
+from googleapiclient.errors import HttpError
 
 import sys       # sys.path
 import os        # os.path
 import stat      # S_IRUSR
 import re        # regex
+import hashlib   # md5
+import json
 from datetime import datetime
 import threading
+import itertools
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from contextlib import nullcontext, contextmanager
+import time
 from time import sleep
 from pprint import pprint
 
 # this is to include another sources in this module
 sys.path.append(os.path.dirname(__file__))
-from _enum import MIME_TYPES
+from _enum import MIME_TYPES, EXPORT_MIME_TYPES
+from _local_scan import LocalScanner, iter_files
+from _diff import DIFF_BUDGET, diff, sorted_stream
+from _records import DriveFile, FIELDS, list_fields
+from _singleflight import SingleFlight
+from _metacache import MetadataCache
+from _credentials import CredentialsManager, ManagedCredentials, TokenFile
+from _journal import TransferJournal
+from _bandwidth import BandwidthLimiter
+from _inotify import Inotify, IN_Q_OVERFLOW, IN_CREATE, IN_MOVED_TO, IN_MOVED_FROM, IN_DELETE, IN_DELETE_SELF, IN_MOVE_SELF
 
 __author__   = "Yoel Monsalve"
 __mail__     = "yymonsalve@gmail.com"
@@ -41,6 +59,48 @@ MIME_TYPE_FILE     = MIME_TYPES.FILE['mime']
 MIME_TYPE_SHEET    = MIME_TYPES.SPREADSHEET['mime']
 MIME_TYPE_DOCUMENT = MIME_TYPES.DOCUMENT['mime']
 MIME_TYPE_PHOTO    = MIME_TYPES.PHOTO['mime']
+MIME_TYPE_SLIDE    = MIME_TYPES.SLIDE['mime']
+MIME_TYPE_DRAWING  = MIME_TYPES.DRAW['mime']
+
+# default formats for export_tree(), by MIME type of the Google-native document
+EXPORT_FORMATS = {
+    MIME_TYPE_DOCUMENT: 'docx',
+    MIME_TYPE_SHEET:    'xlsx',
+    MIME_TYPE_SLIDE:    'pptx',
+    MIME_TYPE_DRAWING:  'pdf',
+}
+
+# number of retries (with exponential backoff) on rate limit and server errors
+NUM_RETRIES = 5
+
+# chunk size of the uploads and downloads, when the bandwidth is limited (multiple of 256 KB)
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_CHUNK_SIZE = 100 * 1024 * 1024
+
+# files per page in files().list(), the maximum allowed by Drive
+PAGE_SIZE = 1000
+
+# files per batch request (see get_many()), the maximum allowed by Drive
+BATCH_SIZE = 100
+
+# limits of the queries "name='a' or name='b' or ..." made by resolve_many()
+MAX_NAMES_PER_QUERY = 50
+MAX_QUERY_LENGTH    = 2000
+
+# prefix of the paths into a Shared Drive, e.g. 'shared:TeamName/path/to/folder'
+SHARED_PREFIX = 'shared:'
+
+# alias of the root folder of My Drive
+ROOT_ID = 'root'
+
+# entries kept in md5_index (see upload_file(dedup=True)), the oldest ones are dropped beyond that
+MD5_INDEX_MAX_ENTRIES = 100000
+
+# times the content of a duplicated folder is moved, before giving up on removing it (see _merge_folder())
+MERGE_FOLDER_TRIES = 5
+
+# fields of the remote files diffed by sync(), the name first (see _diff.py)
+DIFF_FIELDS = ['name', 'createdTime', 'id', 'size', 'modifiedTime', 'md5Checksum']
 
 class GoogleDriveAPI(object):
     """Custom class to easily manage the Google Drive API, coded in Python
@@ -61,6 +121,17 @@ class GoogleDriveAPI(object):
         self.client_secret = ''     # the client secret file (download it from the Google Cloud Console page
                                     # https://console.cloud.google.com/apis/credentials?project=xxx-yyy)
         self.service = None         # the Google API service
+        self.creds = None           # the credentials of the service
+        self.credentials_manager = None     # keeps self.creds valid, see init_service()
+        self._local = threading.local()     # per-thread objects (see _thread_http())
+        self.inflight = SingleFlight()      # coalesces identical concurrent requests
+        self.metadata = MetadataCache()     # short-lived metadata per file ID, see get_many()
+        self.bandwidth = None               # BandwidthLimiter, see set_bandwidth_limit()
+        self.identities = []                # pool of credentials, see add_service_accounts()
+        self._identity_seq = itertools.count()
+        self._drives = {}                   # Shared Drive name -> ID, see _drive_id()
+        self._folder_locks = {}             # (parentId, name) -> [Lock, users], see _folder_lock()
+        self._folder_locks_lock = threading.Lock()
 
         # MIME types
         self.MIME_TYPE_FOLDER       = MIME_TYPE_FOLDER
@@ -68,12 +139,22 @@ class GoogleDriveAPI(object):
         self.MIME_TYPE_SHEET        = MIME_TYPE_SHEET
         self.MIME_TYPE_DOCUMENT     = MIME_TYPE_DOCUMENT
         self.MIME_TYPE_PHOTO        = MIME_TYPE_PHOTO
+        self.MIME_TYPE_SLIDE        = MIME_TYPE_SLIDE
+        self.MIME_TYPE_DRAWING      = MIME_TYPE_DRAWING
 
         # SCOPES
         self.SCOPES = SCOPES
 
+        # content-addressed dedup (see upload_file(dedup=True))
+        self.md5_index   = OrderedDict()    # md5Checksum -> ID of a remote file with that content
+        self.dedup_stats = {'copies': 0, 'bytes_saved': 0}
+        self._dedup_lock = threading.Lock()     # the workers of sync(jobs=...) share both
+
     def init_service(self, scopes = []):
-        """This initializes the API service, using the client authentication
+        """This initializes the API service, using the client authentication.
+        From then on, the token is refreshed in a background thread before it expires, and
+        saved into the token file, which can be shared by several processes (see
+        _credentials.py). Call stop_service() to stop that thread.
         @param scopes The scopes to create the credentials for, if null then takes self.SCOPES
         """
 
@@ -87,12 +168,14 @@ class GoogleDriveAPI(object):
                 self.SCOPES = scopes
             if not self.SCOPES:
                 raise Exception(f"{self.name}.init_service failed: No SCOPE defined")
-            creds = Credentials.from_authorized_user_file(self.token_file, self.SCOPES)
+            creds = ManagedCredentials.from_authorized_user_file(self.token_file, self.SCOPES)
+        manager = None
         # If there are no (valid) credentials available, let the user log in.
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
-                # refresh token
-                creds.refresh(Request())
+                # refresh token (unless another process sharing the token file did it)
+                manager = CredentialsManager(creds, self.token_file)
+                manager.refresh(force = True)
             else:
                 # create the token by the first time, using the authorization flow
                 if not self.client_secret:
@@ -102,94 +185,463 @@ class GoogleDriveAPI(object):
                     self.SCOPES
                 )
                 creds = flow.run_local_server(port=0)
-            # Save the credentials for the next run
-            with open(self.token_file, 'w') as token:
-                token.write(creds.to_json())
+                creds = ManagedCredentials.from_authorized_user_info(json.loads(creds.to_json()), self.SCOPES)
+                # Save the credentials for the next run
+                token_file = TokenFile(self.token_file)
+                with token_file.lock():
+                    token_file.write(creds.to_json())
+        if manager is None:
+            manager = CredentialsManager(creds, self.token_file)
 
         try:
             service = build('drive', 'v3', credentials=creds)
             self.service = service    # service created!
+            self.creds = creds
         except Exception as e:
             raise Exception(f"{self.name}.init_service failed: {str(e)}")
+        if self.credentials_manager is not None:
+            self.credentials_manager.stop()
+        self.credentials_manager = manager
+        manager.start()
+
+    def stop_service(self):
+        """Stop refreshing the token in the background (see init_service())"""
+        if self.credentials_manager is not None:
+            self.credentials_manager.stop()
+
+    def _thread_http(self):
+        """The httplib2.Http objects used by the service are not thread-safe. This returns
+        one (authorized) Http object for the calling thread, to be passed as in
+        request.execute(http=self._thread_http()) by the code running in worker threads.
+        If there is a pool of identities (see add_service_accounts()), each thread takes the
+        next one, round robin, so the work of the worker threads is spread across them.
+        """
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            creds = self.creds
+            if self.identities:
+                creds = self.identities[next(self._identity_seq) % len(self.identities)]
+            # build_http() sets the timeout, and handles the 308 of the resumable uploads
+            http = build_http()
+            if creds is not None:
+                http = google_auth_httplib2.AuthorizedHttp(creds, http=http)
+            self._local.http = http
+        return http
+
+    def add_service_accounts(self, files = [], subject = ''):
+        """Add service accounts to the pool of identities. The worker threads (see the
+        parameter jobs of sync(), export_tree(), resolve_many(), ...) take an identity each,
+        round robin, so the quota-bound bulk jobs are spread across all of them.
+        If the service is not started yet, it is started with the first identity.
+
+        NOTE: all the identities must have access to the files, e.g. being members of the
+        Shared Drives (see SHARED_PREFIX), as the files created by a worker can be used
+        by another one.
+
+        @param files List of strings. The JSON key files of the service accounts.
+        @param subject (optional) String. A user to impersonate (domain-wide delegation).
+        @return Int. The number of identities in the pool.
+        @raise Exception, if a key file cannot be loaded.
+        """
+        if isinstance(files, str): files = [files]
+        for file in files:
+            try:
+                creds = service_account.Credentials.from_service_account_file(file, scopes=self.SCOPES)
+            except Exception as e:
+                raise Exception(f"{self.name}.add_service_accounts: cannot load '{file}': {str(e)}")
+            if subject:
+                creds = creds.with_subject(subject)
+            self.identities.append(creds)
+
+        if not self.service and self.identities:
+            try:
+                self.service = build('drive', 'v3', credentials=self.identities[0])
+                self.creds = self.identities[0]
+            except Exception as e:
+                raise Exception(f"{self.name}.add_service_accounts failed: {str(e)}")
+        return len(self.identities)
+
+    def _execute(self, request):
+        """Execute a request of the service. Rate limit and server errors are retried with
+        exponential backoff, and a request rejected with 401 is retried once with a new token.
+        This can be called from any thread: out of the main thread, the request goes through
+        the Http object of the calling thread.
+        """
+        try:
+            return self._execute_once(request)
+        except HttpError as e:
+            if e.resp.status != 401 or self.credentials_manager is None:
+                raise
+            # the token expired (or was revoked) meanwhile: refresh it, once for all the
+            # threads, and try again
+            self.credentials_manager.refresh(force = True)
+            return self._execute_once(request)
+
+    def _execute_once(self, request):
+        if threading.current_thread() is threading.main_thread():
+            return request.execute(num_retries=NUM_RETRIES)
+        return request.execute(http=self._thread_http(), num_retries=NUM_RETRIES)
+
+    def _upload(self, request):
+        """Execute a resumable upload request, chunk by chunk. If a bandwidth limiter is set
+        (see set_bandwidth_limit()), each chunk draws its bytes from it before being sent.
+        @return Dict. The response of the request.
+        """
+        if not self.bandwidth:
+            return self._execute(request)
+
+        http = None if threading.current_thread() is threading.main_thread() else self._thread_http()
+        media = request.resumable
+        response = None
+        with self.bandwidth.transfer() as t:
+            while response is None:
+                t.consume(min(media.chunksize(), media.size() - request.resumable_progress))
+                _, response = request.next_chunk(http=http, num_retries=NUM_RETRIES)
+        return response
+
+    def _download(self, request, fh):
+        """Download the media of a request (e.g. get_media(), export_media()) into the file 
+        object fh, chunk by chunk. If a bandwidth limiter is set, each chunk received is 
+        drawn from it, which delays the next one.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            request.http = self._thread_http()
+        downloader = MediaIoBaseDownload(fh, request, 
+            chunksize=CHUNK_SIZE if self.bandwidth else DEFAULT_CHUNK_SIZE)
+        done = False
+        received = 0
+        with (self.bandwidth.transfer() if self.bandwidth else nullcontext()) as t:
+            while not done:
+                status, done = downloader.next_chunk(num_retries=NUM_RETRIES)
+                if t is not None:
+                    progress = status.resumable_progress if status else received
+                    t.consume(progress - received)
+                    received = progress
+
+    def set_bandwidth_limit(self, rate = 0, per_transfer = 0, schedule = None):
+        """Limit the bandwidth used by all the uploads and downloads of this object, in all
+        threads, with fair sharing between the transfers (see _bandwidth.py). It can be called
+        again at any time to change the limits. Use set_bandwidth_limit() to remove them.
+
+        @param rate Int. Global limit in bytes/sec. 0 = unlimited.
+        @param per_transfer Int. Limit for each transfer in bytes/sec. 0 = unlimited.
+        @param schedule (optional) List of tuples ('HH:MM', 'HH:MM', rate), e.g.
+                        [('09:00', '18:00', 1024**2)] limits to 1 MB/s in business hours.
+        @return The BandwidthLimiter, or None if there are no limits.
+        """
+        if not rate and not per_transfer and not schedule:
+            self.bandwidth = None
+        elif self.bandwidth is None:
+            self.bandwidth = BandwidthLimiter(rate, per_transfer, schedule)
+        else:
+            self.bandwidth.set_rate(rate)
+            self.bandwidth.set_per_transfer(per_transfer)
+            self.bandwidth.set_schedule(schedule or [])
+        return self.bandwidth
+
+    def _get(self, fileId = '', fields = ''):
+        """files().get() of some fields of a file. Identical requests made at the same time
+        from several threads share a single call (see SingleFlight).
+        @return Dict. The metadata retrieved.
+        """
+        r = self.inflight.do(('get', fileId, fields),
+            lambda: self._execute(self.service.files().get(fileId=fileId, fields=fields,
+                supportsAllDrives=True)))
+        return dict(r)
+
+    def get_many(self, ids = [], fields = []):
+        """Metadata of many files at once. Only the fields that are not in the metadata cache
+        (see _metacache.py) are requested, once per ID (even if it is repeated), through batch
+        requests of up to BATCH_SIZE files each. The results fill the cache, so the next calls
+        to getMimeTypeById(), getFileNameById(), moveToFolderById(), ... on these files do not
+        make requests, e.g. get_many(ids, ['name', 'mimeType', 'parents']) before moving 1000
+        files takes 10 requests, instead of 3000.
+
+        @param ids List of strings. The file IDs. Or tuples (ID, fields), to ask for different
+                   fields for each file (the fields asked for the same ID are merged).
+        @param fields List, or comma separated string. The fields, e.g. ['name', 'mimeType'].
+        @return Dict. ID -> DriveFile with the fields, or None if the file was not found.
+        """
+        def field_list(fields):
+            if type(fields) is str:
+                fields = [f.strip() for f in fields.split(',')]
+            return [f for f in fields if f and f != 'id']
+
+        # the fields wanted for each ID
+        wanted = {}
+        for fileId in ids:
+            extra = []
+            if type(fileId) is tuple:
+                fileId, extra = fileId[0], field_list(fileId[1])
+            if fileId:
+                wanted[fileId] = list(dict.fromkeys(wanted.get(fileId, []) + field_list(fields) + extra))
+        ids = list(wanted)
+
+        # the fields to request for each ID, merged with what is already cached
+        todo = {}
+        for fileId in ids:
+            todo[fileId] = self.metadata.missing(fileId, wanted[fileId])
+        found = {}
+        todo = {fileId: missing for fileId, missing in todo.items() if missing}
+        if len(todo) == 1:
+            fileId, missing = todo.popitem()
+            found[fileId] = self._get_or_none(fileId, ','.join(['id'] + missing))
+        todo = list(todo.items())
+        for i in range(0, len(todo), BATCH_SIZE):
+            found.update(self._get_batch(todo[i : i + BATCH_SIZE]))
+
+        result = {}
+        for fileId in ids:
+            fields = wanted[fileId]
+            if fileId in found and found[fileId] is None:
+                result[fileId] = None
+                continue
+            if fileId in found:
+                self.metadata.put(fileId, found[fileId])
+            cached = self.metadata.get(fileId, fields)
+            if cached is None:
+                # expired meanwhile (a very short ttl)
+                cached = {f: found.get(fileId, {}).get(f) for f in fields}
+            cached['id'] = fileId
+            result[fileId] = DriveFile(cached)
+        return result
+
+    def _get_or_none(self, fileId = '', fields = ''):
+        """Like _get(), but None if the file does not exist"""
+        try:
+            return self._get(fileId, fields)
+        except HttpError as e:
+            if e.resp.status == 404: return None
+            raise
+
+    def _get_batch(self, todo = []):
+        """files().get() of several files in a single batch request.
+        @param todo List of tuples (fileId, fields).
+        @return Dict. ID -> Dict with the metadata, or None if not found.
+        """
+        results = self._execute_batch([self.service.files().get(fileId=fileId,
+            fields=','.join(['id'] + missing), supportsAllDrives=True) for fileId, missing in todo])
+        found = {}
+        for (fileId, missing), r in zip(todo, results):
+            if isinstance(r, HttpError):
+                if r.resp.status != 404: raise r
+                r = None
+            found[fileId] = r
+        return found
+
+    def _execute_batch(self, requests = []):
+        """Execute several requests (up to BATCH_SIZE) in a single batch request. The ones
+        failing with rate limit, server or token errors are executed again one by one, with
+        backoff (see _execute()).
+        @param requests List of requests, e.g. [self.service.files().get(...), ...].
+        @return List. The response of each request, or the HttpError it failed with.
+        """
+        results = [None] * len(requests)
+        failed = []
+        def callback(request_id, response, exception):
+            i = int(request_id)
+            if exception is None:
+                results[i] = response
+            elif isinstance(exception, HttpError) and (exception.resp.status in (401, 403, 429)
+                or exception.resp.status >= 500):
+                failed.append(i)
+            else:
+                results[i] = exception
 
-    def list_all_files(self, query='', attr=''):
+        batch = self.service.new_batch_http_request(callback=callback)
+        for i, request in enumerate(requests):
+            batch.add(request, request_id=str(i))
+        if threading.current_thread() is threading.main_thread():
+            batch.execute()
+        else:
+            batch.execute(http=self._thread_http())
+        for i in failed:
+            try:
+                results[i] = self._execute(requests[i])
+            except HttpError as e:
+                results[i] = e
+        return results
+
+    def _delete(self, fileId = ''):
+        """Delete a file (or a folder, with all its content) by ID"""
+        self._execute(self.service.files().delete(fileId=fileId, supportsAllDrives=True))
+        self.metadata.invalidate(fileId)
+
+    def list_all_files(self, query='', attr='', drive='', index_md5 = False):
         """Based in the code from: https://developers.google.com/drive/api/v3/search-files
         Reference: https://developers.google.com/drive/api/v3/reference/files/list
 
         @param query             String. The query to search files for, e.g. "name='foo.txt'"
         @param fields (optional) List. A list of metadata attributes to be retrieved, e.g. ['name', 'size', 'mimeType']
-        @return On success, a list of dictionaries describing each file found, as retrieved by the method service.files().list().
-                If not found, retrieves [].
+        @param drive (optional)  String. Where to search: 'root' (My Drive), the ID of a Shared Drive,
+                                 or '' (all the drives accessible by the user).
+        @param index_md5 (optional) Bool. Add the files found to md5_index (see upload_file(dedup=True)).
+        @return On success, a list of DriveFile (see _records.py) describing each file found, as retrieved by the 
+                method service.files().list(). If not found, retrieves [].
         """
 
         if not self.service or not query: return
 
-        data = []
+        # identical listings running at the same time in several threads share a single
+        # call (see SingleFlight). The list is copied, as the callers could modify it.
+        key = ('list', query, tuple(attr) if type(attr) is list else None, drive, index_md5)
+        return list(self.inflight.do(key, lambda: list(self.iter_all_files(query=query, attr=attr, drive=drive,
+            index_md5=index_md5))))
+
+    def iter_all_files(self, query='', attr='', drive='', index_md5 = False):
+        """Like list_all_files(), but yielding the files page by page, as they are retrieved.
+        This allows to process huge listings in constant memory.
+
+        @param query             String. The query to search files for, e.g. "name='foo.txt'"
+        @param attr (optional)   List. A list of metadata attributes to be retrieved (see FIELDS in _records.py)
+        @param drive (optional)  String. See list_all_files().
+        @param index_md5 (optional) Bool. See list_all_files().
+        @return A generator of DriveFile.
+        """
+        if not self.service or not query: return
+
+        if not attr or not (type(attr) is list):
+            attr = FIELDS['default']
+        req_fields = list_fields(attr)
+
+        # the corpus to search in: searching a single drive is faster than all of them
+        if drive == ROOT_ID:
+            corpora = {'corpora': 'user'}
+        elif drive:
+            corpora = {'corpora': 'drive', 'driveId': drive}
+        else:
+            corpora = {'corpora': 'allDrives'}
+
         page_token = None
         while True:
-            if not attr or not (type(attr) is list):
-                req_fields = 'nextPageToken, files(id, name, mimeType, parents)'
-            else:
-                req_fields = 'nextPageToken, files(' + ','.join(attr) + ')'
-
             #print("query:", query)
-            response = self.service.files().list(
+            response = self._execute(self.service.files().list(
                 q = query,
-                pageSize = 20,       # The maximum number of files to return per page. Partial or empty result pages are possible 
-                                     # even before the end of the files list has been reached. Acceptable values are 1 to 1000, inclusive. 
-                                     # (Default: 100)
-                spaces = 'drive',    # A comma-separated list of spaces to query within the corpus. Supported values are 'drive', 
-                                     # 'appDataFolder' and 'photos'.
+                pageSize = PAGE_SIZE,  # The maximum number of files to return per page. Partial or empty result pages are possible 
+                                       # even before the end of the files list has been reached. Acceptable values are 1 to 1000, inclusive. 
+                                       # (Default: 100)
+                spaces = 'drive',      # A comma-separated list of spaces to query within the corpus. Supported values are 'drive', 
+                                       # 'appDataFolder' and 'photos'.
                 fields = req_fields,
-                pageToken = page_token
-                ).execute()
+                pageToken = page_token,
+                supportsAllDrives = True,
+                includeItemsFromAllDrives = True,
+                **corpora
+                ))
 
-            n_max = 20     # LIMIT to n_max items ............. QUIT LATER!!!
             for file in response.get('files', []):
-                data.append(file)
-
-                if n_max == 0: break
-                n_max -= 1
+                file = DriveFile(file)
+                if index_md5: self._index_md5(file)
+                yield file
 
             page_token = response.get('nextPageToken', None)
             if page_token is None:
                 break
 
-        return data
-
     def list_directory(self, path = '', attr=[], fileId=''):
         """List the content of a directory. The paths '/', and '' (empty) are allowed to refer
         to the root folder.
         @param path String. The path to scan for.
         @param fileId (optional) String. If given, this overwrites path.
         @param attr (optional) List. The attributes to be retrieved for the entries.
-        @return A list of dicts, each containing basic attributes for the entry ('name', 'id',
-                'mimeType','size','modifiedTime','parents')
+        @return A list of DriveFile, each containing basic attributes for the entry ('name', 'id',
+                'mimeType','size','modifiedTime','parents','md5Checksum')
         @raise Exception, if the path does not exist, or it is not a directory.
         """
-        if not self.service:
-            raise Exception(f"{self.name}.list_directory: API service not started")
+        parentId, drive = self._directory(path, fileId, 'list_directory')
+        return self.list_all_files(query=f"'{parentId}' in parents", attr=attr or FIELDS['listing'],
+            drive=drive)
 
-        if not fileId:
-            ROOT_ID = "root"
-            if not path or path == '/':
-                parentId = ROOT_ID
-            else:
-                parent = self.getFileId(path, attr=['mimeType'])
-                if not parent:
-                    raise Exception(f"{self.name}.list_directory: File not found: '{path}'")
-                elif parent.get('mimeType','') != MIME_TYPE_FOLDER:
-                    raise Exception(f"{self.name}.list_directory: It is not a directory: '{path}'")
-                parentId = parent['id']
-        else:
-            parentId = fileId
+    def iter_directory(self, path = '', attr=[], fileId='', index_md5 = False):
+        """Like list_directory(), but yielding the entries page by page, as they are retrieved
+        (see iter_all_files()), so a huge folder is listed in constant memory.
+        """
+        parentId, drive = self._directory(path, fileId, 'iter_directory')
+        yield from self.iter_all_files(query=f"'{parentId}' in parents", attr=attr or FIELDS['listing'],
+            drive=drive, index_md5=index_md5)
 
-        query = f"'{parentId}' in parents"
-        if not attr:
-            # basic metadata
-            attr = attr=['name','id','mimeType', 'size', 'modifiedTime','parents']
+    def _directory(self, path = '', fileId = '', method = ''):
+        """The ID of the folder to be listed by list_directory(), and the drive to search in
+        @return Tuple (folderId, drive).
+        @raise Exception, if the path does not exist, or it is not a directory.
+        """
+        if not self.service:
+            raise Exception(f"{self.name}.{method}: API service not started")
+        if fileId:
+            return fileId, ''
+        if not path or path == '/':
+            return ROOT_ID, ROOT_ID
+        parent = self.getFileId(path, attr=FIELDS['type'], prefer_folder=True)
+        if not parent:
+            raise Exception(f"{self.name}.{method}: File not found: '{path}'")
+        elif parent.get('mimeType','') != MIME_TYPE_FOLDER:
+            raise Exception(f"{self.name}.{method}: It is not a directory: '{path}'")
+        return parent['id'], self._split_root(path)[0]
+
+    def walk(self, path = '', max_recursion_level = 10, jobs = 4, attr = []):
+        """Walk recursively a remote folder, yielding its entries as they are listed, in
+        constant memory (apart from the folders still to be listed). The folders are listed
+        by <jobs> threads at the same time, so the order of the entries is not defined.
+
+        @param path String. The remote folder. '/' or '' is the root folder.
+        @param max_recursion_level Int. Max recursion level to look into it. Default 10.
+        @param jobs (optional) Int. Number of folders listed at the same time. Default 4.
+        @param attr (optional) List. The attributes to be retrieved (see FIELDS). 'name' and
+                    'mimeType' are always retrieved.
+        @return A generator of tuples (path, DriveFile), with the path of each entry
+                relative to <path>, e.g. 'folder/foo.txt'.
+        @raise Exception, if the path does not exist, or it is not a directory.
+        """
+        if not self.service:
+            raise Exception(f"{self.name}.walk: API service not started")
 
-        return self.list_all_files(query=query, attr=attr)
+        if not path or path == '/':
+            folderId = ROOT_ID
+        else:
+            r = self.getFileId(path, attr=FIELDS['type'], prefer_folder=True)
+            if not r:
+                raise Exception(f"{self.name}.walk: File not found: '{path}'")
+            elif r.get('mimeType') != MIME_TYPE_FOLDER:
+                raise Exception(f"{self.name}.walk: It is not a directory: '{path}'")
+            folderId = r['id']
+        attr = list(attr or FIELDS['listing'])
+        attr += [a for a in ('id', 'name', 'mimeType') if a not in attr]
+
+        # the listings are passed through a bounded queue, so a slow consumer stops them
+        entries = queue.Queue(maxsize=PAGE_SIZE)
+        done = object()
+
+        def list_folder(folderId, prefix, level):
+            try:
+                for file in self.iter_all_files(query=f"'{folderId}' in parents", attr=attr):
+                    entries.put((prefix + file.get('name', '').replace('/', '\\/'), file, level))
+            finally:
+                entries.put((done, None, None))
+
+        pool = ThreadPoolExecutor(max_workers=max(1, jobs))
+        try:
+            futures = [pool.submit(list_folder, folderId, '', 1)]
+            pending = 1
+            while pending:
+                path, file, level = entries.get()
+                if path is done:
+                    pending -= 1
+                    continue
+                if file.get('mimeType') == MIME_TYPE_FOLDER and level < max_recursion_level:
+                    futures.append(pool.submit(list_folder, file['id'], path + '/', level + 1))
+                    pending += 1
+                yield path, file
+            for future in futures:
+                # raise the errors of the listings
+                future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            # unblock the listings still running
+            while any(not f.done() for f in futures):
+                try:
+                    entries.get(timeout=0.1)
+                except queue.Empty:
+                    pass
 
     def list_folders(self, name = '', parentId = ''):
         """List all folders with a specific name. To look sub-folders into a specific 
@@ -199,7 +651,6 @@ class GoogleDriveAPI(object):
 
         if not self.service: return
 
-        ROOT_ID = 'root'
         query = f"mimeType='{self.MIME_TYPE_FOLDER}'"
         if name: query += f" and name='{name}'"
         if parentId and parentId != '/':
@@ -225,7 +676,6 @@ class GoogleDriveAPI(object):
             # removing dealing '/'
             if name[0] == '/': name = name[1:]
             query += f" and name='{name}'"
-        ROOT_ID = 'root'
         if parentId and parentId != '/':
             query += f" and '{parentId}' in parents"
         else:
@@ -246,8 +696,7 @@ class GoogleDriveAPI(object):
         for file in files:
             ans = input(f"delete \'{file['name']}\' [y]es/[n]o/[c]ancel? This action cannot be undone: ")
             if ans.upper() == 'Y':
-                id = file['id']
-                self.service.files().delete(fileId=id).execute()
+                self._delete(file['id'])
             elif ans.upper() == 'C':
                 break
 
@@ -282,23 +731,27 @@ class GoogleDriveAPI(object):
         if prompt:
             ans = input(f"delete '{path}' [y]es/[n]o? This action cannot be undone: ")
             if ans.upper() == 'Y':
-                self.service.files().delete(fileId=fileId).execute()
+                self._delete(fileId)
         else:
-            self.service.files().delete(fileId=fileId).execute()
+            self._delete(fileId)
 
     def upload_file(self, origin = '', filename = '', originMimeType = '', destMimeType = '',
-        dest = ''):
+        dest = '', dedup = False, folderId = ''):
         """Upload a file from the local machine up to Drive.
         The file will have the new name <filename> if given, or else the same
         name as in origin.
-        If <dest> is passed, the uploaded file will be moved to that folder. Otherwise,
-        the file will remain in the root folder of Drive.
+        If <dest> is passed, the file is uploaded into that folder (it can be into a Shared
+        Drive, e.g. 'shared:TeamName/folder'). Otherwise, or if <dest> does not exist, the 
+        file is uploaded into the root folder of Drive.
 
         @param origin String. The path of the file to be uploaded, e.g. 'path/to/file/foo.txt'
         @param originMimeType String. The MIME type of the uploaded file, e.g. 'text/csv'
         @param filename (optional) String. The name to be given to the new file into Drive.
         @param destMimeType (optonal) String. The MIME type to the uploaded file, e.g. MIME_TYPE_DOCUMENT, etc.
         @param dest (optional) String. The folder to move the uploaded the file in the destination.
+        @param dedup (optional) Bool. If True, and a remote file with the same MD5 is known
+                     (see md5_index), make a server-side copy of it instead of sending the bytes.
+        @param folderId (optional) String. The ID of the destination folder, instead of <dest>.
         @return String. The uploaded file ID.
         """
 
@@ -311,88 +764,205 @@ class GoogleDriveAPI(object):
         elif not (os.stat(origin).st_mode & stat.S_IRUSR):
             raise Exception(f"{self.name}.upload_file: File is not readable (check permissions)")
 
+        if dest and not folderId:
+            folderId = self.getFileId(dest, prefer_folder=True)
+
+        md5 = ''
+        if dedup and (folderId or not dest):
+            md5 = self._md5_file(origin)
+            fileId = self._copy_by_md5(md5, filename, folderId or ROOT_ID, os.path.getsize(origin))
+            if fileId:
+                return fileId
+
         file_metadata = {
             'name': filename,
         }
         if destMimeType: file_metadata['mimeType'] = destMimeType
+        if folderId:
+            # created directly into the destination: there is no need to move it later, and
+            # the service accounts (which have no storage of their own) can upload into a 
+            # Shared Drive
+            file_metadata['parents'] = [folderId]
         media = MediaFileUpload(
             origin,
             #mimetype='text/csv',
             mimetype=originMimeType,
+            chunksize=CHUNK_SIZE if self.bandwidth else DEFAULT_CHUNK_SIZE,
             resumable=True)
-        file = self.service.files().create(
+        file = self._upload(self.service.files().create(
             body=file_metadata,
             media_body=media,
-            fields='id').execute()
+            fields='id',
+            supportsAllDrives=True))
 
         fileId = file.get('id')
-        if fileId and dest:
-            folderId = self.getFileId(dest)
-            if folderId:
-                self.moveToFolderById(fileId, folderId)
+        if fileId and md5 and not destMimeType:
+            # next uploads of the same content can be copied from this one
+            self._remember_md5(md5, fileId)
 
         return fileId
 
-    def searchFile(self, path = ''):
+    def download_file(self, fileId = '', local_path = ''):
+        """Download a file from Drive to the local machine. The content is written into
+        '<local_path>.part' first, and renamed when complete.
+        Google-native documents (Docs, Sheets, ...) cannot be downloaded, see export_tree().
+
+        @param fileId String. The ID of the file (see getFileId()).
+        @param local_path String. The path of the local file to be written.
+        @return Int. The size of the file downloaded.
+        @raise Exception, if the file is a folder or a Google-native document.
+        """
+        if not fileId or not local_path: return
+
+        file = self._get(fileId, 'name, mimeType, size')
+        if file.get('mimeType') == MIME_TYPE_FOLDER:
+            raise Exception(f"{self.name}.download_file: '{file.get('name')}' is a folder")
+        elif 'size' not in file:
+            raise Exception(f"{self.name}.download_file: '{file.get('name')}' is a Google document, use export_tree()")
+
+        tmp = local_path + '.part'
+        with open(tmp, 'wb') as fh:
+            self._download(self.service.files().get_media(fileId=fileId, supportsAllDrives=True), fh)
+        os.replace(tmp, local_path)
+        return int(file['size'])
+
+    def _md5_file(self, path = ''):
+        """MD5 (hex digest) of a local file, as the md5Checksum computed by Drive"""
+        h = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _index_md5(self, file):
+        """Remember the md5Checksum of a remote file seen in a listing, see upload_file(dedup=True)"""
+        md5 = file.get('md5Checksum')
+        if md5 and file.get('id'):
+            self._remember_md5(md5, file['id'])
+
+    def _remember_md5(self, md5, fileId):
+        """Add an entry to md5_index, dropping the oldest ones beyond MD5_INDEX_MAX_ENTRIES"""
+        with self._dedup_lock:
+            self.md5_index[md5] = fileId
+            self.md5_index.move_to_end(md5)
+            while len(self.md5_index) > MD5_INDEX_MAX_ENTRIES:
+                self.md5_index.popitem(last=False)
+
+    def _copy_by_md5(self, md5 = '', filename = '', folderId = '', size = 0):
+        """Auxiliary function to upload_file(). If a remote file with the given MD5 is known,
+        make a server-side copy of it named <filename> into the folder <folderId>.
+        @return String. The ID of the copy, or '' if no copy was done.
+        """
+        srcId = self.md5_index.get(md5)
+        if not srcId or not folderId: return ''
+
+        try:
+            file = self._execute(self.service.files().copy(
+                fileId=srcId,
+                body={'name': filename, 'parents': [folderId]},
+                fields='id',
+                supportsAllDrives=True))
+        except HttpError as e:
+            if e.resp.status != 404: raise
+            # the source was removed since it was indexed. Several workers can get here with
+            # the same entry, or another one can have indexed a new source meanwhile
+            with self._dedup_lock:
+                if self.md5_index.get(md5) == srcId:
+                    self.md5_index.pop(md5, None)
+            return ''
+
+        with self._dedup_lock:
+            self.dedup_stats['copies'] += 1
+            self.dedup_stats['bytes_saved'] += size
+        print(f"== copied '{filename}' from remote file with the same content ({size} bytes saved)")
+        return file.get('id', '')
+
+    def build_md5_index(self, path = '', max_recursion_level = 10):
+        """Add to md5_index all the files under a remote folder (recursively), so that
+        upload_file(dedup=True) and sync(dedup=True) can copy from them. Only these listings,
+        and the ones of sync(dedup=True), fill md5_index; it keeps up to MD5_INDEX_MAX_ENTRIES.
+        E.g. build_md5_index('/backups') before syncing into '/backups/2021-08-30'.
+
+        @param path String. The remote folder. '/' or '' is the root folder.
+        @param max_recursion_level Int. Max recursion level to look into it. Default 10.
+        @return Int. The number of entries in md5_index.
+        """
+        if not path or path == '/':
+            folderId = ROOT_ID
+        else:
+            folderId = self.getFileId(path, prefer_folder=True)
+            if not folderId:
+                raise Exception(f"{self.name}.build_md5_index: File not found: '{path}'")
+
+        folders = [(folderId, 1)]
+        while folders:
+            folderId, level = folders.pop()
+            for file in self.iter_directory(fileId = folderId, attr = FIELDS['md5'], index_md5 = True):
+                if file.get('mimeType') == MIME_TYPE_FOLDER and level < max_recursion_level:
+                    folders.append((file['id'], level + 1))
+        return len(self.md5_index)
+
+    def searchFile(self, path = '', prefer_folder = False):
         """This is shorcut method to getFileId, with a predefined set of attributes
         @param path String. The path to search for.
-        @return Metadata (dict) of the file, or {} if not found.
+        @param prefer_folder (optional) Bool. See getFileId().
+        @return Metadata (DriveFile) of the file, or {} if not found.
         """
-        return self.getFileId(path, attr=['id', 'name', 'size', 'mimeType', 'modifiedTime', 'parents', 'md5Checksum'])
+        return self.getFileId(path, attr=FIELDS['listing'], prefer_folder=prefer_folder)
     
-    def getFileId(self, path='', attr=[]):
+    def getFileId(self, path='', attr=[], prefer_folder = False):
         """Get the file ID from a Drive path, e.g.: dir1/dir2/file.txt.
         Normally, this method returns only the ID of the file. But if you set a list
         of attributes (e.g. attr = ['mimeType', 'size']), then those attributes (plus the ID)
-        will be appended to the response and returned as in by the method get().
+        are requested in the lookup of the last path component, and returned as a DriveFile
+        (no additional call to the method get()).
 
         NOTE: if the name contains '/', you must escape it with '\/' 
         e.g. 'file/a' -> 'file\/a'
 
+        The paths into a Shared Drive start with SHARED_PREFIX and the name of the drive,
+        e.g. 'shared:TeamName/dir1/file.txt'. The path 'shared:TeamName' is the drive itself.
+
         @param path String. The path of the Drive file to be located.
         @param attr (optional) List. A list of attributes to be retrieved if success.
+        @param prefer_folder (optional) Bool. If several files have the last name of the path, choose
+                    a folder among them (the intermediate names are always resolved to folders).
         @return     If no attr is passed, returns the ID of the file on success, or an empty string 
                     on failure.
-                    If attr is passed, return a dict of attributes on success, or {} on failure.
+                    If attr is passed, return a DriveFile of attributes on success, or {} on failure.
+        @raise Exception, if the Shared Drive does not exist.
         """
 
-        # remove dealing '/', e.g. '/path/to/my/folder'
-        if path[0] == '/': path = path[1:]
-        if not path: return
-
-        # recognizing the escape character \/
-        # bug 2021.08.1
-        # as wildcard ('*') is not allowed in a file name, we will replace
-        # temporarily the '\/' by '*', then split by '/' and newly 
-        # replace back '*' by '/'
-        if '*' in path:
-            raise Exception(f"{self.name}.getFileId: path cannot contain wildcard characters ('*')")
-        path = path.replace("\\/", '*')    # using "\\/" to avoid ambiguity
-
-        folders = path.split('/')
-        if folders[-1] == '':
-            # if the path is ended with '/', e.g. 'path/to/my/folder/'
-            folders = folders[:-1]
-        if not folders: return
-        parentId = "root"                 # start search in the root folder
-        for folder in folders:            # descend through each folder in the path
-            # converting '*' into '/'
-            folder = folder.replace("*", "/")
+        rootId, folders = self._split_root(path)
+        if not folders:
+            if rootId == ROOT_ID: return
+            # the root folder of a Shared Drive has the ID of the drive
+            if not attr: return rootId
+            return DriveFile({'id': rootId, 'name': self._split_path(path[len(SHARED_PREFIX):])[0],
+                'mimeType': MIME_TYPE_FOLDER})
+        # only the last lookup retrieves the requested attributes
+        last_attr = FIELDS['lookup'] + [a for a in (attr or []) if a != 'id']
+        parentId = rootId                 # start search in the root folder
+        file = None
+        for i, folder in enumerate(folders):     # descend through each folder in the path
             if not parentId: 
                 # not found
                 return '' if not attr else {}
-            q = f"name='{folder}' and '{parentId}' in parents"
+            q = f"name={self._quote(folder)} and '{parentId}' in parents"
             
             # === debug ===
             #print(q)
-            r = self.list_all_files(query=q, attr='id')
+            r = self.list_all_files(query=q, 
+                attr=last_attr if i == len(folders) - 1 else FIELDS['lookup'], drive=rootId)
             
             # === debug ===
             #pprint(r)
 
             if r:
-                # by the next iteration, take the current folder as the parent
-                parentId = r[0].get('id', '')
+                # by the next iteration, take the current folder as the parent. Among
+                # several files with the same name, the choice is deterministic
+                file = self._pick(r, prefer_folder = prefer_folder or i < len(folders) - 1)
+                parentId = file.get('id', '')
             else:
                 parentId = ''
 
@@ -401,15 +971,174 @@ class GoogleDriveAPI(object):
             return '' if not attr else {}
 
         # if not attr are given, return only the file ID. Otherwise, return
-        # a dict of attributes (as retrived by the API method get())
+        # the DriveFile of attributes retrieved by the last lookup
         if not attr:
             return parentId
         else:
-            fields = 'id'
-            for a in attr:
-                fields += f", {a}"
-            r = self.service.files().get(fileId=parentId, fields=fields).execute()
-            return r
+            return file
+
+    def _split_path(self, path = ''):
+        """Split a Drive path into its names, e.g. '/path/to/my/folder/' -> ['path','to','my','folder'].
+
+        NOTE: if the name contains '/', it must be escaped with '\/' 
+        e.g. 'file/a' -> 'file\/a'
+
+        @param path String. The path.
+        @return List of names. [] for the root folder.
+        @raise Exception, if the path contains wildcard characters.
+        """
+        # remove dealing '/', e.g. '/path/to/my/folder'
+        if path and path[0] == '/': path = path[1:]
+        if not path: return []
+
+        # recognizing the escape character \/
+        # bug 2021.08.1
+        # as wildcard ('*') is not allowed in a file name, we will replace
+        # temporarily the '\/' by '*', then split by '/' and newly 
+        # replace back '*' by '/'
+        if '*' in path:
+            raise Exception(f"{self.name}.getFileId: path cannot contain wildcard characters ('*')")
+        path = path.replace("\\/", '*')    # using "\\/" to avoid ambiguity
+
+        folders = path.split('/')
+        if folders[-1] == '':
+            # if the path is ended with '/', e.g. 'path/to/my/folder/'
+            folders = folders[:-1]
+        # converting '*' into '/'
+        return [folder.replace("*", "/") for folder in folders]
+
+    def _split_root(self, path = ''):
+        """Split a Drive path into the ID of its root folder, and the names under it, e.g.
+        '/path/to/folder' -> ('root', ['path','to','folder']) and
+        'shared:TeamName/path/to/folder' -> (<ID of the Shared Drive TeamName>, ['path','to','folder'])
+        @return Tuple (rootId, list of names).
+        @raise Exception, if the Shared Drive does not exist.
+        """
+        if not path or not path.startswith(SHARED_PREFIX):
+            return ROOT_ID, self._split_path(path)
+        names = self._split_path(path[len(SHARED_PREFIX):])
+        if not names:
+            raise Exception(f"{self.name}: Missing the Shared Drive name: '{path}'")
+        return self._drive_id(names[0]), names[1:]
+
+    def _drive_id(self, name = ''):
+        """The ID of a Shared Drive, given its name. The IDs are cached.
+        @raise Exception, if there is no Shared Drive with that name.
+        """
+        driveId = self._drives.get(name)
+        if driveId: return driveId
+
+        drives = self.inflight.do(('drives', name), lambda: self._execute(self.service.drives().list(
+            q = f"name={self._quote(name)}",
+            fields = 'drives(id, name)',
+            pageSize = 100)).get('drives', []))
+        if not drives:
+            raise Exception(f"{self.name}: Shared Drive not found: '{name}'")
+        # the names of the Shared Drives are not unique, take the lowest ID
+        driveId = min(d['id'] for d in drives)
+        self._drives[name] = driveId
+        return driveId
+
+    def _quote(self, value = ''):
+        """Quote a string to be used into a query, e.g. "it's" -> "'it\\'s'" """
+        return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+    def _pick(self, files = [], prefer_folder = False):
+        """Choose one file among several ones with the same name (Drive allows that), in a
+        deterministic way: the folders first (if prefer_folder), then the oldest, then the 
+        lowest ID. The files should have the attribute 'createdTime'.
+        @return The chosen file, or None if files is empty.
+        """
+        if not files: return None
+        return min(files, key=lambda f: (
+            prefer_folder and f.get('mimeType') != MIME_TYPE_FOLDER,
+            f.get('createdTime', ''),
+            f.get('id', '')))
+
+    def resolve_many(self, paths = [], attr = [], jobs = 4):
+        """Resolve many Drive paths at once (like getFileId() for each one), with much fewer requests.
+        The paths are arranged in a tree, so each shared folder is resolved only once, and all the
+        requested children of a folder are looked up together, with queries like
+        "'<folderId>' in parents and (name='a' or name='b' or ...)" (split in several queries
+        if there are too many names, see MAX_NAMES_PER_QUERY).
+        If several files have the same name, the choice is deterministic (see _pick()), and
+        a folder is preferred when the path goes on beyond that name.
+
+        E.g. resolve_many(['a/b/foo.txt', 'a/b/bar.txt', 'a/c']) takes 3 requests.
+
+        @param paths List of strings. The paths to be located (the '\/' escape is recognized).
+        @param attr (optional) List. A list of attributes to be retrieved for the files found.
+        @param jobs (optional) Int. Number of queries run at the same time. Default 4.
+        @return A dict {path: result}. The result is like in getFileId(): the ID or '' if not found;
+                or a DriveFile or {} if not found, if attr is passed.
+        """
+        def new_node(drive):
+            return {'children': {}, 'file': None, 'drive': drive}
+
+        # the tree of names, one for each root (My Drive and the Shared Drives)
+        roots = {}
+        nodes = {}
+        for path in paths:
+            rootId, names = self._split_root(path)
+            node = roots.get(rootId)
+            if node is None:
+                node = roots[rootId] = new_node(rootId)
+                node['file'] = DriveFile({'id': rootId, 'mimeType': MIME_TYPE_FOLDER})
+            for name in names:
+                node = node['children'].setdefault(name, new_node(rootId))
+            nodes[path] = node
+
+        fields = ['id', 'name', 'mimeType', 'createdTime'] + [a for a in attr 
+            if a not in ('id', 'name', 'mimeType', 'createdTime')]
+
+        def lookup(parentId, names, drive):
+            q = f"'{parentId}' in parents and (" + \
+                ' or '.join(f"name={self._quote(name)}" for name in names) + ")"
+            return self.list_all_files(query=q, attr=fields, drive=drive)
+
+        # descend level by level
+        level = list(roots.values())
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            while level:
+                tasks = []
+                for node in level:
+                    names = sorted(node['children'])
+                    for chunk in self._chunk_names(names):
+                        tasks.append((node, chunk, pool.submit(lookup, node['file']['id'], chunk, node['drive'])))
+                level = []
+                for node, chunk, future in tasks:
+                    found = {}
+                    for file in future.result():
+                        found.setdefault(file.get('name'), []).append(file)
+                    for name in chunk:
+                        child = node['children'][name]
+                        child['file'] = self._pick(found.get(name, []), 
+                            prefer_folder = bool(child['children']))
+                        if (child['children'] and child['file'] is not None and 
+                            child['file'].get('mimeType') == MIME_TYPE_FOLDER):
+                            level.append(child)
+
+        result = {}
+        for path, node in nodes.items():
+            file = node['file']
+            if not attr:
+                result[path] = file['id'] if file is not None else ''
+            else:
+                result[path] = file if file is not None else {}
+        return result
+
+    def _chunk_names(self, names = []):
+        """Split a list of names in chunks small enough to be looked up in a single query"""
+        chunk, length = [], 0
+        for name in names:
+            size = len(name) + 12       # " or name='...'"
+            if chunk and (len(chunk) >= MAX_NAMES_PER_QUERY or length + size > MAX_QUERY_LENGTH):
+                yield chunk
+                chunk, length = [], 0
+            chunk.append(name)
+            length += size
+        if chunk:
+            yield chunk
 
     def getMimeTypeById(self, fileId = ''):
         """Get the MIME type of the file, given its ID
@@ -418,10 +1147,7 @@ class GoogleDriveAPI(object):
         @return String. The MIME type.
         """
         if not fileId: return None
-        file = self.service.files().get(
-            fileId=fileId,
-            fields='mimeType'
-            ).execute()
+        file = self.get_many([fileId], ['mimeType'])[fileId]
         if file:
             return file.get('mimeType')
         else:
@@ -434,24 +1160,29 @@ class GoogleDriveAPI(object):
         @return String. The file name.
         """
         if not fileId: return None
-        file = self.service.files().get(
-            fileId=fileId,
-            fields='name'
-            ).execute()
+        file = self.get_many([fileId], ['name'])[fileId]
         if file:
             return file.get('name')
         else:
             return None
 
-    def moveToFolderById(self, fileId = '', folderId = ''):
+    def moveToFolderById(self, fileId = '', folderId = '', parents = None, check_folder = True):
         """Move a file to a folder into Drive.
         https://developers.google.com/drive/api/v3/folder#python
 
         By using this in conjunction with getFileId, you can build sentences like
         -  API.moveToFolder(API.getFileId('foo.txt'), API.getFileId('path/to/move'))
 
+        The current parents of the file and the type of the destination are needed before
+        moving: they are taken from the arguments if known (e.g. from a listing), else from
+        the metadata cache (see get_many()), else requested (together, in a single request).
+        So, with both known, moving a file takes a single request. See also move_many().
+
         @param fileId   String. The ID of the file to be moved (see method getFileId()).
         @param folderId String. The ID of the folder to which move the file.
+        @param parents  (optional) List of strings. The current parents of the file, if known.
+        @param check_folder (optional) Bool. Verify that the destination is a folder. Pass
+                        False if it is already known.
         @return None
         """
         if not fileId or not folderId: 
@@ -459,41 +1190,130 @@ class GoogleDriveAPI(object):
             return
 
         drive_service = self.service
+        wanted = []
+        if check_folder:
+            wanted.append((folderId, ['mimeType']))
+        if parents is None:
+            wanted.append((fileId, ['parents']))
+        found = self.get_many(wanted) if wanted else {}
         # verifying the destination in a folder
-        folder = drive_service.files().get(
-            fileId=folderId,
-            fields='mimeType'
-            ).execute()
-        if folder.get('mimeType') != MIME_TYPE_FOLDER:
-            raise Exception(f"{self.name}.moveToFolderById: Destination is not a MIME type folder")
-
-        # Retrieve the existing parents to remove
-        file = drive_service.files().get(
-            fileId=fileId,
-            fields='parents'
-            ).execute()
-        previous_parents = ",".join(file.get('parents'))
+        if check_folder:
+            folder = found[folderId]
+            if not folder or folder.get('mimeType') != MIME_TYPE_FOLDER:
+                raise Exception(f"{self.name}.moveToFolderById: Destination is not a MIME type folder")
+        if parents is None:
+            if not found[fileId]:
+                raise Exception(f"{self.name}.moveToFolderById: File not found '{fileId}'")
+            parents = found[fileId].get('parents') or []
         # Move the file to the new folder
-        file = drive_service.files().update(
+        file = self._execute(drive_service.files().update(
             fileId=fileId,
             addParents=folderId,
-            removeParents=previous_parents,
-            fields='id, parents'
-            ).execute()
+            removeParents=",".join(p for p in parents if p != folderId),
+            fields='id, parents',
+            supportsAllDrives=True
+            ))
+        self.metadata.put(fileId, {'parents': file.get('parents')})
 
     def moveToFolder(self, filename='', foldername=''):
         """Move a file to a folder, but using paths instead of ID's.
         E.g.: moveToFolder('foo.txt', 'path/to/move')
+        Both paths are resolved together (see resolve_many()), with the parents and types
+        needed by the move, so nothing else is requested before it.
 
         @param filename   String. The name of the file to be moved.
         @param foldername String. The name of the folder to which move the file.
         @return None
         """
         if not filename or not foldername: return
-        fileId   = self.getFileId(filename)
-        folderId = self.getFileId(foldername)
-        if not fileId or not folderId: return        # not found
-        self.moveToFolderById(fileId, folderId)
+        found = self.resolve_many([filename, foldername], attr=['parents'])
+        file, folder = found[filename], found[foldername]
+        if not file or not folder: return       # not found
+        if folder.get('mimeType') != MIME_TYPE_FOLDER:
+            raise Exception(f"{self.name}.moveToFolder: Destination is not a MIME type folder")
+        self.moveToFolderById(file['id'], folder['id'], parents = file.get('parents') or [],
+            check_folder = False)
+
+    def move_many(self, file_ids = [], folder_id = '', parents = None):
+        """Move many files into a folder, with batch requests of up to BATCH_SIZE moves each.
+        The current parents of the files are taken from <parents> if known (e.g. from a
+        listing), else from the metadata cache, else requested in batches too (see get_many()).
+        So moving 1000 files takes 10 requests (20 if their parents are not known).
+
+        @param file_ids List of strings. The IDs of the files (or folders) to be moved.
+        @param folder_id String. The ID of the destination folder.
+        @param parents (optional) Dict. ID -> list of the current parents, for the files they
+                       are known.
+        @return Int. The number of files moved.
+        @raise Exception, if the destination is not a folder, or some files could not be
+               moved (the other ones are moved anyway).
+        """
+        if not file_ids or not folder_id: return 0
+
+        folder = self.get_many([folder_id], ['mimeType'])[folder_id]
+        if not folder or folder.get('mimeType') != MIME_TYPE_FOLDER:
+            raise Exception(f"{self.name}.move_many: Destination is not a MIME type folder")
+
+        parents = dict(parents or {})
+        errors = []
+        unknown = [fileId for fileId in file_ids if fileId not in parents]
+        if unknown:
+            for fileId, file in self.get_many(unknown, ['parents']).items():
+                if file is None:
+                    errors.append(f"not found '{fileId}'")
+                else:
+                    parents[fileId] = file.get('parents') or []
+
+        # the files already there (only) are skipped
+        todo = [fileId for fileId in dict.fromkeys(file_ids)
+            if fileId in parents and parents[fileId] != [folder_id]]
+        moved = 0
+        for i in range(0, len(todo), BATCH_SIZE):
+            chunk = todo[i : i + BATCH_SIZE]
+            results = self._execute_batch([self.service.files().update(
+                fileId=fileId,
+                addParents=folder_id,
+                removeParents=",".join(p for p in parents[fileId] if p != folder_id),
+                fields='id, parents',
+                supportsAllDrives=True) for fileId in chunk])
+            for fileId, r in zip(chunk, results):
+                if isinstance(r, HttpError):
+                    errors.append(f"'{fileId}': {str(r)}")
+                    self.metadata.invalidate(fileId, ['parents'])
+                else:
+                    self.metadata.put(fileId, {'parents': r.get('parents')})
+                    moved += 1
+        if errors:
+            raise Exception(f"{self.name}.move_many: {len(errors)} files could not be moved: " +
+                '; '.join(errors[:10]))
+        return moved
+
+    def move_tree(self, source = '', dest = ''):
+        """Move all the content of a folder into another folder (e.g. to reorganize an
+        archive), with paths. The folders inside <source> are moved whole (their content goes
+        with them), so it takes one listing of <source>, plus one request per BATCH_SIZE
+        files or folders (see move_many()). E.g.: move_tree('/archive/2021', '/archive/old')
+
+        @param source String. The folder whose content is moved.
+        @param dest   String. The destination folder.
+        @return Int. The number of files (and folders) moved.
+        @raise Exception, if some of the folders does not exist.
+        """
+        found = self.resolve_many([source, dest])
+        for path in (source, dest):
+            if not found[path]:
+                raise Exception(f"{self.name}.move_tree: Folder not found '{path}'")
+        if found[source] == found[dest]: return 0
+        return self._move_children(found[source], found[dest])
+
+    def _move_children(self, fromId = '', toId = ''):
+        """Move the files (and folders) into the folder <fromId>, into the folder <toId>.
+        @return Int. The number of files moved.
+        """
+        # listed before moving, as the listing would change under the pages
+        files = self.list_all_files(query=f"'{fromId}' in parents", attr=['id', 'parents']) or []
+        return self.move_many([f['id'] for f in files], toId,
+            parents = {f['id']: f.get('parents') or [] for f in files})
 
     def copyToFolderById(self, fileId = '', folderId = ''):
         """Make a copy of a file, into another folder.
@@ -508,8 +1328,9 @@ class GoogleDriveAPI(object):
         """
         if not fileId or not folderId: return
 
-        copyId = self.service.files().copy(fileId=fileId).execute()["id"]
-        self.moveToFolder(copyId, folderId)
+        copy = self._execute(self.service.files().copy(fileId=fileId, fields='id, parents',
+            supportsAllDrives=True))
+        self.moveToFolderById(copy['id'], folderId, parents = copy.get('parents') or [])
 
     def copyToFolder(self, filename='', foldername=''):
         """Make a copy of a file into a folder, but using paths instead of ID's.
@@ -520,10 +1341,10 @@ class GoogleDriveAPI(object):
         @return None
         """
         if not filename or not foldername: return
-        fileId   = getFileId(filename)
-        folderId = getFileId(foldername)
+        fileId   = self.getFileId(filename)
+        folderId = self.getFileId(foldername)
         if not fileId or not folderId: return        # not found
-        self.moveToFolderById(fileId, folderId)
+        self.copyToFolderById(fileId, folderId)
 
     def rename(self, oldFilename='', newFilename=''):
         """Rename a file. The file keeps holding in the same folder/parent.
@@ -540,12 +1361,13 @@ class GoogleDriveAPI(object):
         """
         if not oldFilename or not newFilename: return
 
-        fileId = getFileId(oldFilename)
+        fileId = self.getFileId(oldFilename)
         if not fileId:
             # not found
             raise Exception(f"{self.name}.rename: File not found")
         body = {"name": newFilename}
-        self.service.files().update(fileId=fileId, body=body).execute()
+        self._execute(self.service.files().update(fileId=fileId, body=body, supportsAllDrives=True))
+        self.metadata.invalidate(fileId, ['name'])
 
     def _parse_dest_path(self, path = ''):
         """This is an auxiliary function that helps to parse a path as a folderId, plus
@@ -570,7 +1392,7 @@ class GoogleDriveAPI(object):
             path = path[1:]
         if not path: return None
         v = path.split(sep)
-        folderId = "root"
+        folderId = ROOT_ID
         mimeType = MIME_TYPE_FOLDER
         i = 0
         # iterates through of the path (array v)
@@ -593,15 +1415,28 @@ class GoogleDriveAPI(object):
 
     def createFolder(self, path = ''):
         """Create a new folder in Drive. It recognizes string names like
-        '/path/to/my/new/folder', or '/path/to/my/new/folder/'
+        '/path/to/my/new/folder', or '/path/to/my/new/folder/', and paths into a 
+        Shared Drive, like 'shared:TeamName/path/to/my/new/folder'
         @param path String. The path to the folder to be created.
         @return On success, return the ID of the new created folder.
         """
-        ROOT_ID = "root"
+        if path.startswith(SHARED_PREFIX):
+            drive, _, path = path[len(SHARED_PREFIX):].partition('/')
+            driveId = self._drive_id(drive)
+            if not path.strip('/'):
+                # the Shared Drive itself
+                return driveId
+            return self.createFolderRecursively(path, driveId)
         return self.createFolderRecursively(path, ROOT_ID)
 
     def createFolderRecursively(self, path = '', parentId = ''):
         """Auxiliary function to createFolder()
+
+        It is safe to call it from several threads (or processes) at the same time: the creation
+        of each folder is serialized by a lock per (parent, name) within the process, and checked
+        again after the creation. If another process created the same folder meanwhile, both
+        choose the same one (see _pick()), and the other one is merged into it and removed
+        (see _merge_folder()).
         """
         if not parentId: return ''
 
@@ -619,44 +1454,28 @@ class GoogleDriveAPI(object):
         else:
             b = None
 
-        # --- debug ---
         # is 'a' child of parentId ?
-        #print(f"create recursively:  a='{a}', b='{b}'")
-        #
-        q = f"name='{a}' and '{parentId}' in parents"
-        # --- debug ---
-        #print(f"query: {q}")
-
-        r = self.list_all_files(query=q, attr='id')
-        if not r:
-
-            # --- debug ---
-            #print(f"....create '{a}' as a child of {parentId}")
-            #
-            file_metadata = {
-                'name': a,
-                'mimeType': 'application/vnd.google-apps.folder'
-            }
-            file = self.service.files().create(body=file_metadata,
-                fields='id').execute()
-
-            # Move the created folder to the new location
-            fileId = file.get('id')
-            # Retrieve the existing parents to remove
-            file = self.service.files().get(
-                fileId=fileId,
-                fields='parents'
-                ).execute()
-            previous_parents = ",".join(file.get('parents'))
-            file = self.service.files().update(
-                fileId=fileId,
-                addParents=parentId,
-                removeParents=previous_parents,
-                fields='id, parents'
-                ).execute()
-            parentId = file.get('id')
-        else:
-            parentId = r[0]['id']
+        with self._folder_lock(parentId, a):
+            folder = self._pick(self._find_folders(a, parentId))
+            if folder is None:
+                # created directly into its parent (also into a Shared Drive)
+                file_metadata = {
+                    'name': a,
+                    'mimeType': MIME_TYPE_FOLDER,
+                    'parents': [parentId]
+                }
+                file = self._execute(self.service.files().create(body=file_metadata,
+                    fields='id', supportsAllDrives=True))
+                fileId = file.get('id')
+
+                # check again: another process could have created it at the same time
+                folder = self._pick(self._find_folders(a, parentId))
+                if folder is not None and folder['id'] != fileId:
+                    print(f"!! folder '{a}' was created twice, keeping the oldest one")
+                    self._merge_folder(fileId, folder['id'])
+                else:
+                    folder = {'id': fileId}
+            parentId = folder['id']
 
         # now, parentId is the id of 'a'
         # then, call recursively searching for the child 'b' of 'a'
@@ -665,8 +1484,48 @@ class GoogleDriveAPI(object):
         else:
             return parentId
 
+    @contextmanager
+    def _folder_lock(self, parentId = '', name = ''):
+        """Serialize the creation of the folder <name> into <parentId>. The lock is forgotten
+        once no thread holds it or waits for it, so a long sync does not keep one per folder.
+        """
+        key = (parentId, name)
+        with self._folder_locks_lock:
+            entry = self._folder_locks.get(key)
+            if entry is None:
+                entry = self._folder_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._folder_locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._folder_locks[key]
+
+    def _find_folders(self, name = '', parentId = ''):
+        """The folders named <name> into <parentId> (as DriveFile, with createdTime)"""
+        q = f"name={self._quote(name)} and '{parentId}' in parents and mimeType='{MIME_TYPE_FOLDER}' and trashed=false"
+        return self.list_all_files(query=q, attr=['id', 'mimeType', 'createdTime'])
+
+    def _merge_folder(self, fromId = '', toId = ''):
+        """Move the content of the folder <fromId> into the folder <toId>, and remove the first one.
+        Another process could have picked <fromId> meanwhile, and be uploading into it: so the
+        move is repeated until a listing finds it empty (up to MERGE_FOLDER_TRIES times), and
+        only then it is removed. Otherwise, it is left in place, with what it still contains.
+        """
+        for _ in range(MERGE_FOLDER_TRIES):
+            self._move_children(fromId, toId)
+            if not self.list_all_files(query=f"'{fromId}' in parents", attr=['id']):
+                self._delete(fromId)
+                return
+        print(f"!! folder '{fromId}' is still receiving files after merging it, not removed")
+
     def sync(self, local_path='', remote_path='', regex = '',
-        recursion_level = 1, max_recursion_level = 10):
+        recursion_level = 1, max_recursion_level = 10, snapshot_file = '',
+        scan_workers = 4, dedup = False, journal_file = '', order = 'largest', jobs = 1,
+        dry_run = False, on_action = None, _tree = None, _journal = None, _resume = False):
         """Synchronize local and remote path. Traverses recursively the local directory (*),
         recreates the directory structure in the remote path, and copies only the files
         more recently modified, or with a larger size.
@@ -674,11 +1533,37 @@ class GoogleDriveAPI(object):
         (*)NOTE: if the local_path corresponds to regular file (instead of a directory) it will
         synchronize that single file to the remote path.
 
+        The local tree is scanned first by a LocalScanner (see _local_scan.py), using
+        os.scandir() and several threads. If snapshot_file is given, the directories
+        that did not change since the previous sync (same mtime and number of entries)
+        are not listed again, and unchanged sub-trees are skipped. Read the CAUTION note
+        in _local_scan.py before using it.
+
+        If journal_file is given, the sync is done in two steps: first the files to be synced
+        are planned into a persistent journal (see _journal.py), then they are synced in the
+        given order, by <jobs> threads. If the sync is interrupted (crash, deploy, ...), call
+        resume(journal_file) to continue only with the pending files.
+
         @param local_path String. The full path of the source folder.
         @param remote_path String. The path of the remote folder.
         @param regex (optional) String. Only sync the local files matching regex.
                      e.g. regex = '.*\.txt$' will match 'foo.txt', but not 'foo.csv'
         @param max_recursion_level Int. Max recursion level to look into it. Default 10.
+        @param snapshot_file (optional) String. File to persist the local directories
+                     snapshot between runs.
+        @param scan_workers (optional) Int. Threads used to scan the local tree. Default 4.
+        @param dedup (optional) Bool. Copy server-side the files whose content already exists
+                     in Drive, instead of uploading them (see upload_file()).
+        @param journal_file (optional) String. SQLite file to keep the planned transfers and their state.
+        @param order (optional) String. With journal_file, order of the transfers: 'largest' first
+                     (the default, shortest total time with several jobs), 'smallest' first, or 'fifo'.
+        @param jobs (optional) Int. With journal_file, number of files synced at the same time. Default 1.
+        @param dry_run (optional) Bool. Only print what would be done (no journal, no snapshot saved).
+        @param on_action (optional) Callable. Called with a dict for each action planned or done, as it
+                     happens, e.g. {'action': 'upload', 'local': ..., 'path': ..., 'dry_run': False}.
+                     The actions are 'mkdir', 'upload', 'update', 'plan' (added to the journal),
+                     'failed' (with 'error') and 'remote_only' (with 'count': remote files not in local).
+                     It can be called from several threads (see jobs).
         @return None.
         @raise Exception, if the local path cannot be properly read (e.g., permissions), 
                or an exceptions arises on calling other methods of the API (like upload_file())
@@ -695,65 +1580,260 @@ class GoogleDriveAPI(object):
         # with '/' (!!!)
         if local_path[-1] == '/': local_path = local_path[:-1]
         if remote_path[-1] == '/': remote_path = remote_path[:-1]
+
+        scanner = None
+        if _tree is None:
+            if not os.path.exists(local_path):
+                raise Exception(f"{self.name}.sync: Local path not found")
+            if os.path.isdir(local_path):
+                # top level call: scan the whole local tree
+                scanner = LocalScanner(local_path, 
+                    max_depth = max_recursion_level - recursion_level + 1,
+                    workers = scan_workers, 
+                    snapshot_file = snapshot_file,
+                    max_files = DIFF_BUDGET)
+                _tree = scanner.scan()
+                if journal_file and not dry_run:
+                    # top level call: start (or continue) the journal
+                    _journal = TransferJournal(journal_file)
+                    if not _resume:
+                        _journal.reset()
+                    _journal.set_meta('args', {'local_path': local_path, 'remote_path': remote_path,
+                        'regex': regex, 'max_recursion_level': max_recursion_level, 'dedup': dedup,
+                        'order': order})
+
+        local_dir = _tree.get(local_path) if _tree is not None else None
+        if local_dir is not None and not local_dir.changed:
+            # nothing changed in this sub-tree since the last sync. At the top level, the
+            # journal (already open) is still closed and marked as planned
+            return self._sync_done(scanner, _journal, order, dedup, jobs, dry_run, on_action)
+
         print(F"Syncing [Local]:{local_path} to [Drive]:{remote_path}")
 
-        if not os.path.exists(local_path):
-            raise Exception(f"{self.name}.sync: Local path not found")
-        
         # try creating the remote folder (is not exist), otherwise
-        # list its content
-        r = self.searchFile(remote_path)
-        if not r or r.get('mimeType') != MIME_TYPE_FOLDER:
+        # list its content. A file with the same name does not hide the folder
+        r = self.searchFile(remote_path, prefer_folder = True)
+        created = not r or r.get('mimeType') != MIME_TYPE_FOLDER
+        if created:
             # NOTE: if the file exists but it is a regular file, then it will create a
             #       folder with the same name. This is weird, but Google Drive allows
             #       to have several files with the same name.
             #       By future versions, this behavior could be changed to delete the
             #       older (regular) file.
             print(f"+ creating folder '{remote_path}'")
-            remoteFolderId = self.createFolder(remote_path)
+            remoteFolderId = '' if dry_run else self.createFolder(remote_path)
+            self._report(on_action, 'mkdir', path = remote_path, id = remoteFolderId, dry_run = dry_run)
         else:
             remoteFolderId = r['id']
 
-        if os.path.isfile(local_path):
-            # if the source is a file
-            self._sync_file(local_path, remote_path)
-            return
-        elif not os.path.isdir(local_path):
+        if local_dir is None:
+            if os.path.isfile(local_path):
+                # if the source is a file
+                self._sync_file(local_path, remote_path, dedup = dedup, dry_run = dry_run,
+                    on_action = on_action)
+                return
             # is it is not a file, neither a directory: fail
             raise Exception(f"{self.name}.sync: Local path is not a directory")
 
         # otherwise, the source is a directory ...
-        # list the content of the local directory
-        local_files = os.listdir(local_path)
-
-        # list the content of the remote directory
-        remote_files = self.list_directory(fileId = remoteFolderId)
-
         # regex matcher
         if regex:
             matcher = re.compile(regex)
         else:
             matcher = None
 
-        for entry in local_files:
-
-            local_file = local_path + '/' + entry
-            if os.path.isdir(local_path + '/' + entry):
-                self.sync(local_path + '/' + entry, remote_path + '/' + entry, 
-                    regex= regex,
-                    recursion_level = recursion_level + 1, 
-                    max_recursion_level = max_recursion_level)
-            elif os.path.isfile(local_path + '/' + entry):
-                # upload this file
-                #print(f"match [{regex}]? {not not matcher.match(local_file)}")
-                if matcher and not matcher.match(local_file):
-                    # if regex is given, omit the files not matching the pattern
+        for entry in local_dir.subdirs:
+            if (local_path + '/' + entry) not in _tree:
+                # beyond max_recursion_level
+                continue
+            self.sync(local_path + '/' + entry, remote_path + '/' + entry, 
+                regex = regex,
+                recursion_level = recursion_level + 1, 
+                max_recursion_level = max_recursion_level,
+                dedup = dedup,
+                dry_run = dry_run,
+                on_action = on_action,
+                _tree = _tree,
+                _journal = _journal)
+
+        # the files: the local ones and the remote listing are diffed in name order, in
+        # bounded memory (see _diff.py), instead of looking up each file
+        def local_files():
+            files = local_dir.files if local_dir.files is not None else iter_files(local_path)
+            for entry in files:
+                # if regex is given, omit the files not matching the pattern
+                if matcher and not matcher.match(local_path + '/' + entry.name):
                     continue
-                
-                print(f"CALL _sync_file({local_file}, {remote_path})")
-                self._sync_file(local_file, remote_path)
-
-    def _sync_file(self, local_file, dest):
+                yield (entry.name, entry.size, entry.mtime)
+
+        def remote_files():
+            if not remoteFolderId or created: return
+            q = f"'{remoteFolderId}' in parents and mimeType!='{MIME_TYPE_FOLDER}'"
+            for file in self.iter_all_files(query = q, attr = DIFF_FIELDS, drive = self._split_root(remote_path)[0],
+                index_md5 = dedup):
+                # sorted by name, then the oldest first (the one chosen among repeated names)
+                yield tuple(file.get(key, '') if key in ('createdTime', 'id') else file.get(key)
+                    for key in DIFF_FIELDS)
+
+        def changed(l, r):
+            return self._changed(local_path + '/' + l[0], l[1], l[2], 
+                DriveFile(dict(zip(DIFF_FIELDS, r))), remote_path + '/' + r[0], dedup = dedup)
+
+        local = sorted_stream(local_files(), budget = DIFF_BUDGET)
+        first = next(local, None)
+        if first is None:
+            # no files to sync, there is no need to list the remote ones
+            return self._sync_done(scanner, _journal, order, dedup, jobs, dry_run, on_action)
+        local = itertools.chain([first], local)
+
+        remote_only = 0
+        for action, l, r in diff(local, sorted_stream(remote_files(), budget = DIFF_BUDGET), changed):
+            if action == 'delete':
+                # sync never removes remote files
+                remote_only += 1
+                continue
+            local_file = local_path + '/' + l[0]
+            if _journal is not None:
+                # plan it, it will be synced later by _run_journal(), without lookups
+                _journal.add(local_file, remote_path, l[1], l[2], folder_id = remoteFolderId,
+                    action = action, remote_id = r[DIFF_FIELDS.index('id')] if r else None)
+                self._report(on_action, 'plan', local = local_file, path = remote_path + '/' + l[0],
+                    size = l[1])
+                continue
+
+            if action == 'create':
+                print(f">> uploading '{local_file}' to '{remote_path + '/' + l[0]}")
+            else:
+                print(f">> updating '{local_file}'")
+            fileId = None
+            if not dry_run:
+                if action == 'update':
+                    self._delete(r[DIFF_FIELDS.index('id')])
+                fileId = self.upload_file(origin = local_file, filename = l[0], 
+                    dest = remote_path, folderId = remoteFolderId, dedup = dedup)
+            self._report(on_action, 'upload' if action == 'create' else 'update', local = local_file,
+                path = remote_path + '/' + l[0], id = fileId, size = l[1], dry_run = dry_run)
+        if remote_only:
+            print(f"{remote_only} files in '{remote_path}' are not in '{local_path}' (not removed)")
+            self._report(on_action, 'remote_only', path = remote_path, count = remote_only)
+        self._sync_done(scanner, _journal, order, dedup, jobs, dry_run, on_action)
+
+    def _report(self, on_action, action, **info):
+        """Auxiliary function to sync(). Pass an action to the callback on_action, if any"""
+        if on_action is None: return
+        info['action'] = action
+        on_action(info)
+
+    def _sync_done(self, scanner, journal, order, dedup, jobs, dry_run, on_action = None):
+        """Auxiliary function to sync(). At the end of the top level call (the one with the
+        scanner), run the journal and save the snapshot.
+        """
+        if scanner is None or dry_run: return
+        if journal is not None:
+            journal.set_meta('planned', True)
+            try:
+                self._run_journal(journal, order = order, dedup = dedup, jobs = jobs,
+                    on_action = on_action)
+            finally:
+                journal.close()
+        # the whole tree was synced, remember it for the next run
+        scanner.save_snapshot()
+        if dedup:
+            print(f"dedup: {self.dedup_stats['copies']} server-side copies, {self.dedup_stats['bytes_saved']} bytes saved")
+
+    def resume(self, journal_file = '', jobs = 1, retry_failed = True, on_action = None):
+        """Continue a sync() made with a journal_file, that was interrupted. Only the files
+        not synced yet are synced, without scanning the trees again. If the sync was
+        interrupted while planning the transfers, the planning is done again (the files 
+        already synced are not synced again).
+
+        @param journal_file String. The journal_file given to sync().
+        @param jobs (optional) Int. Number of files synced at the same time. Default 1.
+        @param retry_failed (optional) Bool. Retry also the transfers that failed. Default True.
+        @param on_action (optional) Callable. See sync().
+        @return Dict. Number of transfers by state, e.g. {'done': 10, 'failed': 1}
+        @raise Exception, if the journal does not exist, or some transfers failed.
+        """
+        if not journal_file or not os.path.isfile(journal_file):
+            raise Exception(f"{self.name}.resume: Journal not found: '{journal_file}'")
+
+        journal = TransferJournal(journal_file)
+        args = journal.get_meta('args')
+        if not args:
+            journal.close()
+            raise Exception(f"{self.name}.resume: Empty journal: '{journal_file}'")
+        if not journal.get_meta('planned'):
+            journal.close()
+            self.sync(args['local_path'], args['remote_path'], regex = args['regex'],
+                max_recursion_level = args['max_recursion_level'], dedup = args['dedup'],
+                journal_file = journal_file, order = args['order'], jobs = jobs, on_action = on_action,
+                _resume = True)
+            journal = TransferJournal(journal_file)
+        else:
+            try:
+                self._run_journal(journal, order = args['order'], dedup = args['dedup'], 
+                    jobs = jobs, retry_failed = retry_failed, on_action = on_action)
+            finally:
+                journal.close()
+            journal = TransferJournal(journal_file)
+        counts = journal.counts()
+        journal.close()
+        return counts
+
+    def _run_journal(self, journal, order = 'largest', dedup = False, jobs = 1, retry_failed = False,
+        on_action = None):
+        """Auxiliary function to sync() and resume(). Sync the pending transfers of a journal.
+        @raise Exception, if some transfers failed (they are kept as 'failed' in the journal).
+        """
+        todo = journal.pending(order = order, retry_failed = retry_failed)
+        print(f"{len(todo)} files to sync")
+
+        def transfer(row):
+            journal.mark(row['id'], 'running')
+            if not os.path.isfile(row['local']):
+                # removed since it was planned
+                return 'skipped'
+            if row['state'] != 'pending' or not row['folder_id'] or not row['action']:
+                # interrupted or failed (it may be done already), or planned by an older
+                # version: look at the destination again
+                self._sync_file(row['local'], row['remote'], local_size = row['size'],
+                    local_mtime = row['mtime'], dedup = dedup, on_action = on_action)
+                return 'done'
+            # what to do, and where, is known since the planning
+            filename = os.path.basename(row['local'])
+            if row['action'] == 'update':
+                print(f">> updating '{row['local']}'")
+                if row['remote_id']:
+                    self._delete(row['remote_id'])
+            else:
+                print(f">> uploading '{row['local']}' to '{row['remote'] + '/' + filename}")
+            fileId = self.upload_file(origin = row['local'], filename = filename,
+                folderId = row['folder_id'], dedup = dedup)
+            self._report(on_action, 'upload' if row['action'] == 'create' else 'update',
+                local = row['local'], path = row['remote'] + '/' + filename, id = fileId,
+                size = row['size'], dry_run = False)
+            return 'done'
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            futures = {}
+            for row in todo:
+                futures[pool.submit(transfer, row)] = row
+            for future in as_completed(futures):
+                row = futures[future]
+                try:
+                    journal.mark(row['id'], future.result())
+                except Exception as e:
+                    print(f"!! sync of '{row['local']}' failed: {str(e)}")
+                    self._report(on_action, 'failed', local = row['local'], path = row['remote'],
+                        error = str(e))
+                    journal.mark(row['id'], 'failed', str(e))
+                    failed += 1
+        if failed:
+            raise Exception(f"{self.name}.sync: {failed} transfers failed, see the journal '{journal.path}'")
+
+    def _sync_file(self, local_file, dest, local_size = None, local_mtime = None, dedup = False,
+        dry_run = False, on_action = None):
         """Auxiliary function to sync a single file (not a folder).
         If the file does not exist in the destination, it will be created.
         If a file with that name actually exists, then it will update based in
@@ -763,6 +1843,12 @@ class GoogleDriveAPI(object):
 
         @param local_file String. The full path of the source file.
         @param dest       String. The path of the destination folder.
+        @param local_size  (optional) Int. Size of the local file, if already known (from the scanner).
+        @param local_mtime (optional) Float. Modification time of the local file, if already known.
+        @param dedup       (optional) Bool. See upload_file(). Also, a remote file with the same
+                           MD5 than the local one is not updated.
+        @param dry_run     (optional) Bool. Only print what would be done.
+        @param on_action   (optional) Callable. See sync().
         @ return          None
         """
         if not local_file or not dest: return
@@ -773,12 +1859,16 @@ class GoogleDriveAPI(object):
         r = self.searchFile(remote_name)
         if not r:
             print(f">> uploading '{local_file}' to '{remote_name}")
-            self.upload_file(origin = local_file, filename = filename, 
-                dest = dest)
+            fileId = None if dry_run else self.upload_file(origin = local_file, filename = filename, 
+                dest = dest, dedup = dedup)
+            self._report(on_action, 'upload', local = local_file, path = remote_name, id = fileId,
+                dry_run = dry_run)
         else:
 
             # file exists, check timestamp and size
-            _fstat = os.stat(local_file)
+            if local_size is None or local_mtime is None:
+                _fstat = os.stat(local_file)
+                local_size, local_mtime = _fstat.st_size, _fstat.st_mtime
 
             """ NOTE: how to convert from localtime to utctime
             https://stackoverflow.com/questions/79797/how-to-convert-local-time-string-to-utc
@@ -814,20 +1904,293 @@ class GoogleDriveAPI(object):
             >>> timezone_aware_dt = datetime.datetime.now(datetime.timezone.utc)
             """
 
-            remote_mtime = datetime.strptime(r['modifiedTime'], "%Y-%m-%dT%H:%M:%S.%fZ").timestamp()
-            UTC_OFFSET_TIMEDELTA = datetime.utcnow() - datetime.now()
-            # NOTE: local mtime in UTC (!)
-            local_mtime  = (datetime.fromtimestamp(_fstat.st_mtime) + UTC_OFFSET_TIMEDELTA).timestamp()
-            
-            remote_size  = r['size']
-            local_size   = _fstat.st_size
-            if local_size != int(remote_size) or local_mtime > remote_mtime:
-                print(f"size: [local]{local_size} [remote]{remote_size}")
-                print(f"mtime: [local]{datetime.fromtimestamp(local_mtime)} [remote]{datetime.fromtimestamp(remote_mtime)}")
+            if self._changed(local_file, local_size, local_mtime, r, remote_name, dedup = dedup):
                 print(f">> updating '{local_file}'")
-                self.remove(path = remote_name, prompt = False)
-                self.upload_file(origin = local_file, filename = os.path.basename(local_file), 
-                    dest = dest)
+                fileId = None
+                if not dry_run:
+                    self.remove(path = remote_name, prompt = False)
+                    fileId = self.upload_file(origin = local_file, filename = os.path.basename(local_file), 
+                        dest = dest, dedup = dedup)
+                self._report(on_action, 'update', local = local_file, path = remote_name, id = fileId,
+                    dry_run = dry_run)
+
+    def _changed(self, local_file, local_size, local_mtime, r, remote_name, dedup = False):
+        """Auxiliary function to sync(). Whether the remote file r (DriveFile) must be updated
+        with the local file: if the sizes are different, or the local file is newer.
+        @return Bool.
+        """
+        # NOTE: both are POSIX timestamps, so there is no need to convert the
+        # local time to UTC. The modifiedTime is parsed lazily by DriveFile.
+        remote_mtime = r.mtime
+
+        if 'size' not in r:
+            # a Google-native document (Docs, Sheets, ...) has no size, and cannot be
+            # replaced by a local file. See export_tree() instead.
+            print(f"!! skipping '{local_file}': '{remote_name}' is a Google document")
+            return False
+        remote_size  = r['size']
+        if local_size != int(remote_size) or local_mtime > remote_mtime:
+            if dedup and r.get('md5Checksum') and r['md5Checksum'] == self._md5_file(local_file):
+                # same content, nothing to upload
+                return False
+            print(f"size: [local]{local_size} [remote]{remote_size}")
+            print(f"mtime: [local]{datetime.fromtimestamp(local_mtime)} [remote]{datetime.fromtimestamp(remote_mtime)}")
+            return True
+        return False
+
+    def watch(self, local_path='', remote_path='', regex = '', debounce = 2.0,
+        full_sync_interval = 3600, max_recursion_level = 10, stop_event = None, max_delay = None):
+        """Continuous sync of a local folder to a remote folder (Linux only).
+        It makes a first full sync(), and then it follows the changes in the local tree
+        with inotify, uploading only the affected files and directories.
+
+        Events are debounced: a file is uploaded only after no more events arrived for it
+        in <debounce> seconds, so a file written in many small appends is uploaded once.
+        A file that keeps changing (e.g. an active log) is uploaded anyway once its first
+        pending event is <max_delay> seconds old, so it is never delayed indefinitely.
+        As a safety net (e.g. lost events), a full sync() is done every
+        <full_sync_interval> seconds, and also when the kernel event queue overflows.
+        Like sync(), this never deletes remote files.
+
+        @param local_path String. The full path of the source folder.
+        @param remote_path String. The path of the remote folder.
+        @param regex (optional) String. Only sync the local files matching regex (see sync()).
+        @param debounce (optional) Float. Quiet time in seconds before uploading a changed file.
+        @param full_sync_interval (optional) Float. Seconds between full reconciliations. 0 disables it.
+        @param max_recursion_level Int. Max recursion level to look into it. Default 10.
+        @param stop_event (optional) threading.Event. If given, watch() returns once it is set.
+                          Otherwise, it runs until interrupted (KeyboardInterrupt).
+        @param max_delay (optional) Float. Max seconds a changed file waits before it is uploaded,
+                         even if it keeps changing. Default: 10 * debounce.
+        @return None.
+        @raise Exception, if the local path is not a directory, or inotify is not available.
+        """
+        if not local_path or not remote_path: return
+        if local_path[-1] == '/': local_path = local_path[:-1]
+        if remote_path[-1] == '/': remote_path = remote_path[:-1]
+        if not os.path.isdir(local_path):
+            raise Exception(f"{self.name}.watch: Local path is not a directory")
+
+        if max_delay is None: max_delay = 10 * debounce
+        matcher = re.compile(regex) if regex else None
+        ino = Inotify()
+
+        def depth_of(path):
+            # the local_path has depth 1, as the recursion_level in sync()
+            return path[len(local_path):].count('/') + 1
+
+        def remote_of(path):
+            return remote_path + path[len(local_path):]
+
+        def add_watches(path):
+            # watch a directory and all its sub-directories
+            todo = [path]
+            while todo:
+                d = todo.pop()
+                if depth_of(d) > max_recursion_level: continue
+                try:
+                    ino.add_watch(d)
+                    with os.scandir(d) as it:
+                        for entry in it:
+                            if entry.is_dir(follow_symlinks=False):
+                                todo.append(d + '/' + entry.name)
+                except FileNotFoundError:
+                    # removed in the meantime
+                    continue
+
+        # watches are set before the first sync, so nothing written during it is lost
+        add_watches(local_path)
+        self.sync(local_path, remote_path, regex = regex, max_recursion_level = max_recursion_level)
+        next_full_sync = time.monotonic() + full_sync_interval if full_sync_interval else None
+
+        pending = {}          # local path -> (is_dir, time of the first event, time of the last event)
+
+        def touch(path, is_dir):
+            # the time of the first event is kept, to flush the path after max_delay
+            first = pending[path][1] if path in pending else time.monotonic()
+            pending[path] = (is_dir, first, time.monotonic())
+
+        def due(first, last):
+            return min(last + debounce, first + max_delay)
+        try:
+            while not (stop_event and stop_event.is_set()):
+                now = time.monotonic()
+                timeout = None
+                if pending:
+                    timeout = max(0, min(due(f, l) for _, f, l in pending.values()) - now)
+                if next_full_sync is not None:
+                    t = max(0, next_full_sync - now)
+                    timeout = t if timeout is None else min(timeout, t)
+                if stop_event is not None:
+                    # wake up from time to time to check the stop event
+                    timeout = 1.0 if timeout is None else min(timeout, 1.0)
+
+                full_sync = False
+                for event in ino.read_events(timeout):
+                    if event.mask & IN_Q_OVERFLOW:
+                        # events were lost, reconcile everything
+                        full_sync = True
+                        continue
+                    if event.mask & (IN_DELETE | IN_MOVED_FROM | IN_DELETE_SELF | IN_MOVE_SELF):
+                        # remote files are not deleted (as in sync), just forget it
+                        pending.pop(event.path, None)
+                        if event.is_dir: ino.remove_watch(event.path)
+                        continue
+                    if event.is_dir:
+                        if event.mask & (IN_CREATE | IN_MOVED_TO) and depth_of(event.path) <= max_recursion_level:
+                            add_watches(event.path)
+                            touch(event.path, True)
+                        continue
+                    if matcher and not matcher.match(event.path):
+                        continue
+                    parent = os.path.dirname(event.path)
+                    if parent in pending and pending[parent][0]:
+                        # the whole directory will be synced
+                        touch(parent, True)
+                    else:
+                        touch(event.path, False)
+
+                now = time.monotonic()
+                if full_sync or (next_full_sync is not None and now >= next_full_sync):
+                    print(f"Full sync [Local]:{local_path} to [Drive]:{remote_path}")
+                    pending = {}
+                    self.sync(local_path, remote_path, regex = regex, max_recursion_level = max_recursion_level)
+                    if full_sync_interval:
+                        next_full_sync = time.monotonic() + full_sync_interval
+                    continue
+
+                # flush the entries that were quiet for long enough, or waited too long
+                ready = [path for path, (_, f, l) in pending.items() if now >= due(f, l)]
+                for path in sorted(ready):
+                    is_dir = pending.pop(path)[0]
+                    if is_dir:
+                        if os.path.isdir(path):
+                            self.sync(path, remote_of(path), regex = regex, 
+                                recursion_level = depth_of(path), 
+                                max_recursion_level = max_recursion_level)
+                    elif os.path.isfile(path):
+                        # sync() of a single file also creates the remote folder, if missing
+                        self.sync(path, remote_of(os.path.dirname(path)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            ino.close()
+
+    def export_tree(self, remote_path = '', local_path = '', formats = None, jobs = 4,
+        manifest_file = ''):
+        """Export all the Google-native documents (Docs, Sheets, Slides, Drawings, ...) under a
+        remote folder to local files, recreating the folders structure.
+        E.g.: export_tree('/reports', 'my/local/reports', formats={'DOCUMENT': 'pdf'})
+
+        The exports run concurrently in <jobs> threads (rate limit errors are retried with
+        exponential backoff). The modifiedTime and version of each exported document are
+        kept in a local manifest, and the documents that did not change since the last
+        export are skipped.
+
+        @param remote_path String. The remote folder. '/' or '' is the root folder.
+        @param local_path String. The local folder (created if not exists).
+        @param formats (optional) Dict. The file extension (see _enum.EXPORT_MIME_TYPES) to export
+                       each type of document to. Keys can be MIME types (e.g. MIME_TYPE_DOCUMENT),
+                       or names in MIME_TYPES (e.g. 'DOCUMENT'). Documents of other types are
+                       not exported. Default: EXPORT_FORMATS.
+        @param jobs (optional) Int. Number of concurrent exports. Default 4.
+        @param manifest_file (optional) String. Default: <local_path>/.export_manifest.json
+        @return Dict. Counters {'exported': n, 'skipped': n, 'failed': n}
+        @raise Exception, if the remote folder does not exist, or a format is unknown.
+        """
+        if not self.service:
+            raise Exception(f"{self.name}.export_tree: API service not started")
+        if not local_path: return
+        if local_path[-1] == '/' and local_path != '/': local_path = local_path[:-1]
+
+        # {MIME type: (extension, export MIME type)}
+        export_as = {}
+        for key, ext in (formats or EXPORT_FORMATS).items():
+            if hasattr(MIME_TYPES, key):
+                key = getattr(MIME_TYPES, key)['mime']
+            if not hasattr(EXPORT_MIME_TYPES, ext):
+                raise Exception(f"{self.name}.export_tree: Unknown export format '{ext}'")
+            export_as[key] = (ext, getattr(EXPORT_MIME_TYPES, ext))
+
+        if not remote_path or remote_path == '/':
+            folderId = ROOT_ID
+        else:
+            r = self.getFileId(remote_path, attr=FIELDS['type'], prefer_folder=True)
+            if not r:
+                raise Exception(f"{self.name}.export_tree: File not found: '{remote_path}'")
+            elif r.get('mimeType') != MIME_TYPE_FOLDER:
+                raise Exception(f"{self.name}.export_tree: It is not a directory: '{remote_path}'")
+            folderId = r['id']
+
+        if not manifest_file:
+            manifest_file = local_path + '/.export_manifest.json'
+        manifest = {}
+        if os.path.isfile(manifest_file):
+            with open(manifest_file, 'r') as f:
+                manifest = json.load(f)
+
+        # walk the remote tree, collecting the documents to export
+        todo = []
+        stats = {'exported': 0, 'skipped': 0, 'failed': 0}
+        folders = [(folderId, local_path)]
+        while folders:
+            folderId, local_dir = folders.pop()
+            os.makedirs(local_dir, exist_ok=True)
+            used = set()
+            entries = self.list_directory(fileId = folderId, attr = FIELDS['export'])
+            # sort, so that duplicated names are resolved the same way in each run
+            for file in sorted(entries, key=lambda f: (f.get('name', ''), f['id'])):
+                name = file.get('name', '').replace('/', '_')
+                if file.get('mimeType') == MIME_TYPE_FOLDER:
+                    folders.append((file['id'], local_dir + '/' + name))
+                    continue
+                if file.get('mimeType') not in export_as: continue
+
+                ext, exportMimeType = export_as[file['mimeType']]
+                filename = f"{name}.{ext}"
+                if filename in used:
+                    # Drive allows several files with the same name
+                    filename = f"{name} ({file['id']}).{ext}"
+                used.add(filename)
+                target = local_dir + '/' + filename
+
+                old = manifest.get(file['id'])
+                if (old and old.get('modifiedTime') == file.get('modifiedTime') and 
+                    old.get('version') == file.get('version') and 
+                    old.get('path') == target and os.path.exists(target)):
+                    stats['skipped'] += 1
+                    continue
+                todo.append((file, exportMimeType, target))
+
+        def export(file, exportMimeType, target):
+            # runs in a worker thread
+            request = self.service.files().export_media(fileId=file['id'], mimeType=exportMimeType)
+            request.http = self._thread_http()
+            tmp = target + '.part'
+            with open(tmp, 'wb') as fh:
+                self._download(request, fh)
+            os.replace(tmp, target)
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            futures = {pool.submit(export, *job): job for job in todo}
+            for future in as_completed(futures):
+                file, _, target = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"!! export of '{target}' failed: {str(e)}")
+                    stats['failed'] += 1
+                    continue
+                print(f"<< exported '{target}'")
+                stats['exported'] += 1
+                manifest[file['id']] = {'modifiedTime': file.get('modifiedTime'), 
+                    'version': file.get('version'), 'path': target}
+
+        tmp = manifest_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, manifest_file)
+        return stats
 
     def __del__(self):
         pass
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""Base test case running GoogleDriveAPI against bench/fake_drive.py (a local stand-in
+of the Drive v3 HTTP API). The tests are skipped if the Google client libraries are
+not installed.
+"""
+
+import io
+import os
+import sys
+import warnings
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'py'))
+sys.path.append(os.path.join(ROOT, 'bench'))
+
+from fake_drive import FakeDrive, FOLDER
+try:
+    from google_drive_api import GoogleDriveAPI
+    import googleapiclient
+except ImportError as e:
+    GoogleDriveAPI = None
+    IMPORT_ERROR = str(e)
+
+class FakeDriveTest(unittest.TestCase):
+    """self.drive is the server (see FakeDrive), self.api a GoogleDriveAPI using it.
+    The progress messages of the library are discarded.
+    """
+
+    def setUp(self):
+        if GoogleDriveAPI is None:
+            self.skipTest(f"Google client libraries not available: {IMPORT_ERROR}")
+        # the HTTP connections of the client are closed by the garbage collector
+        warnings.simplefilter('ignore', ResourceWarning)
+        self.drive = FakeDrive().start()
+        self.addCleanup(self.drive.stop)
+        self.api = GoogleDriveAPI()
+        self.api.service = self.drive.build_service()
+        stdout = mock.patch('sys.stdout', new_callable=io.StringIO)
+        stdout.start()
+        self.addCleanup(stdout.stop)
+
+    def folder(self, name, parent = 'root'):
+        return self.drive.add(name, parent, FOLDER)
+
+    def counted(self, fn, *args, **kwargs):
+        """Call fn, @return a tuple (result, number of HTTP requests made)"""
+        before = self.drive.requests
+        result = fn(*args, **kwargs)
+        return result, self.drive.requests - before
+
+    def named(self, name):
+        """The files of the server with that name (not trashed)"""
+        return [f for f in self.drive.files.values() if f['name'] == name and not f.get('trashed')]
@@ -0,0 +1,89 @@
+"""Tests of _bandwidth.py"""
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'py'))
+from _bandwidth import BandwidthLimiter
+
+def transfer_time(limiter, nbytes, chunk, **kwargs):
+    start = time.monotonic()
+    with limiter.transfer(**kwargs) as t:
+        for _ in range(nbytes // chunk):
+            t.consume(chunk)
+    return time.monotonic() - start
+
+class BandwidthLimiterTest(unittest.TestCase):
+
+    def test_unlimited(self):
+        limiter = BandwidthLimiter()
+        self.assertLess(transfer_time(limiter, 10 * 1024**2, 64 * 1024), 0.5)
+
+    def test_global_rate(self):
+        # 100 KB at 200 KB/s, starting without tokens: ~0.5 s
+        limiter = BandwidthLimiter(rate = 200000)
+        elapsed = transfer_time(limiter, 100000, 10000)
+        self.assertGreater(elapsed, 0.4)
+        self.assertLess(elapsed, 2.0)
+
+    def test_per_transfer_cap(self):
+        # the first chunk goes at once, each one of the next 2 waits 0.25 s
+        limiter = BandwidthLimiter(per_transfer = 200000)
+        elapsed = transfer_time(limiter, 150000, 50000)
+        self.assertGreater(elapsed, 0.4)
+        self.assertLess(elapsed, 2.0)
+        # the cap of the transfer replaces the one of the limiter
+        self.assertLess(transfer_time(limiter, 150000, 50000, cap = 10**9), 0.2)
+
+    def test_set_rate(self):
+        limiter = BandwidthLimiter(rate = 1000)
+        done = threading.Event()
+        def transfer():
+            transfer_time(limiter, 100000, 10000)
+            done.set()
+        t = threading.Thread(target=transfer)
+        t.start()
+        self.assertFalse(done.wait(0.2))
+        # no limit from now on: the waiting transfer is woken up
+        limiter.set_rate(0)
+        self.assertTrue(done.wait(2.0))
+        t.join()
+
+    def test_fair_sharing(self):
+        # two transfers at the same time share the rate by weight
+        limiter = BandwidthLimiter(rate = 400000, burst = 0.05)
+        sent = {'heavy': 0, 'light': 0}
+        stop = threading.Event()
+        def transfer(key, weight):
+            with limiter.transfer(weight = weight) as t:
+                while not stop.is_set():
+                    t.consume(4000)
+                    sent[key] += 4000
+        threads = [threading.Thread(target=transfer, args=('heavy', 3)),
+                   threading.Thread(target=transfer, args=('light', 1))]
+        for t in threads:
+            t.start()
+        time.sleep(1.0)
+        stop.set()
+        for t in threads:
+            t.join()
+        ratio = sent['heavy'] / sent['light']
+        self.assertGreater(ratio, 2.0)
+        self.assertLess(ratio, 4.5)
+
+    def test_schedule(self):
+        limiter = BandwidthLimiter(rate = 100)
+        self.assertEqual(limiter.current_rate(), 100)
+        # a window crossing midnight, and one covering the rest of the day
+        limiter.set_schedule([('12:00', '00:00', 5), ('00:00', '12:00', 5)])
+        self.assertEqual(limiter.current_rate(), 5)
+        limiter.set_schedule([])
+        self.assertEqual(limiter.current_rate(), 100)
+        with self.assertRaises(Exception):
+            limiter.set_schedule([('9h', '18:00', 1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Tests of the content-addressed dedup: md5_index, upload_file(dedup=True), build_md5_index()"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _fakedrive import FakeDriveTest
+
+class DedupTest(FakeDriveTest):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.backups = self.folder('backups')
+        self.drive.add('old.bin', self.backups, content = b'same content')
+        self.drive.add_many([f'f{i:03}' for i in range(200)], self.backups, size = 1)
+        # 200 files with the same (empty) content, and 'old.bin'
+        for i in range(50):
+            self.drive.add(f'u{i:03}', self.backups, content = str(i).encode())
+
+    def local(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_listings_do_not_index(self):
+        # listings without dedup keep nothing in memory
+        self.assertEqual(len(list(self.api.iter_directory('/backups'))), 251)
+        self.assertEqual(len(self.api.list_directory('/backups')), 251)
+        self.api.sync(self.tmpdir, '/backups')
+        self.assertEqual(len(self.api.md5_index), 0)
+
+    def test_build_md5_index(self):
+        self.assertEqual(self.api.build_md5_index('/backups'), 52)
+        path = self.local('new.bin', b'same content')
+        dest = self.folder('today')
+        fileId, requests = self.counted(self.api.upload_file, path, filename = 'new.bin',
+            folderId = dest, dedup = True)
+        # a single files().copy(), no upload
+        self.assertEqual(requests, 1)
+        self.assertEqual(self.drive.files[fileId]['parents'], [dest])
+        self.assertEqual(self.api.dedup_stats, {'copies': 1, 'bytes_saved': 12})
+
+    def test_sync_dedup_indexes(self):
+        self.local('a.bin', b'same content')
+        self.api.sync(self.tmpdir, '/backups', dedup = True)
+        self.assertEqual(len(self.api.md5_index), 52)
+
+    def test_max_entries(self):
+        with mock.patch('google_drive_api.MD5_INDEX_MAX_ENTRIES', 10):
+            self.assertEqual(self.api.build_md5_index('/backups'), 10)
+            path = self.local('new.bin', b'brand new')
+            fileId = self.api.upload_file(path, filename = 'new.bin', dest = '/backups', dedup = True)
+        self.assertEqual(len(self.api.md5_index), 10)
+        # the newest entries are kept
+        self.assertEqual(list(self.api.md5_index.values())[-1], fileId)
+
+if __name__ == '__main__':
+    unittest.main()
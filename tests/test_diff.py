@@ -0,0 +1,128 @@
+"""Tests of _diff.py: ExternalSorter, sorted_stream() and diff()"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'py'))
+from _diff import ExternalSorter, sorted_stream, diff
+
+def changed(l, r):
+    return l[1] != r[1]
+
+class ExternalSorterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_in_memory(self):
+        with ExternalSorter(budget = 10, tmpdir = self.tmpdir) as sorter:
+            for item in [3, 1, 2]:
+                sorter.add(item)
+            self.assertEqual(sorter.runs, [])
+            self.assertEqual(list(sorter), [1, 2, 3])
+
+    def test_spilled_runs(self):
+        items = [('e', 5), ('b', 2), ('g', 7), ('a', 1), ('f', 6), ('c', 3), ('d', 4)]
+        with ExternalSorter(budget = 2, tmpdir = self.tmpdir) as sorter:
+            for item in items:
+                sorter.add(item)
+            self.assertEqual(len(sorter.runs), 3)
+            self.assertEqual(sorter.count, 7)
+            self.assertEqual(len(os.listdir(self.tmpdir)), 3)
+            self.assertEqual(list(sorter), sorted(items))
+        # the runs are removed on exit
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_sorted_stream_removes_runs(self):
+        stream = sorted_stream(iter([5, 4, 3, 2, 1]), budget = 2, tmpdir = self.tmpdir)
+        self.assertEqual(next(stream), 1)
+        self.assertNotEqual(os.listdir(self.tmpdir), [])
+        self.assertEqual(list(stream), [2, 3, 4, 5])
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_sorted_stream_closed_early(self):
+        stream = sorted_stream(iter(range(10, 0, -1)), budget = 2, tmpdir = self.tmpdir)
+        next(stream)
+        stream.close()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+class DiffTest(unittest.TestCase):
+
+    def test_actions(self):
+        local  = [('a', 1), ('b', 2), ('c', 3)]
+        remote = [('b', 2), ('c', 0), ('d', 4)]
+        self.assertEqual(list(diff(local, remote, changed)), [
+            ('create', ('a', 1), None),
+            ('update', ('c', 3), ('c', 0)),
+            ('delete', None, ('d', 4)),
+        ])
+
+    def test_repeated_remote_names(self):
+        # only the first remote entry of each name is considered
+        local  = [('a', 1), ('b', 2)]
+        remote = [('a', 1), ('a', 9), ('a', 8), ('b', 0), ('b', 2), ('c', 3), ('c', 4)]
+        self.assertEqual(list(diff(local, remote, changed)), [
+            ('update', ('b', 2), ('b', 0)),
+            ('delete', None, ('c', 3)),
+        ])
+
+    def test_empty_sides(self):
+        self.assertEqual(list(diff([], [], changed)), [])
+        self.assertEqual(list(diff([('a', 1)], [], changed)), [('create', ('a', 1), None)])
+        self.assertEqual(list(diff([], [('a', 1), ('a', 2)], changed)), [('delete', None, ('a', 1))])
+
+    def test_spilled_sides(self):
+        # both sides sorted with spilled runs, as in sync()
+        local  = [(f'{i:03}', i) for i in range(0, 50, 2)]
+        remote = [(f'{i:03}', i) for i in range(0, 50, 3)]
+        tmpdir = tempfile.mkdtemp()
+        try:
+            actions = list(diff(sorted_stream(reversed(local), budget = 2, tmpdir = tmpdir),
+                sorted_stream(reversed(remote), budget = 2, tmpdir = tmpdir), changed))
+            self.assertEqual(os.listdir(tmpdir), [])
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual([l[0] for a, l, _ in actions if a == 'create'],
+            sorted(set(n for n, _ in local) - set(n for n, _ in remote)))
+        self.assertEqual([r[0] for a, _, r in actions if a == 'delete'],
+            sorted(set(n for n, _ in remote) - set(n for n, _ in local)))
+        self.assertNotIn('update', [a for a, _, _ in actions])
+
+class SyncCreatedFolderTest(unittest.TestCase):
+    """sync() does not list a remote folder it just created: all the files are created"""
+
+    def setUp(self):
+        try:
+            from google_drive_api import GoogleDriveAPI
+        except ImportError as e:
+            self.skipTest(f"google_drive_api not available: {e}")
+        self.api = GoogleDriveAPI()
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ('b.txt', 'a.txt'):
+            with open(os.path.join(self.tmpdir, name), 'w') as f:
+                f.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_no_remote_listing(self):
+        from unittest import mock
+        actions = []
+        with mock.patch.object(self.api, 'searchFile', return_value = None), \
+             mock.patch.object(self.api, 'iter_all_files', side_effect = AssertionError("listed")), \
+             mock.patch('sys.stdout'):
+            self.api.sync(self.tmpdir, '/new/folder', dry_run = True, on_action = actions.append)
+        self.assertEqual([(a['action'], a.get('path')) for a in actions], [
+            ('mkdir', '/new/folder'),
+            ('upload', '/new/folder/a.txt'),
+            ('upload', '/new/folder/b.txt'),
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Tests of the concurrency-safe folder creation: createFolder() and _merge_folder()"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _fakedrive import FakeDriveTest, FOLDER
+
+class CreateFolderTest(FakeDriveTest):
+
+    def test_concurrent(self):
+        ids = []
+        def create():
+            ids.append(self.api.createFolder('/a/b/c'))
+        threads = [threading.Thread(target=create) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(set(ids)), 1)
+        for name in ('a', 'b', 'c'):
+            self.assertEqual(len(self.named(name)), 1, name)
+
+    def test_locks_released(self):
+        for i in range(20):
+            self.api.createFolder(f'/many/f{i:02}')
+        self.assertEqual(self.api._folder_locks, {})
+        self.assertEqual(len(self.drive.children[self.named('many')[0]['id']]), 20)
+
+    def test_existing(self):
+        a = self.folder('a')
+        self.drive.add('b', a, content = b'a file named like the folder')
+        b = self.api.createFolder('/a/b')
+        self.assertEqual(self.drive.files[b]['mimeType'], FOLDER)
+        self.assertEqual(self.api.createFolder('/a/b/'), b)
+
+class MergeFolderTest(FakeDriveTest):
+
+    def setUp(self):
+        super().setUp()
+        self.keep = self.folder('dup')
+        self.loser = self.folder('dup')
+        self.drive.add('a.txt', self.loser, content = b'a')
+        self.late = []
+        move_children = self.api._move_children
+        def racing_move(fromId, toId):
+            # another process uploads into the loser right after each move
+            moved = move_children(fromId, toId)
+            if self.uploads:
+                self.uploads -= 1
+                self.late.append(self.drive.add(f'late{len(self.late)}.txt', fromId, content = b'x'))
+            return moved
+        self.api._move_children = racing_move
+
+    def children(self, folderId):
+        return {self.drive.files[i]['name'] for i in self.drive.children.get(folderId, {})
+            if not self.drive.files[i].get('trashed')}
+
+    def test_late_upload(self):
+        self.uploads = 1
+        self.api._merge_folder(self.loser, self.keep)
+        self.assertEqual(self.children(self.keep), {'a.txt', 'late0.txt'})
+        self.assertNotIn(self.loser, self.drive.files)
+
+    def test_still_receiving(self):
+        self.uploads = 100
+        self.api._merge_folder(self.loser, self.keep)
+        # not removed, nor trashed: the last upload is still there
+        self.assertFalse(self.drive.files[self.loser].get('trashed'))
+        self.assertEqual(self.children(self.loser), {f'late{len(self.late) - 1}.txt'})
+        self.assertEqual(len(self.children(self.keep)), len(self.late))
+
+if __name__ == '__main__':
+    unittest.main()
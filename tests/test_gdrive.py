@@ -0,0 +1,52 @@
+"""Tests of the command line (py/gdrive.py)"""
+
+import os
+import sys
+import json
+import subprocess
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _fakedrive import FakeDriveTest, ROOT
+
+# runs gdrive.main() in another process, against a fake server with a big folder
+SCRIPT = """
+import sys
+sys.path[:0] = [%r, %r]
+from fake_drive import FakeDrive, FOLDER
+from google_drive_api import GoogleDriveAPI
+import gdrive
+drive = FakeDrive().start()
+drive.add_many(['file%%05d' %% i for i in range(5000)], drive.add('big', 'root', FOLDER))
+api = GoogleDriveAPI()
+api.service = drive.build_service()
+sys.exit(gdrive.main(sys.argv[1:], api = api))
+""" % (os.path.join(ROOT, 'py'), os.path.join(ROOT, 'bench'))
+
+class GdriveTest(FakeDriveTest):
+
+    def run_gdrive(self, *argv):
+        return subprocess.Popen([sys.executable, '-c', SCRIPT] + list(argv),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def test_ls(self):
+        proc = self.run_gdrive('ls', '/big')
+        out, err = proc.communicate(timeout = 60)
+        self.assertEqual(proc.returncode, 0, err)
+        lines = out.decode().splitlines()
+        self.assertEqual(len(lines), 5000)
+        self.assertEqual(json.loads(lines[0])['path'], '/big/file00000')
+
+    def test_broken_pipe(self):
+        # e.g. gdrive ls /big | head -1
+        proc = self.run_gdrive('ls', '/big')
+        self.assertTrue(proc.stdout.readline())
+        proc.stdout.close()
+        err = proc.stderr.read().decode()
+        proc.stderr.close()
+        self.assertEqual(proc.wait(timeout = 60), 1)
+        self.assertNotIn('Traceback', err)
+        self.assertNotIn('Exception ignored', err)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Tests of GoogleDriveAPI.get_many() and of the metadata cache (_metacache.py)"""
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _fakedrive import FakeDriveTest
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'py'))
+from _metacache import MetadataCache
+
+class MetadataCacheTest(unittest.TestCase):
+
+    def test_get_and_missing(self):
+        cache = MetadataCache(ttl = 30)
+        cache.put('1', {'id': '1', 'name': 'foo.txt', 'mimeType': 'text/plain'})
+        self.assertEqual(cache.get('1', ['name']), {'name': 'foo.txt'})
+        self.assertIsNone(cache.get('1', ['name', 'size']))
+        self.assertEqual(cache.missing('1', ['name', 'size']), ['size'])
+        self.assertEqual(cache.missing('1', ['name']), [])
+        self.assertEqual(cache.missing('2', ['name']), ['name'])
+        # the ID is not kept as a field
+        self.assertIsNone(cache.get('1', ['id']))
+        self.assertEqual(cache.stats(), {'entries': 1, 'hits': 1, 'misses': 2})
+
+    def test_ttl(self):
+        cache = MetadataCache(ttl = 0.1)
+        cache.put('1', {'name': 'foo.txt'})
+        time.sleep(0.05)
+        cache.put('1', {'size': '3'})
+        time.sleep(0.07)
+        # each field expires on its own
+        self.assertIsNone(cache.get('1', ['name']))
+        self.assertEqual(cache.get('1', ['size']), {'size': '3'})
+        time.sleep(0.05)
+        self.assertEqual(cache.missing('1', ['size']), ['size'])
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_disabled(self):
+        cache = MetadataCache(ttl = 0)
+        cache.put('1', {'name': 'foo.txt'})
+        self.assertIsNone(cache.get('1', ['name']))
+
+    def test_invalidate(self):
+        cache = MetadataCache()
+        cache.put('1', {'name': 'foo.txt', 'parents': ['p']})
+        cache.invalidate('1', ['parents'])
+        self.assertEqual(cache.get('1', ['name']), {'name': 'foo.txt'})
+        self.assertIsNone(cache.get('1', ['parents']))
+        cache.invalidate('1')
+        self.assertIsNone(cache.get('1', ['name']))
+        cache.invalidate('unknown')
+        cache.put('2', {'name': 'bar'})
+        cache.clear()
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_max_entries(self):
+        cache = MetadataCache(max_entries = 2)
+        cache.put('1', {'name': 'a'})
+        cache.put('2', {'name': 'b'})
+        cache.get('1', ['name'])            # '2' is now the least recently used
+        cache.put('3', {'name': 'c'})
+        self.assertIsNone(cache.get('2', ['name']))
+        self.assertIsNotNone(cache.get('1', ['name']))
+        self.assertIsNotNone(cache.get('3', ['name']))
+
+class GetManyTest(FakeDriveTest):
+
+    def setUp(self):
+        super().setUp()
+        self.folderId = self.folder('f')
+        self.names = [f'f{i:03}' for i in range(120)]
+        self.ids = self.drive.add_many(self.names, self.folderId, size = 1)
+
+    def test_batches(self):
+        # 120 IDs, a repeated one and a missing one: 2 batch requests
+        result, requests = self.counted(self.api.get_many, self.ids + [self.ids[0], 'nope'], ['name', 'parents'])
+        self.assertEqual(requests, 2)
+        self.assertEqual(len(result), 121)
+        self.assertIsNone(result['nope'])
+        self.assertEqual(result[self.ids[5]]['name'], 'f005')
+        self.assertEqual(result[self.ids[5]]['parents'], [self.folderId])
+
+    def test_cached(self):
+        self.api.get_many(self.ids, 'name,mimeType')
+        result, requests = self.counted(self.api.get_many, self.ids, ['name'])
+        self.assertEqual(requests, 0)
+        self.assertEqual(result[self.ids[7]]['name'], 'f007')
+        # the single-ID getters use the cache too
+        self.assertEqual(self.counted(self.api.getFileNameById, self.ids[3]), ('f003', 0))
+        # only the missing fields are requested
+        result, requests = self.counted(self.api.get_many, self.ids[:3], ['name', 'size'])
+        self.assertEqual(requests, 1)
+        self.assertEqual(result[self.ids[2]]['size'], '1')
+
+    def test_invalidated_by_changes(self):
+        self.api.get_many(self.ids[:1], ['name', 'parents'])
+        self.api.rename('/f/f000', 'renamed')
+        dest = self.folder('dest')
+        self.api.moveToFolderById(self.ids[0], dest)
+        result = self.api.get_many(self.ids[:1], ['name', 'parents'])
+        self.assertEqual(result[self.ids[0]]['name'], 'renamed')
+        self.assertEqual(result[self.ids[0]]['parents'], [dest])
+
+    def test_ttl(self):
+        self.api.metadata = MetadataCache(ttl = 0.05)
+        self.api.get_many(self.ids[:2], ['name'])
+        self.drive.files[self.ids[0]]['name'] = 'changed elsewhere'
+        self.assertEqual(self.api.get_many(self.ids[:1], ['name'])[self.ids[0]]['name'], 'f000')
+        time.sleep(0.1)
+        self.assertEqual(self.api.get_many(self.ids[:1], ['name'])[self.ids[0]]['name'], 'changed elsewhere')
+
+if __name__ == '__main__':
+    unittest.main()
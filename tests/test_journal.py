@@ -0,0 +1,104 @@
+"""Tests of _journal.py"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'py'))
+from _journal import TransferJournal
+
+class TransferJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'sync.journal')
+        self.journal = TransferJournal(self.path)
+        self.journal.add('local/b', '/remote', 300)
+        self.journal.add('local/a', '/remote', 100)
+        self.journal.add('local/c', '/remote', 200, 1234.5)
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.tmpdir)
+
+    def locals(self, rows):
+        return [row['local'] for row in rows]
+
+    def test_orders(self):
+        self.assertEqual(self.locals(self.journal.pending('largest')), ['local/b', 'local/c', 'local/a'])
+        self.assertEqual(self.locals(self.journal.pending('smallest')), ['local/a', 'local/c', 'local/b'])
+        self.assertEqual(self.locals(self.journal.pending('fifo')), ['local/b', 'local/a', 'local/c'])
+        with self.assertRaises(Exception):
+            self.journal.pending('random')
+
+    def test_add_keeps_state(self):
+        row = self.journal.pending('fifo')[0]
+        self.journal.mark(row['id'], 'done')
+        self.journal.add('local/b', '/remote', 999)
+        self.assertEqual(self.locals(self.journal.pending('fifo')), ['local/a', 'local/c'])
+        self.assertEqual(self.journal.counts(), {'done': 1, 'pending': 2})
+
+    def test_mark(self):
+        b, a, c = self.journal.pending('fifo')
+        self.assertEqual(c['mtime'], 1234.5)
+        self.journal.mark(b['id'], 'done')
+        self.journal.mark(a['id'], 'failed', 'quota exceeded')
+        self.journal.mark(c['id'], 'running')
+        # an interrupted ('running') transfer is still pending, a failed one only on retry
+        self.assertEqual(self.locals(self.journal.pending('fifo')), ['local/c'])
+        self.assertEqual(self.locals(self.journal.pending('fifo', retry_failed = True)), ['local/a', 'local/c'])
+        self.assertEqual(self.journal.counts(), {'done': 1, 'failed': 1, 'running': 1})
+
+    def test_meta(self):
+        self.assertIsNone(self.journal.get_meta('planned'))
+        self.assertEqual(self.journal.get_meta('planned', False), False)
+        self.journal.set_meta('args', {'order': 'largest', 'jobs': 4})
+        self.assertEqual(self.journal.get_meta('args'), {'order': 'largest', 'jobs': 4})
+
+    def test_persistent(self):
+        self.journal.set_meta('planned', True)
+        self.journal.close()
+        self.journal = TransferJournal(self.path)
+        self.assertTrue(self.journal.get_meta('planned'))
+        self.assertEqual(len(self.journal.pending()), 3)
+
+    def test_reset(self):
+        self.journal.set_meta('planned', True)
+        self.journal.reset()
+        self.assertEqual(self.journal.pending(), [])
+        self.assertEqual(self.journal.counts(), {})
+        self.assertIsNone(self.journal.get_meta('planned'))
+
+    def test_planned_action(self):
+        self.journal.add('local/d', '/remote', 10, folder_id = '1AbC', action = 'update', remote_id = '2DeF')
+        row = self.journal.pending('smallest')[0]
+        self.assertEqual((row['folder_id'], row['action'], row['remote_id']), ('1AbC', 'update', '2DeF'))
+        self.assertIsNone(self.journal.pending('fifo')[0]['folder_id'])
+
+    def test_old_journal(self):
+        # a journal written before the planned actions were kept
+        path = os.path.join(self.tmpdir, 'old.journal')
+        db = sqlite3.connect(path)
+        db.execute("""CREATE TABLE transfers (id INTEGER PRIMARY KEY, local TEXT NOT NULL,
+            remote TEXT NOT NULL, size INTEGER NOT NULL DEFAULT 0, mtime REAL,
+            state TEXT NOT NULL DEFAULT 'pending', error TEXT, UNIQUE (local, remote))""")
+        db.execute("INSERT INTO transfers (local, remote, size) VALUES ('local/a', '/remote', 1)")
+        db.commit()
+        db.close()
+        journal = TransferJournal(path)
+        try:
+            row = journal.pending()[0]
+            self.assertEqual(row['local'], 'local/a')
+            self.assertIsNone(row['action'])
+        finally:
+            journal.close()
+
+    def test_no_path(self):
+        with self.assertRaises(Exception):
+            TransferJournal('')
+
+if __name__ == '__main__':
+    unittest.main()
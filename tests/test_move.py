@@ -0,0 +1,69 @@
+"""Tests of the parent-aware moves: moveToFolderById(), move_many() and move_tree()"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _fakedrive import FakeDriveTest
+
+class MoveTest(FakeDriveTest):
+
+    def setUp(self):
+        super().setUp()
+        self.src  = self.folder('src')
+        self.dest = self.folder('dest')
+        self.ids  = self.drive.add_many([f'f{i:03}' for i in range(120)], self.src, size = 1)
+
+    def parents(self, fileId):
+        return self.drive.files[fileId]['parents']
+
+    def test_move_by_id(self):
+        _, requests = self.counted(self.api.moveToFolderById, self.ids[0], self.dest)
+        self.assertEqual(self.parents(self.ids[0]), [self.dest])
+        # the parents and the type of the destination in a single batch, then the move
+        self.assertEqual(requests, 2)
+        # with both known, a single request
+        _, requests = self.counted(self.api.moveToFolderById, self.ids[1], self.dest,
+            parents = [self.src], check_folder = False)
+        self.assertEqual(requests, 1)
+        self.assertEqual(self.parents(self.ids[1]), [self.dest])
+
+    def test_move_by_id_not_a_folder(self):
+        with self.assertRaises(Exception):
+            self.api.moveToFolderById(self.ids[0], self.ids[1])
+        self.assertEqual(self.parents(self.ids[0]), [self.src])
+
+    def test_move_many(self):
+        moved, requests = self.counted(self.api.move_many, self.ids, self.dest)
+        self.assertEqual(moved, 120)
+        self.assertTrue(all(self.parents(i) == [self.dest] for i in self.ids))
+        self.assertLessEqual(requests, 5)
+        # the parents are known: the destination check and a batch of moves
+        moved, requests = self.counted(self.api.move_many, self.ids[:10], self.src,
+            parents = {i: [self.dest] for i in self.ids[:10]})
+        self.assertEqual((moved, requests), (10, 2))
+        self.assertEqual(self.parents(self.ids[0]), [self.src])
+
+    def test_move_many_already_there(self):
+        moved = self.api.move_many(self.ids[:3], self.src)
+        self.assertEqual(moved, 0)
+        self.assertEqual(self.parents(self.ids[0]), [self.src])
+
+    def test_move_tree(self):
+        sub = self.folder('sub', self.src)
+        inner = self.drive.add('inner.txt', sub, content = b'x')
+        moved, requests = self.counted(self.api.move_tree, '/src', '/dest')
+        self.assertEqual(moved, 121)
+        self.assertEqual(self.parents(sub), [self.dest])
+        # the folders are moved whole
+        self.assertEqual(self.parents(inner), [sub])
+        self.assertEqual(self.api.list_directory('/src'), [])
+        self.assertLessEqual(requests, 8)
+
+    def test_move_tree_missing(self):
+        with self.assertRaises(Exception):
+            self.api.move_tree('/nope', '/dest')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Tests of _records.py: DriveFile, and the records returned by the listings"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _fakedrive import FakeDriveTest, FOLDER
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'py'))
+from _records import DriveFile, parse_time, list_fields
+
+class DriveFileTest(unittest.TestCase):
+
+    def test_dict_interface(self):
+        f = DriveFile({'id': '1', 'name': 'a.txt', 'size': '10', 'starred': True})
+        self.assertEqual(f['id'], '1')
+        self.assertEqual(f.get('size'), '10')
+        self.assertEqual(f['starred'], True)
+        self.assertIn('name', f)
+        self.assertNotIn('md5Checksum', f)
+        self.assertIsNone(f.get('md5Checksum'))
+        self.assertEqual(f.get('md5Checksum', ''), '')
+        with self.assertRaises(KeyError):
+            f['parents']
+        self.assertEqual(f, {'id': '1', 'name': 'a.txt', 'size': '10', 'starred': True})
+        self.assertEqual(dict(f.items()), f.to_dict())
+        self.assertEqual(sorted(f.keys()), ['id', 'name', 'size', 'starred'])
+
+    def test_no_instance_dict(self):
+        f = DriveFile({'id': '1'})
+        with self.assertRaises(AttributeError):
+            f.__dict__
+
+    def test_properties(self):
+        f = DriveFile({'size': '42', 'mimeType': FOLDER, 'modifiedTime': '1970-01-01T00:01:00.500Z'})
+        self.assertEqual(f.bytes, 42)
+        self.assertTrue(f.is_folder)
+        self.assertEqual(f.mtime, 60.5)
+        # the cached mtime follows the changes of modifiedTime
+        f['modifiedTime'] = '1970-01-01T00:02:00Z'
+        self.assertEqual(f.mtime, 120)
+        self.assertIsNone(DriveFile().bytes)
+        self.assertIsNone(DriveFile().mtime)
+        self.assertFalse(DriveFile({'mimeType': 'text/plain'}).is_folder)
+
+    def test_helpers(self):
+        self.assertIsNone(parse_time(''))
+        self.assertEqual(list_fields(['id', 'name']), 'nextPageToken, files(id,name)')
+
+class ListingRecordsTest(FakeDriveTest):
+
+    def test_list_all_files(self):
+        folder = self.folder('f')
+        self.drive.add('a.txt', folder, content = b'abc')
+        files = self.api.list_all_files(query = f"'{folder}' in parents", attr = ['name', 'size', 'md5Checksum'])
+        self.assertEqual(len(files), 1)
+        self.assertIsInstance(files[0], DriveFile)
+        self.assertEqual((files[0]['name'], files[0].bytes), ('a.txt', 3))
+        self.assertEqual(files[0]['md5Checksum'], '900150983cd24fb0d6963f7d28e17f72')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""Tests of GoogleDriveAPI.resolve_many()"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _fakedrive import FakeDriveTest
+
+class ResolveManyTest(FakeDriveTest):
+
+    def setUp(self):
+        super().setUp()
+        # a file named like the folder 'a', created later: the folder is chosen in the paths
+        self.a   = self.folder('a')
+        self.b   = self.folder('b', self.a)
+        self.c   = self.folder('c', self.a)
+        self.foo = self.drive.add('foo.txt', self.b, content = b'foo')
+        self.bar = self.drive.add('bar.txt', self.b, content = b'bar!')
+        self.drive.add('a', 'root', content = b'not a folder')
+
+    def test_paths(self):
+        result, requests = self.counted(self.api.resolve_many,
+            ['a/b/foo.txt', 'a/b/bar.txt', 'a/c', 'a/missing', 'x/y'])
+        self.assertEqual(result, {'a/b/foo.txt': self.foo, 'a/b/bar.txt': self.bar,
+            'a/c': self.c, 'a/missing': '', 'x/y': ''})
+        # one query per level, the names of a folder grouped together
+        self.assertEqual(requests, 3)
+
+    def test_same_as_getFileId(self):
+        paths = ['a/b/foo.txt', 'a/b', '/a/c', 'a/nope', 'a/b/foo.txt/x']
+        result = self.api.resolve_many(paths)
+        for path in paths:
+            self.assertEqual(result[path], self.api.getFileId(path), path)
+
+    def test_attr(self):
+        result = self.api.resolve_many(['a/b/bar.txt', 'a/nope'], attr = ['size'])
+        self.assertEqual(result['a/b/bar.txt']['id'], self.bar)
+        self.assertEqual(result['a/b/bar.txt']['size'], '4')
+        self.assertEqual(result['a/nope'], {})
+
+    def test_many_names(self):
+        # more names than MAX_NAMES_PER_QUERY in the same folder: split in several queries
+        names = [f'f{i:03}' for i in range(120)]
+        ids = self.drive.add_many(names, self.b, size = 1)
+        result, requests = self.counted(self.api.resolve_many, ['a/b/' + n for n in names])
+        self.assertEqual([result['a/b/' + n] for n in names], ids)
+        self.assertLessEqual(requests, 5)
+
+    def test_empty(self):
+        self.assertEqual(self.counted(self.api.resolve_many, []), ({}, 0))
+
+if __name__ == '__main__':
+    unittest.main()
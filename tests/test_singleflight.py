@@ -0,0 +1,87 @@
+"""Tests of _singleflight.py"""
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'py'))
+from _singleflight import SingleFlight
+
+def wait_for(condition, timeout = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timeout")
+        time.sleep(0.005)
+
+class SingleFlightTest(unittest.TestCase):
+
+    def run_concurrently(self, flight, key, fn, n):
+        """Call flight.do(key, fn) in n threads, the first one being the leader"""
+        results = [None] * n
+        def worker(i):
+            try:
+                results[i] = flight.do(key, fn)
+            except Exception as e:
+                results[i] = e
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+        threads[0].start()
+        wait_for(lambda: flight.calls == 1)
+        for t in threads[1:]:
+            t.start()
+        wait_for(lambda: flight.coalesced == n - 1)
+        return threads, results
+
+    def test_coalesced(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        made = []
+        def fn():
+            made.append(1)
+            release.wait()
+            return ['result']
+        threads, results = self.run_concurrently(flight, ('list', 'q'), fn, 5)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(made), 1)
+        self.assertEqual(results, [['result']] * 5)
+        self.assertEqual(flight.stats(), {'calls': 1, 'coalesced': 4})
+
+    def test_error_shared(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        def fn():
+            release.wait()
+            raise ValueError("boom")
+        threads, results = self.run_concurrently(flight, 'key', fn, 3)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        # the failed call is forgotten: the next one is made again
+        self.assertEqual(flight.do('key', lambda: 42), 42)
+        self.assertEqual(flight.stats(), {'calls': 2, 'coalesced': 2})
+
+    def test_not_cached(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+        self.assertEqual(flight.do('key', lambda: 2), 2)
+        self.assertEqual(flight.stats(), {'calls': 2, 'coalesced': 0})
+
+    def test_different_keys(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        t = threading.Thread(target=flight.do, args=('a', release.wait))
+        t.start()
+        wait_for(lambda: flight.calls == 1)
+        # not blocked by the call in flight with another key
+        self.assertEqual(flight.do('b', lambda: 'b'), 'b')
+        release.set()
+        t.join()
+        self.assertEqual(flight.stats(), {'calls': 2, 'coalesced': 0})
+
+if __name__ == '__main__':
+    unittest.main()
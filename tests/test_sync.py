@@ -0,0 +1,97 @@
+"""Tests of GoogleDriveAPI.sync() and resume() against bench/fake_drive.py"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _fakedrive import FakeDriveTest
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'py'))
+from _journal import TransferJournal
+
+class SyncTest(FakeDriveTest):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.local = os.path.join(self.tmpdir, 'local')
+        os.makedirs(self.local)
+        self.journal = os.path.join(self.tmpdir, 'sync.journal')
+        for i in range(20):
+            self.write(f'f{i:02}', 'x' * i)
+
+    def write(self, name, content):
+        with open(os.path.join(self.local, name), 'w') as f:
+            f.write(content)
+
+    def remote(self, name):
+        files = self.named(name)
+        self.assertEqual(len(files), 1, name)
+        return files[0]
+
+    def test_folder_preferred(self):
+        # an older file named like the target folder does not hide it
+        self.drive.add('backup', content = b'older file')
+        self.api.sync(self.local, '/backup')
+        actions = []
+        _, requests = self.counted(self.api.sync, self.local, '/backup', on_action = actions.append)
+        self.assertEqual(actions, [])
+        self.assertEqual(len(self.named('backup')), 2)
+        self.assertEqual(len(self.named('f05')), 1)
+        self.assertLessEqual(requests, 2)
+
+    def test_journal_no_lookups(self):
+        # the transfers planned in the journal cost the same requests as a plain sync
+        _, plain = self.counted(self.api.sync, self.local, '/a/b/c/d')
+        _, journaled = self.counted(self.api.sync, self.local, '/e/b/c/d', journal_file = self.journal, jobs = 4)
+        self.assertEqual(journaled, plain)
+        self.assertEqual(len(self.named('f05')), 2)
+
+    def test_journal_update(self):
+        self.api.sync(self.local, '/a/b', journal_file = self.journal)
+        self.write('f03', 'changed!')
+        os.utime(os.path.join(self.local, 'f03'), (2e9, 2e9))
+        actions = []
+        self.api.sync(self.local, '/a/b', journal_file = self.journal, on_action = actions.append)
+        self.assertEqual([(a['action'], a['path']) for a in actions if a['action'] != 'plan'],
+            [('update', '/a/b/f03')])
+        self.assertEqual(self.remote('f03')['size'], '8')
+        self.assertEqual(TransferJournal(self.journal).counts(), {'done': 1})
+
+    def test_journal_unchanged_snapshot(self):
+        snapshot = os.path.join(self.tmpdir, 'snapshot.json')
+        self.api.sync(self.local, '/a', snapshot_file = snapshot, journal_file = self.journal)
+        # nothing changed: the journal is planned (and empty), so resume() has nothing to do
+        _, requests = self.counted(self.api.sync, self.local, '/a', snapshot_file = snapshot,
+            journal_file = self.journal)
+        self.assertEqual(requests, 0)
+        journal = TransferJournal(self.journal)
+        self.assertTrue(journal.get_meta('planned'))
+        self.assertEqual(journal.get_meta('args')['remote_path'], '/a')
+        journal.close()
+        self.assertEqual(self.api.resume(self.journal), {})
+
+    def test_resume_interrupted(self):
+        # planned, but interrupted: f00 was uploaded, but still 'running' in the journal
+        journal = TransferJournal(self.journal)
+        journal.set_meta('args', {'local_path': self.local, 'remote_path': '/a', 'regex': '',
+            'max_recursion_level': 10, 'dedup': False, 'order': 'fifo'})
+        journal.set_meta('planned', True)
+        folder = self.folder('a')
+        self.drive.add('f00', folder, content = b'')
+        for i in range(20):
+            local = os.path.join(self.local, f'f{i:02}')
+            journal.add(local, '/a', os.path.getsize(local), os.path.getmtime(local),
+                folder_id = folder, action = 'create')
+        journal.mark(journal.pending('fifo')[0]['id'], 'running')
+        journal.close()
+        self.assertEqual(self.api.resume(self.journal), {'done': 20})
+        # the interrupted one was looked up again: not uploaded twice
+        self.assertEqual(len(self.named('f00')), 1)
+        self.assertEqual(len(self.named('f19')), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Tests of GoogleDriveAPI.watch() (Linux only, uses inotify)"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _fakedrive import FakeDriveTest
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "inotify is only available on Linux")
+class WatchTest(FakeDriveTest):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def start_watch(self, **kwargs):
+        stop = threading.Event()
+        t = threading.Thread(target=self.api.watch, args=(self.tmpdir, '/watched'),
+            kwargs=dict(stop_event=stop, full_sync_interval=0, **kwargs))
+        t.start()
+        def finish():
+            stop.set()
+            t.join()
+        self.addCleanup(finish)
+        # the first full sync creates the remote folder
+        self.wait_for(lambda: self.named('watched'))
+
+    def wait_for(self, condition, timeout = 5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.02)
+        return True
+
+    def test_new_file(self):
+        self.start_watch(debounce = 0.1)
+        with open(os.path.join(self.tmpdir, 'a.txt'), 'w') as f:
+            f.write('hello')
+        self.assertTrue(self.wait_for(lambda: self.named('a.txt')))
+        self.assertEqual(self.named('a.txt')[0]['size'], '5')
+
+    def test_new_directory(self):
+        self.start_watch(debounce = 0.1)
+        os.makedirs(os.path.join(self.tmpdir, 'sub', 'deep'))
+        with open(os.path.join(self.tmpdir, 'sub', 'deep', 'n.txt'), 'w') as f:
+            f.write('n')
+        self.assertTrue(self.wait_for(lambda: self.named('n.txt')))
+        self.assertEqual(len(self.named('deep')), 1)
+
+    def test_burst_uploaded_once(self):
+        self.start_watch(debounce = 0.3)
+        with open(os.path.join(self.tmpdir, 'log.txt'), 'w') as f:
+            for _ in range(20):
+                f.write('x')
+                f.flush()
+                time.sleep(0.005)
+        self.assertTrue(self.wait_for(lambda: self.named('log.txt')))
+        time.sleep(0.5)
+        self.assertEqual([f['size'] for f in self.named('log.txt')], ['20'])
+
+    def test_max_delay(self):
+        # a file appended more often than debounce is uploaded anyway after max_delay
+        self.start_watch(debounce = 0.3, max_delay = 0.6)
+        uploaded = None
+        start = time.monotonic()
+        with open(os.path.join(self.tmpdir, 'active.log'), 'w') as f:
+            while time.monotonic() - start < 3.0:
+                f.write('x')
+                f.flush()
+                time.sleep(0.05)
+                if uploaded is None and self.named('active.log'):
+                    uploaded = time.monotonic() - start
+        self.assertIsNotNone(uploaded, "never uploaded while it kept changing")
+        self.assertLess(uploaded, 2.0)
+
+if __name__ == '__main__':
+    unittest.main()